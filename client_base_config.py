@@ -70,6 +70,12 @@ SITE_HANDLE = "bikeparking"  # This is used in aggregation and filenames
 DATA_FOLDER = "../data"  # Folder to keep datafiles in
 # (DATA_BASENAME is set following import of local config, below)
 
+# If True, each change is appended to a journal file next to the datafile
+# rather than rewriting the whole datafile.  The datafile itself is
+# rewritten (and the journal emptied) this often, and on exit.
+DATAFILE_JOURNAL = True
+JOURNAL_COMPACT_FREQUENCY = 10  # minutes
+
 # Where and how often to publish reports
 REPORTS_FOLDER = "../reports"
 PUBLISH_FREQUENCY = 15  # minutes. "0" means do not publish
@@ -82,6 +88,8 @@ ECHO = False
 # E.g. "http://example.com/cgi-bin/estimator"
 # "" disables estimations
 ESTIMATOR_URL_BASE = ""
+# Seconds to wait for the estimator to answer
+ESTIMATOR_TIMEOUT = 10
 
 # Maximum length for Notes
 MAX_NOTE_LENGTH = 80
@@ -67,22 +67,37 @@ class BikeTag:
         self.bike_type = bike_type
         if self.bike_type not in (REGULAR, OVERSIZE, UNKNOWN):
             raise BikeTagError(f"Unknown bike type '{bike_type}' for {tagid}")
+        # The owning TrackerDay's EventIndex, if it has built one
+        self.event_index = None
         # BikeTag.all_biketags[tagid] = self
 
     # Lower-level methods
 
+    def _index_add(self, visit: BikeVisit):
+        """Tell the day's event index (if any) about a new or changed visit."""
+        if self.event_index is not None:
+            self.event_index.add_visit(self.bike_type, visit)
+
+    def _index_remove(self, visit: BikeVisit):
+        """Tell the day's event index (if any) a visit is about to change or go."""
+        if self.event_index is not None:
+            self.event_index.remove_visit(self.bike_type, visit)
+
     def start_visit(self, time: VTime):
         """Initiate a visit.  Presumes error constraints already checked."""
         visit = BikeVisit(self.tagid, time)
         self.visits.append(visit)
         self.status = self.IN_USE
+        self._index_add(visit)
 
     def finish_visit(self, time: VTime):
         """Finish a visit.  Presumes error constraints already checked."""
         if self.visits:
             latest_visit = self.latest_visit()
+            self._index_remove(latest_visit)
             latest_visit.time_out = time
             self.status = self.DONE
+            self._index_add(latest_visit)
 
     def latest_visit(self) -> BikeVisit:
         """Return latest of the biketag's visit, if any."""
@@ -182,7 +197,10 @@ class BikeTag:
             raise BikeTagError(error)
 
         # Change the time in.
-        self.latest_visit().time_in = bike_time
+        visit = self.latest_visit()
+        self._index_remove(visit)
+        visit.time_in = bike_time
+        self._index_add(visit)
 
     def check_out(self, time: VTime):
         """Higher-level check-out call."""
@@ -198,7 +216,9 @@ class BikeTag:
                     f"Tag {self.tagid}: Checkout time {time} must be "
                     f"later than check-in time ({v.time_in})."
                 )
+            self._index_remove(v)
             v.time_out = time
+            self._index_add(v)
         elif self.status == self.IN_USE:
             v = self.latest_visit()
             if v.time_in >= time:
@@ -214,6 +234,7 @@ class BikeTag:
         """A higher-level function that will delete a check-in."""
         if self.status == self.IN_USE:
             if self.visits:
+                self._index_remove(self.visits[-1])
                 self.visits.pop()
                 self.status = self.DONE if self.visits else self.UNUSED
             else:
@@ -226,8 +247,10 @@ class BikeTag:
 
         if self.status == self.DONE:
             v = self.latest_visit()
+            self._index_remove(v)
             v.time_out = None
             self.status = self.IN_USE
+            self._index_add(v)
         else:
             raise BikeTagError("Invalid state for delete_out")
 
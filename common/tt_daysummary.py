@@ -24,13 +24,17 @@ Copyright (C) 2023-2024 Todd Glover & Julias Hocking
 
 from dataclasses import dataclass, field
 from collections import defaultdict
-from common.tt_trackerday import TrackerDay
+from typing import TYPE_CHECKING
 from common.tt_time import VTime
 import common.tt_constants as k
 from common.tt_util import block_start
 # from common.tt_biketag import BikeTag
 # from common.tt_bikevisit import BikeVisit
 
+if TYPE_CHECKING:
+    # Only for annotations; the web reports use this module without TrackerDay
+    from common.tt_trackerday import TrackerDay
+
 
 @dataclass
 class MomentDetail:
@@ -46,8 +50,18 @@ class MomentDetail:
     num_on_hand: dict = field(
         default_factory=lambda: {k.REGULAR: 0, k.OVERSIZE: 0, k.COMBINED: 0}
     )
-    tag_descriptions_incoming: dict = field(default_factory=lambda: [])
-    tag_descriptions_outgoing: dict = field(default_factory=lambda: [])
+    # (tagid, visit number) of the visits starting/ending at this moment
+    incoming_visits: list = field(default_factory=lambda: [])
+    outgoing_visits: list = field(default_factory=lambda: [])
+
+    # Descriptions ("tagid:visitnum") are only made when a report wants them
+    @property
+    def tag_descriptions_incoming(self) -> list[str]:
+        return [f"{tagid}:{visit_num}" for tagid, visit_num in self.incoming_visits]
+
+    @property
+    def tag_descriptions_outgoing(self) -> list[str]:
+        return [f"{tagid}:{visit_num}" for tagid, visit_num in self.outgoing_visits]
 
 
 @dataclass
@@ -120,7 +134,7 @@ class DayTotals:
 class DaySummary:
     """Complex class for whole-day summary of events and blocks (for reporting)."""
 
-    def __init__(self, day: TrackerDay, as_of_when: str = ""):
+    def __init__(self, day: "TrackerDay", as_of_when: str = ""):
         self.date = day.date
 
         # If no time given, set to latest event of the day
@@ -196,41 +210,30 @@ class DaySummary:
 
     @staticmethod
     def _summarize_moments(
-        day: TrackerDay, as_of_when: VTime
+        day: "TrackerDay", as_of_when: VTime
     ) -> dict[str, MomentDetail]:
-        """Create a dict of moments keyed by HH:MM time."""
+        """Create a dict of moments keyed by HH:MM time.
+
+        This only counts each moment's ins & outs; the combined counts and
+        the numbers on hand are filled in by _summarize_blocks.
+        """
         moments = defaultdict(lambda: MomentDetail(time=None))
 
         for biketag in day.biketags.values():
+            bike_type = biketag.bike_type
             for visit_num, visit in enumerate(biketag.visits, start=1):
-                if visit.time_in <= as_of_when:
-                    bike_type = day.biketags[visit.tagid].bike_type
-                    moments[visit.time_in].time = visit.time_in
-                    moments[visit.time_in].num_incoming[bike_type] += 1
-                    moments[visit.time_in].tag_descriptions_incoming.append(
-                        f"{visit.tagid}:{visit_num}"
-                    )
-                if visit.time_out and visit.time_out <= as_of_when:
-                    moments[visit.time_out].time = visit.time_out
-                    moments[visit.time_out].num_outgoing[bike_type] += 1
-                    moments[visit.time_out].tag_descriptions_outgoing.append(
-                        f"{visit.tagid}:{visit_num}"
-                    )
-
-        here = {k.REGULAR: 0, k.OVERSIZE: 0, k.COMBINED: 0}
-        for moment_time in sorted(moments):
-            moment = moments[moment_time]
-            moment.num_incoming[k.COMBINED] = (
-                moment.num_incoming[k.REGULAR] + moment.num_incoming[k.OVERSIZE]
-            )
-            moment.num_outgoing[k.COMBINED] = (
-                moment.num_outgoing[k.REGULAR] + moment.num_outgoing[k.OVERSIZE]
-            )
-            for bike_type in [k.REGULAR, k.OVERSIZE, k.COMBINED]:
-                here[bike_type] += (
-                    moment.num_incoming[bike_type] - moment.num_outgoing[bike_type]
-                )
-                moment.num_on_hand[bike_type] = here[bike_type]
+                time_in = visit.time_in
+                if time_in <= as_of_when:
+                    moment = moments[time_in]
+                    moment.time = time_in
+                    moment.num_incoming[bike_type] += 1
+                    moment.incoming_visits.append((visit.tagid, visit_num))
+                time_out = visit.time_out
+                if time_out and time_out <= as_of_when:
+                    moment = moments[time_out]
+                    moment.time = time_out
+                    moment.num_outgoing[bike_type] += 1
+                    moment.outgoing_visits.append((visit.tagid, visit_num))
 
         return moments
 
@@ -238,69 +241,53 @@ class DaySummary:
     def _summarize_blocks(
         moments: dict[VTime, MomentDetail]
     ) -> dict[VTime, PeriodDetail]:
-        """Create a dictionary of PeriodDetail objects for this day."""
+        """Create a dictionary of PeriodDetail objects for this day.
+
+        Makes one pass through the moments in time order, finishing off
+        each moment's totals and adding it into the block that contains it.
+        """
         blocks = defaultdict(lambda: PeriodDetail(time_start=None))
 
         if not moments:
             return blocks
 
-        # Get sorted times from moments
-        earliest_time = min(moments.keys())
-        latest_time = max(moments.keys())
-
-        # Calculate start time for blocks
+        bike_types = (k.REGULAR, k.OVERSIZE, k.COMBINED)
+        moment_times = sorted(moments)
+        num_moments = len(moment_times)
+        latest_minute = moment_times[-1].num
+        here = {k.REGULAR: 0, k.OVERSIZE: 0, k.COMBINED: 0}  # running totals on hand
 
-        day_here = {
-            k.REGULAR: 0,
-            k.OVERSIZE: 0,
-            k.COMBINED: 0,
-        }  # running totals on hand
-        block_start_time = block_start(earliest_time)
-        while block_start_time.num <= latest_time.num:  # yes blocks need to be in order
-            block_end_time = VTime(block_start_time.num + k.BLOCK_DURATION - 1)
+        i = 0
+        block_start_time = block_start(moment_times[0])
+        while block_start_time.num <= latest_minute:  # yes blocks need to be in order
+            block_end_minute = block_start_time.num + k.BLOCK_DURATION - 1
             current_block = PeriodDetail(time_start=block_start_time)
-            block_ins = {
-                k.REGULAR: 0,
-                k.OVERSIZE: 0,
-                k.COMBINED: 0,
-            }  # running totals on hand
-            block_outs = {
-                k.REGULAR: 0,
-                k.OVERSIZE: 0,
-                k.COMBINED: 0,
-            }  # running totals on hand
-
-            for moment_time in sorted(moments):  # yes moments need to be in order
+
+            # Use minute-based comparisons so HH:MM:SS timestamps
+            # are still counted inside their containing block.
+            while i < num_moments and moment_times[i].num <= block_end_minute:
+                moment_time = moment_times[i]
+                i += 1
                 moment: MomentDetail = moments[moment_time]
-                moment_minute = (
-                    moment_time.num
-                    if hasattr(moment_time, "num")
-                    else VTime(moment_time).num
-                )
-                if block_start_time.num <= moment_minute <= block_end_time.num:
-                    # Use minute-based comparisons so HH:MM:SS timestamps
-                    # are still counted inside their containing block.
-                    for bike_type in [k.REGULAR, k.OVERSIZE, k.COMBINED]:
-                        block_ins[bike_type] += moment.num_incoming[bike_type]
-                        block_outs[bike_type] += moment.num_outgoing[bike_type]
-                        day_here[bike_type] += (
-                            moment.num_incoming[bike_type]
-                            - moment.num_outgoing[bike_type]
-                        )
-                        if day_here[bike_type] > current_block.num_fullest[bike_type]:
-                            current_block.num_fullest[bike_type] = day_here[bike_type]
-                            current_block.time_fullest[bike_type] = moment_time
-
-            # Have looked at all the moments, now finish off the block
-            for bike_type in [k.REGULAR, k.OVERSIZE, k.COMBINED]:
-                current_block.num_incoming[bike_type] = block_ins[bike_type]
-                current_block.num_outgoing[bike_type] = block_outs[bike_type]
-                current_block.num_on_hand[bike_type] = day_here[bike_type]
+                incoming = moment.num_incoming
+                outgoing = moment.num_outgoing
+                incoming[k.COMBINED] = incoming[k.REGULAR] + incoming[k.OVERSIZE]
+                outgoing[k.COMBINED] = outgoing[k.REGULAR] + outgoing[k.OVERSIZE]
+                for bike_type in bike_types:
+                    current_block.num_incoming[bike_type] += incoming[bike_type]
+                    current_block.num_outgoing[bike_type] += outgoing[bike_type]
+                    here[bike_type] += incoming[bike_type] - outgoing[bike_type]
+                    moment.num_on_hand[bike_type] = here[bike_type]
+                    if here[bike_type] > current_block.num_fullest[bike_type]:
+                        current_block.num_fullest[bike_type] = here[bike_type]
+                        current_block.time_fullest[bike_type] = moment_time
+
+            # Have looked at all the block's moments, now finish off the block
+            for bike_type in bike_types:
+                current_block.num_on_hand[bike_type] = here[bike_type]
                 # Check fullest in case there was no activity
                 if not current_block.time_fullest[bike_type]:
-                    current_block.num_fullest[bike_type] = current_block.num_on_hand[
-                        bike_type
-                    ]
+                    current_block.num_fullest[bike_type] = here[bike_type]
                     current_block.time_fullest[bike_type] = block_start_time
 
             blocks[block_start_time] = current_block
@@ -309,7 +296,7 @@ class DaySummary:
         return blocks
 
     @staticmethod
-    def _summarize_whole_day(day:TrackerDay,blocks: dict[VTime, PeriodDetail]) -> DayTotals:
+    def _summarize_whole_day(day:"TrackerDay",blocks: dict[VTime, PeriodDetail]) -> DayTotals:
         """Summarize the whole day's blocks as one time period."""
 
         whole_day = DayTotals()
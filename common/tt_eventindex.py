@@ -0,0 +1,211 @@
+"""Sorted index of a day's check-in and check-out events.
+
+An EventIndex lets TrackerDay answer "as of time T" questions (bikes
+parked, bikes returned, tags in use, max bikes on hand) with a bisect
+instead of a scan over every BikeTag and visit.
+
+BikeTags that belong to an indexed day hold a reference to the index
+and tell it about each change to their visits (check in/out, edits,
+deletes), so it stays current as the day goes on.  Anything that changes
+visits behind the BikeTag methods' backs must call TrackerDay's
+invalidate_event_index() so that the index gets rebuilt on next use.
+
+All times are held as integer seconds since midnight.  A visit with a
+blank check-in is held at -1 (so it sorts first, as a blank VTime does);
+an unfinished visit has no check-out event.
+
+Copyright (C) 2023-2025 Julias Hocking & Todd Glover
+
+    Notwithstanding the licensing information below, this code may not
+    be used in a commercial (for-profit, non-profit or government) setting
+    without the copyright-holder's written consent.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+
+from common.tt_tag import TagID
+from common.tt_time import VTime
+from common.tt_bikevisit import BikeVisit
+
+# Sorts after any real time; the check-out of a visit not yet finished
+_OPEN = 1 << 30
+
+
+def _seconds(atime) -> int:
+    """Integer seconds for a visit time; -1 for a blank time."""
+    if not atime:
+        return -1
+    return atime.as_seconds
+
+
+class EventIndex:
+    """Sorted check-in/check-out events for one day, kept current by BikeTags."""
+
+    def __init__(self):
+        # Sorted check-in and check-out seconds, by bike type
+        self._ins: dict[str, list[int]] = defaultdict(list)
+        self._outs: dict[str, list[int]] = defaultdict(list)
+        # Sorted (in_seconds, tagid, out_seconds) for every visit
+        self._visits: list[tuple[int, TagID, int]] = []
+        # Set if a removal didn't match (the visits were changed directly)
+        self.stale = False
+        # Running occupancy, rebuilt on demand after any change
+        self._occupancy_ok = False
+        self._event_keys: list[tuple[int, bool]] = []
+        self._max_bikes: list[int] = []
+        self._max_time: list[VTime] = []
+        # Identity of the biketags dict this was built from
+        self._source = None
+        self._source_len = 0
+
+    @classmethod
+    def from_biketags(cls, biketags: dict) -> "EventIndex":
+        """Build an index from a TrackerDay's biketags, and attach it to them."""
+        index = cls()
+        index._source = biketags
+        index._source_len = len(biketags)
+        visits = []
+        for biketag in biketags.values():
+            biketag.event_index = index
+            bike_type = biketag.bike_type
+            for visit in biketag.visits:
+                time_in = _seconds(visit.time_in)
+                index._ins[bike_type].append(time_in)
+                if visit.time_out:
+                    time_out = _seconds(visit.time_out)
+                    index._outs[bike_type].append(time_out)
+                else:
+                    time_out = _OPEN
+                visits.append((time_in, visit.tagid, time_out))
+        for times in index._ins.values():
+            times.sort()
+        for times in index._outs.values():
+            times.sort()
+        visits.sort()
+        index._visits = visits
+        return index
+
+    def is_current_for(self, biketags: dict) -> bool:
+        """Check this index still describes this biketags dict."""
+        return (
+            not self.stale
+            and self._source is biketags
+            and self._source_len == len(biketags)
+        )
+
+    # Updates, called by BikeTag
+
+    def add_visit(self, bike_type: str, visit: BikeVisit):
+        """Add a visit's events to the index."""
+        time_in = _seconds(visit.time_in)
+        insort(self._ins[bike_type], time_in)
+        if visit.time_out:
+            time_out = _seconds(visit.time_out)
+            insort(self._outs[bike_type], time_out)
+        else:
+            time_out = _OPEN
+        insort(self._visits, (time_in, visit.tagid, time_out))
+        self._occupancy_ok = False
+
+    def remove_visit(self, bike_type: str, visit: BikeVisit):
+        """Remove a visit's events (as they are now) from the index."""
+        time_in = _seconds(visit.time_in)
+        time_out = _seconds(visit.time_out) if visit.time_out else _OPEN
+        if not (
+            self._discard(self._ins[bike_type], time_in)
+            and (
+                time_out == _OPEN or self._discard(self._outs[bike_type], time_out)
+            )
+            and self._discard(self._visits, (time_in, visit.tagid, time_out))
+        ):
+            self.stale = True
+        self._occupancy_ok = False
+
+    @staticmethod
+    def _discard(sorted_list: list, item) -> bool:
+        """Remove one item from a sorted list; False if it wasn't there."""
+        i = bisect_left(sorted_list, item)
+        if i < len(sorted_list) and sorted_list[i] == item:
+            del sorted_list[i]
+            return True
+        return False
+
+    # Queries.  as_of is seconds since midnight (-1 for a blank time).
+
+    def num_in(self, as_of: int, bike_type: str) -> int:
+        """Number of check-ins at or before as_of."""
+        return bisect_right(self._ins.get(bike_type, []), as_of)
+
+    def num_out(self, as_of: int, bike_type: str) -> int:
+        """Number of check-outs strictly before as_of."""
+        return bisect_left(self._outs.get(bike_type, []), as_of)
+
+    def bike_types(self) -> list[str]:
+        """Bike types that have any events."""
+        return list(set(self._ins) | set(self._outs))
+
+    def tags_started_and_in_use(self, as_of: int) -> tuple[set, set]:
+        """Tagids with a visit started by as_of, and those with one ongoing at as_of."""
+        started = set()
+        in_use = set()
+        # (as_of + 1,) sorts after every visit that starts at or before as_of
+        for _, tagid, time_out in self._visits[
+            : bisect_left(self._visits, (as_of + 1,))
+        ]:
+            started.add(tagid)
+            if as_of < time_out:
+                in_use.add(tagid)
+        return started, in_use
+
+    def max_bikes_up_to(self, as_of: int) -> tuple[int, VTime | str]:
+        """Most bikes on hand at any time up to as_of, and when that was."""
+        if not self._occupancy_ok:
+            self._rebuild_occupancy()
+        n = bisect_right(self._event_keys, (as_of, True))
+        if not n:
+            return 0, ""
+        return self._max_bikes[n - 1], self._max_time[n - 1]
+
+    def _rebuild_occupancy(self):
+        """Rebuild the running occupancy (and running max) over all events."""
+        events = [(time_in, False) for time_in, _, _ in self._visits]
+        events += [
+            (time_out, True) for _, _, time_out in self._visits if time_out != _OPEN
+        ]
+        # Check-ins sort before check-outs at the same time
+        events.sort()
+        max_bikes = []
+        max_time = []
+        current = 0
+        most = 0
+        most_time = ""
+        for seconds, is_out in events:
+            if is_out:
+                current -= 1
+            else:
+                current += 1
+                if current > most:
+                    most = current
+                    most_time = VTime.from_seconds(seconds) if seconds >= 0 else ""
+            max_bikes.append(most)
+            max_time.append(most_time)
+        self._event_keys = events
+        self._max_bikes = max_bikes
+        self._max_time = max_time
+        self._occupancy_ok = True
@@ -0,0 +1,239 @@
+"""TagTracker by Julias Hocking.
+
+Occupancy (bikes on hand) through a day, minute by minute.
+
+An OccupancyCurve is built once from a day's visits, after which the
+counts at a time, the occupancy at a time and the day's peaks are
+lookups rather than a pass over the visits.  Times can be given as
+minutes or as anything with a .num attribute of minutes (e.g. VTime);
+times that come back are minutes.
+
+A curve's cumulative counts can also be saved as bytes (to_blobs())
+and read back (from_blobs()) without the visits, which is how the
+DAY_CURVE table keeps them (see database/tt_day_curves.py).
+
+Uses numpy for the cumulative counts when it is installed.
+
+Copyright (C) 2023-2025 Todd Glover & Julias Hocking
+
+    Notwithstanding the licensing information below, this code may not
+    be used in a commercial (for-profit, non-profit or government) setting
+    without the copyright-holder's written consent.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import sys
+from array import array
+from itertools import accumulate
+from typing import Iterable, Optional
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+MINUTES_PER_DAY = 24 * 60
+# One slot per minute, 00:00 through 24:00 inclusive
+NUM_SLOTS = MINUTES_PER_DAY + 1
+
+
+def _minute(when) -> Optional[int]:
+    """Return when as minutes (capped at 24:00), or None if missing/invalid."""
+    if when is None:
+        return None
+    num = when if isinstance(when, int) else getattr(when, "num", None)
+    if num is None or num < 0:
+        return None
+    return min(int(num), MINUTES_PER_DAY)
+
+
+def _to_bytes(counts) -> bytes:
+    """Return per-minute counts as little-endian 16-bit ints."""
+    if np is not None:
+        return np.asarray(counts, dtype="<i2").tobytes()
+    values = array("h", counts)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(blob: bytes):
+    """Return per-minute counts from _to_bytes() output."""
+    if np is not None:
+        return np.frombuffer(blob, dtype="<i2").astype(np.int16)
+    values = array("h", blob)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tolist()
+
+
+class OccupancyCurve:
+    """Cumulative ins and outs for one day, for each minute of the day.
+
+    At the same minute, ins count before outs, so occupancy peaks are
+    measured after that minute's arrivals and before its departures.
+    """
+
+    def __init__(self, visits: Iterable[tuple[object, object]]):
+        """Build from (time_in, time_out) pairs; either can be None."""
+        ins = [0] * NUM_SLOTS
+        outs = [0] * NUM_SLOTS
+        first_event = None
+        for time_in, time_out in visits:
+            for when, counts in ((time_in, ins), (time_out, outs)):
+                minute = _minute(when)
+                if minute is None:
+                    continue
+                counts[minute] += 1
+                if first_event is None or minute < first_event:
+                    first_event = minute
+
+        if np is not None:
+            # A day never comes near 32767 visits
+            self._set_cumulative(
+                np.cumsum(ins, dtype=np.int16),
+                np.cumsum(outs, dtype=np.int16),
+                first_event,
+            )
+        else:
+            self._set_cumulative(
+                list(accumulate(ins)), list(accumulate(outs)), first_event
+            )
+
+    @classmethod
+    def from_blobs(
+        cls, first_event: Optional[int], ins_blob: bytes, outs_blob: bytes
+    ) -> "OccupancyCurve":
+        """Make a curve from the output of to_blobs()."""
+        curve = cls.__new__(cls)
+        curve._set_cumulative(
+            _from_bytes(ins_blob), _from_bytes(outs_blob), first_event
+        )
+        return curve
+
+    def to_blobs(self) -> tuple[Optional[int], bytes, bytes]:
+        """Return (first_event, cumulative ins, cumulative outs) for storing.
+
+        The cumulative counts are little-endian 16-bit ints, one per minute.
+        """
+        return (
+            self.first_event,
+            _to_bytes(self._ins_through),
+            _to_bytes(self._outs_through),
+        )
+
+    def _set_cumulative(self, ins_through, outs_through, first_event) -> None:
+        """Set up from cumulative counts of ins and outs at each minute."""
+        self.first_event: Optional[int] = first_event
+        self._ins_through = ins_through
+        self._outs_through = outs_through
+        if np is not None:
+            # Occupancy during each minute: its ins, less outs before it
+            self._levels = self._ins_through.copy()
+            self._levels[1:] -= self._outs_through[:-1]
+        else:
+            self._levels = [self._ins_through[0]] + [
+                i - o for i, o in zip(self._ins_through[1:], self._outs_through)
+            ]
+        self.total_ins = int(self._ins_through[-1])
+        # close minute -> (highest level from each minute to close, first minute of it)
+        self._peaks_to: dict[int, tuple] = {}
+
+    def ins_through(self, when) -> int:
+        """Return the number of bikes in at or before when."""
+        return int(self._ins_through[_minute(when)])
+
+    def outs_through(self, when) -> int:
+        """Return the number of bikes out at or before when."""
+        return int(self._outs_through[_minute(when)])
+
+    def occupancy_at(self, when) -> int:
+        """Return the bikes on hand at when (after that minute's ins and outs)."""
+        minute = _minute(when)
+        return int(self._ins_through[minute] - self._outs_through[minute])
+
+    def counts_at(self, when) -> tuple[int, int, int, int, int]:
+        """Return counts relative to when:
+
+        (ins so far, ins still to come, outs so far,
+         ins in the next hour, outs in the next hour)
+        """
+        minute = _minute(when)
+        hour_later = min(minute + 60, MINUTES_PER_DAY)
+        ins_so_far = int(self._ins_through[minute])
+        outs_so_far = int(self._outs_through[minute])
+        return (
+            ins_so_far,
+            self.total_ins - ins_so_far,
+            outs_so_far,
+            int(self._ins_through[hour_later]) - ins_so_far,
+            int(self._outs_through[hour_later]) - outs_so_far,
+        )
+
+    def _peaks_until(self, close: int) -> tuple:
+        """Return (best, best_at) for minutes up to close.
+
+        best[m] is the highest occupancy from minute m through close,
+        best_at[m] the first minute at which it is reached.
+        """
+        if close in self._peaks_to:
+            return self._peaks_to[close]
+        levels = self._levels[: close + 1]
+        if np is not None:
+            best = np.maximum.accumulate(levels[::-1])[::-1]
+            # First minute at or after m that reaches that highest level
+            minutes = np.arange(close + 1)
+            reached = np.where(levels == best, minutes, close + 1)
+            best_at = np.minimum.accumulate(reached[::-1])[::-1]
+        else:
+            best = [0] * (close + 1)
+            best_at = [0] * (close + 1)
+            high, high_at = levels[close], close
+            for minute in range(close, -1, -1):
+                if levels[minute] >= high:
+                    high, high_at = levels[minute], minute
+                best[minute] = high
+                best_at[minute] = high_at
+        self._peaks_to[close] = (best, best_at)
+        return best, best_at
+
+    def peak_after(self, when, close) -> tuple[int, int]:
+        """Return (max occupancy, minute) from when through close.
+
+        If occupancy does not rise above its level at when, that is the
+        peak and when is its time.
+        """
+        start = _minute(when)
+        end = _minute(close)
+        peak, peak_at = self.occupancy_at(start), start
+        if end is None or start >= end:
+            return peak, peak_at
+        best, best_at = self._peaks_until(end)
+        if best[start + 1] > peak:
+            peak, peak_at = int(best[start + 1]), int(best_at[start + 1])
+        return peak, peak_at
+
+    def peak(self) -> tuple[int, int]:
+        """Return (max occupancy, minute) over the whole day.
+
+        A day with no rise above zero peaks at 0, at its first event
+        (or at 00:00 if it has no events).
+        """
+        if self.first_event is None:
+            return 0, 0
+        best, best_at = self._peaks_until(MINUTES_PER_DAY)
+        if best[0] <= 0:
+            return 0, self.first_event
+        return int(best[0]), int(best_at[0])
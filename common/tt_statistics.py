@@ -63,6 +63,13 @@ def calculate_visit_modes(
     the modes and the number of times it/they occurred.
     """
     freq_list = _calculate_visit_frequencies(durations_list, category_width)
+    return _modes_from_frequencies(freq_list, category_width)
+
+
+def _modes_from_frequencies(
+    freq_list: collections.Counter, category_width: int
+) -> tuple[list[VTime], int]:
+    """Helper function: modes & their occurences from categorized frequencies."""
     mosts = freq_list.most_common()
     occurences = mosts[0][1]
     modes_numeric = sorted([element for element, count in mosts if count == occurences])
@@ -92,3 +99,44 @@ class VisitStats:
         self.median = VTime(median(visit_durations)).tidy
         self.shortest = VTime(min(visit_durations)).tidy
         self.longest = VTime(max(visit_durations)).tidy
+
+    @classmethod
+    def from_histogram(cls, histogram: dict[int, int]) -> "VisitStats":
+        """Make VisitStats from a histogram of visit durations {minutes: num_visits}.
+
+        Gives the same results as from the list of durations itself.
+        """
+        histogram = {d: n for d, n in histogram.items() if n}
+        stats = cls([])
+        if not histogram:
+            return stats
+        durations = sorted(histogram)
+        num_visits = sum(histogram.values())
+
+        categorized = collections.Counter()
+        for d in durations:
+            categorized[(d // BLOCK_DURATION) * BLOCK_DURATION] += histogram[d]
+        stats.modes, stats.mode_occurences = _modes_from_frequencies(
+            categorized, BLOCK_DURATION
+        )
+
+        # Median is the middle duration (or mean of the middle two)
+        lower_index = (num_visits - 1) // 2
+        upper_index = num_visits // 2
+        lower = upper = None
+        seen = 0
+        for d in durations:
+            seen += histogram[d]
+            if lower is None and seen > lower_index:
+                lower = d
+            if seen > upper_index:
+                upper = d
+                break
+        median_val = lower if lower == upper else (lower + upper) / 2
+
+        total = sum(d * n for d, n in histogram.items())
+        stats.mean = VTime(total / num_visits).tidy
+        stats.median = VTime(median_val).tidy
+        stats.shortest = VTime(durations[0]).tidy
+        stats.longest = VTime(durations[-1]).tidy
+        return stats
@@ -9,6 +9,7 @@ Attributes:
     short   shortened pretty version (e.g. "6:30" instead of "06:30")
     num     integer minutes since midnight
     original    string representation of whatever was passed in
+                (for the interned Int_VTime, the canonical HH:MM for valid times)
 
 Invocation:
     string as HMM, HHMM, HH:MM, H:MM; or
@@ -148,6 +149,11 @@ class HMS_VTime(str):
 
         return "", "", None
 
+    @classmethod
+    def from_seconds(cls, total_seconds: int) -> "HMS_VTime":
+        """Make a VTime from integer seconds since midnight."""
+        return cls(cls._seconds_to_strings(total_seconds)[1], allow_large=True)
+
     @staticmethod
     def _seconds_to_strings(total_seconds: int | None) -> tuple[str, str, int | None]:
         if total_seconds is None:
@@ -224,6 +230,276 @@ class HMS_VTime(str):
         return value if isinstance(value, HMS_VTime) else HMS_VTime(value)
 
 
+class Int_VTime(str):
+    """Variant of VTime backed by integer seconds, with interned instances.
+
+    Every valid time from 00:00:00 to 24:00:00 (86,401 of them) has at
+    most one instance, created on first use and shared from then on, so
+    VTime("13:45"), VTime("1345") and VTime(825) are the same object.
+    Raw inputs are also remembered, so repeat construction from the same
+    string or int is a single dict lookup.  Comparisons are between the
+    integer seconds.
+
+    Because instances are shared they are immutable, and 'original' is
+    the canonical HH:MM string rather than the caller's input -- except
+    for invalid non-blank input, which gets its own (blank) instance that
+    keeps the input as 'original' for error messages.
+
+    Times beyond 24:00 (allow_large) are not interned.
+    """
+
+    __slots__ = ("hms", "as_seconds", "as_minutes", "num", "tidy", "short", "original")
+
+    # Declared for the IDE; values live in the slots.  (No __init__, so
+    # construction is just __new__.)
+    hms: str
+    as_seconds: int | None
+    as_minutes: int | None
+    num: int | None
+    tidy: str
+    short: str
+    original: str
+
+    MAX_SECONDS = 86400
+
+    # Interned valid instances, indexed by seconds since midnight
+    _by_seconds: list = [None] * (MAX_SECONDS + 1)
+    # Raw input (str or int) -> instance, for inputs that parse the same every time
+    _by_input: dict = {}
+    _BY_INPUT_LIMIT = 250000
+    _blank = None
+
+    def __new__(cls, maybe_time: str = "", allow_large: bool = False):
+        if maybe_time.__class__ is cls:
+            return maybe_time
+        if not allow_large:
+            try:
+                return cls._by_input[maybe_time]
+            except KeyError:
+                pass
+            except TypeError:  # unhashable input, it will be a blank
+                return cls._make_blank(maybe_time)
+
+        total_seconds, cacheable = cls._parse_seconds(maybe_time, allow_large)
+        if total_seconds is None:
+            if maybe_time is None or (
+                isinstance(maybe_time, str) and not maybe_time.strip()
+            ):
+                this = cls._make_blank("")
+            else:
+                return cls._make_blank(maybe_time)
+        elif total_seconds > cls.MAX_SECONDS:
+            return cls._make(total_seconds)
+        else:
+            this = cls._by_seconds[total_seconds] or cls._intern(total_seconds)
+
+        if cacheable and not allow_large:
+            if len(cls._by_input) >= cls._BY_INPUT_LIMIT:
+                cls._by_input.clear()
+            cls._by_input[maybe_time] = this
+        return this
+
+    @classmethod
+    def _make(cls, total_seconds: int | None, original: str = None) -> "Int_VTime":
+        """Build a new (not interned) instance."""
+        if total_seconds is None:
+            time_str = full_str = ""
+            minutes = None
+        else:
+            hours, remainder = divmod(total_seconds, 3600)
+            minutes_part, seconds_part = divmod(remainder, 60)
+            time_str = f"{hours:02}:{minutes_part:02}"
+            full_str = f"{time_str}:{seconds_part:02}"
+            minutes = total_seconds // 60
+        this = str.__new__(cls, time_str)
+        setter = object.__setattr__
+        setter(this, "hms", full_str)
+        setter(this, "as_seconds", total_seconds)
+        setter(this, "as_minutes", minutes)
+        setter(this, "num", minutes)  # Backwards compat alias
+        setter(
+            this,
+            "tidy",
+            time_str.replace("0", " ", 1) if time_str.startswith("0") else time_str,
+        )
+        setter(this, "short", time_str[1:] if time_str.startswith("0") else time_str)
+        setter(this, "original", time_str if original is None else original)
+        return this
+
+    @classmethod
+    def from_seconds(cls, total_seconds: int) -> "Int_VTime":
+        """Make a VTime from integer seconds since midnight."""
+        if 0 <= total_seconds <= cls.MAX_SECONDS:
+            return cls._by_seconds[total_seconds] or cls._intern(total_seconds)
+        return cls._make(total_seconds)
+
+    @classmethod
+    def _intern(cls, total_seconds: int) -> "Int_VTime":
+        this = cls._make(total_seconds)
+        cls._by_seconds[total_seconds] = this
+        return this
+
+    @classmethod
+    def _make_blank(cls, maybe_time) -> "Int_VTime":
+        """Return the shared blank instance, or a fresh one for bad non-blank input."""
+        if maybe_time == "":
+            if cls._blank is None:
+                cls._blank = cls._make(None, original="")
+            return cls._blank
+        return cls._make(None, original=str(maybe_time).strip())
+
+    @classmethod
+    def _parse_seconds(cls, maybe_time, allow_large: bool = False) -> tuple[int | None, bool]:
+        """Parse maybe_time to seconds since midnight.
+
+        Returns (seconds or None, whether the result may be cached against
+        the raw input).  Only "now" is not cacheable.
+        """
+        if isinstance(maybe_time, Int_VTime):
+            return maybe_time.as_seconds, False
+
+        if isinstance(maybe_time, (int, float)):
+            if isinstance(maybe_time, float):
+                total_seconds = int(round(maybe_time * 60))
+            else:
+                total_seconds = int(maybe_time) * 60
+            if total_seconds < 0 or (
+                not allow_large and total_seconds > cls.MAX_SECONDS
+            ):
+                return None, True
+            return total_seconds, True
+
+        if not isinstance(maybe_time, str):
+            return None, True
+
+        text = maybe_time.strip()
+        if not text:
+            return None, True
+        # Fast path for the canonical "HH:MM" and "HH:MM:SS" forms
+        if len(text) in (5, 8) and text[2] == ":" and (len(text) == 5 or text[5] == ":"):
+            hh, mm, ss = text[0:2], text[3:5], text[6:8] if len(text) == 8 else "00"
+            if hh.isdigit() and mm.isdigit() and ss.isdigit():
+                hours, minutes, seconds = int(hh), int(mm), int(ss)
+                if minutes > 59 or seconds > 59:
+                    return None, True
+                total_seconds = hours * 3600 + minutes * 60 + seconds
+                if not allow_large and total_seconds > cls.MAX_SECONDS:
+                    return None, True
+                return total_seconds, True
+        if text.lower() == "now":
+            now = datetime.now()
+            return now.hour * 3600 + now.minute * 60 + now.second, False
+
+        if ":" in text:
+            parts = text.split(":")
+            if len(parts) == 2:
+                hours_str, minutes_str = parts
+                seconds_str = "00"
+            elif len(parts) == 3:
+                hours_str, minutes_str, seconds_str = parts
+            else:
+                return None, True
+            if not (
+                hours_str.isdigit() and minutes_str.isdigit() and seconds_str.isdigit()
+            ):
+                return None, True
+            if len(minutes_str) != 2 or len(seconds_str) != 2:
+                return None, True
+            hours = int(hours_str)
+            minutes = int(minutes_str)
+            seconds = int(seconds_str)
+        elif text.isdigit() and len(text) >= 3:
+            hours = int(text[:-2])
+            minutes = int(text[-2:])
+            seconds = 0
+        else:
+            return None, True
+
+        if minutes > 59 or seconds > 59:
+            return None, True
+        total_seconds = hours * 3600 + minutes * 60 + seconds
+        if not allow_large and total_seconds > cls.MAX_SECONDS:
+            return None, True
+        return total_seconds, True
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"VTime objects are immutable (can't set '{name}')")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"VTime objects are immutable (can't delete '{name}')")
+
+    def __reduce__(self):
+        large = self.as_seconds is not None and self.as_seconds > self.MAX_SECONDS
+        return (self.__class__, (self.hms or self.original, large))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __eq__(self, other) -> bool:
+        if self is other:
+            return True
+        if other.__class__ is not Int_VTime:
+            other = Int_VTime(other)
+        return self.as_seconds == other.as_seconds
+
+    def __ne__(self, other) -> bool:
+        return not self.__eq__(other)
+
+    def __lt__(self, other) -> bool:
+        if other.__class__ is not Int_VTime:
+            other = Int_VTime(other)
+        self_seconds = self.as_seconds
+        other_seconds = other.as_seconds
+        if self_seconds is None:
+            return other_seconds is not None
+        if other_seconds is None:
+            return False
+        return self_seconds < other_seconds
+
+    def __gt__(self, other) -> bool:
+        if other.__class__ is not Int_VTime:
+            other = Int_VTime(other)
+        self_seconds = self.as_seconds
+        other_seconds = other.as_seconds
+        if other_seconds is None:
+            return self_seconds is not None
+        if self_seconds is None:
+            return False
+        return self_seconds > other_seconds
+
+    def __le__(self, other) -> bool:
+        if other.__class__ is not Int_VTime:
+            other = Int_VTime(other)
+        self_seconds = self.as_seconds
+        other_seconds = other.as_seconds
+        if self_seconds is None:
+            return True
+        if other_seconds is None:
+            return False
+        return self_seconds <= other_seconds
+
+    def __ge__(self, other) -> bool:
+        if other.__class__ is not Int_VTime:
+            other = Int_VTime(other)
+        self_seconds = self.as_seconds
+        other_seconds = other.as_seconds
+        if other_seconds is None:
+            return True
+        if self_seconds is None:
+            return False
+        return self_seconds >= other_seconds
+
+    def __hash__(self):
+        return hash(self.as_seconds)
+
+    @staticmethod
+    def _coerce_to_vtime(value):
+        return value if isinstance(value, Int_VTime) else Int_VTime(value)
+
+
 
 # class HM_VTime(str):
 #     # Precompile regex pattern for valid formats with optional colon
@@ -317,4 +593,4 @@ class HMS_VTime(str):
 #         return hash(str(self))
 
 
-VTime = HMS_VTime
+VTime = Int_VTime
@@ -24,6 +24,7 @@ Copyright (C) 2023-2024 Todd Glover & Julias Hocking
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import os
 import re
 import json
 from pathlib import Path
@@ -33,6 +34,7 @@ from common.tt_tag import TagID
 from common.tt_time import VTime
 import common.tt_util as ut
 from common.tt_biketag import BikeTag
+from common.tt_eventindex import EventIndex
 from common.tt_constants import REGULAR, OVERSIZE, UNKNOWN, RETIRED
 from common.tt_bikevisit import BikeVisit
 from tt_registrations import Registrations
@@ -56,6 +58,9 @@ TOKEN_NOTES = "notes"
 TOKEN_SITE_NAME = "site_name"
 TOKEN_SITE_HANDLE = "site_handle"
 
+# Journal of changes not yet in the datafile is kept in DATAFILE + this
+JOURNAL_SUFFIX = ".journal"
+
 SCHEMA_PATH = (
     Path(__file__).resolve().parent.parent / "common" / "tagtracker_schema_v1.0.0.json"
 )
@@ -249,6 +254,9 @@ class TrackerDay:
         self.filepath = filepath
         self.site_handle = site_handle or ""
         self.site_name = site_name or ""
+        self._event_index: EventIndex = None
+        # State as last saved to datafile or journal; None if never saved
+        self._journal_shadow: tuple[dict, dict] = None
 
     def initialize_biketags(self):
         """Create the biketags list from the tagid lists."""
@@ -263,6 +271,7 @@ class TrackerDay:
             if t not in self.biketags:
                 self.biketags[t] = BikeTag(t, UNKNOWN)
             self.biketags[t].status = BikeTag.RETIRED
+        self.invalidate_event_index()
 
     def rebuild_visit_notes_link(self):
         """Clear BikeVisit attached_notes and rebuild from source of truth (notes)."""
@@ -507,6 +516,8 @@ class TrackerDay:
             if visit.time_out == "24:00":
                 visit.time_out = VTime("23:59")
                 changed += 1
+        if changed:
+            self.invalidate_event_index()
         return changed
 
     def bike_time_reasonable(self, inout_time: VTime) -> bool:
@@ -829,15 +840,26 @@ class TrackerDay:
 
         With default filepath, any errors in writing are considered catastrophic.
         For others, report the error and return False.
+
+        Saving to the default filepath also compacts the journal: the
+        journal is brought up to date first (so that if interrupted,
+        replaying it onto the new datafile is harmless), then removed.
         """
         what_filepath = custom_filepath or self.filepath
+        journal_filepath = self.journal_filepath(self.filepath)
+        if (
+            not custom_filepath
+            and self._journal_shadow is not None
+            and os.path.exists(journal_filepath)
+        ):
+            self.save_to_journal()
         data = self._day_to_json_dict()
         # schema = self.load_schema()
         # self.validate_data(data, schema)
 
         # Any failure to write is a critical error
         try:
-            with open(what_filepath, "w", encoding="utf-8") as file:
+            with ut.AtomicFile(what_filepath) as file:
                 json.dump(data, file, indent=4)
         except Exception:  # pylint:disable=broad-exception-caught
             if custom_filepath:
@@ -848,22 +870,182 @@ class TrackerDay:
                     f"\n\nCRITICAL PROBLEM: Unable to save data to file {what_filepath}\n\n"
                 )
                 raise
+        if not custom_filepath:
+            self._journal_shadow = self._journal_state()
+            try:
+                os.remove(journal_filepath)
+            except FileNotFoundError:
+                pass
         return True
 
+    def snapshot(self) -> dict:
+        """Return a copy of the day's data, as for its datafile.
+
+        It shares nothing mutable with this TrackerDay, so can be handed
+        to another thread.  from_snapshot() makes it back into a TrackerDay.
+        """
+        return self._day_to_json_dict()
+
+    @staticmethod
+    def from_snapshot(data: dict, filepath: str = "") -> "TrackerDay":
+        """Make a TrackerDay from a snapshot() of one."""
+        day = TrackerDay._day_from_json_dict(data, filepath)
+        day.determine_tagids_conformity()
+        day.harmonize_biketags()
+        day.rebuild_visit_notes_link()
+        return day
+
+    @staticmethod
+    def journal_filepath(filepath: str) -> str:
+        """Return the name of the journal file for datafile filepath."""
+        return f"{filepath}{JOURNAL_SUFFIX}"
+
+    def _journal_state(self) -> tuple[dict, dict]:
+        """Return the state to journal as (datafile top-level items, visits by tag).
+
+        The visits are tuples of (time_in, time_out) strings for each tagid
+        that has any visits.
+        """
+        items = {
+            TOKEN_SITE_NAME: self.site_name,
+            TOKEN_SITE_HANDLE: self.site_handle,
+            TOKEN_DATE: self.date,
+            TOKEN_OPENING_TIME: str(self.time_open),
+            TOKEN_CLOSING_TIME: str(self.time_closed),
+            TOKEN_REGISTRATIONS: self.registrations.num_registrations,
+            TOKEN_REGULAR_TAGIDS: sorted(self.regular_tagids),
+            TOKEN_OVERSIZE_TAGIDS: sorted(self.oversize_tagids),
+            TOKEN_RETIRED_TAGIDS: sorted(self.retired_tagids),
+            TOKEN_NOTES: self.notes.serialize(),
+        }
+        visits = {
+            tagid: tuple(
+                (
+                    visit.time_in.hms if visit.time_in else "",
+                    visit.time_out.hms if visit.time_out else "",
+                )
+                for visit in biketag.visits
+            )
+            for tagid, biketag in self.biketags.items()
+            if biketag.visits
+        }
+        return items, visits
+
+    def save_to_journal(self) -> bool:
+        """Append what has changed since the last save to the journal.
+
+        The journal record is one line of compact JSON holding the new
+        values of any changed top-level datafile items and the complete
+        list of visits of any tag whose visits changed.  Records hold
+        new values, not differences, so replaying them is exact.
+
+        If there is no saved datafile yet to journal against, this saves
+        the datafile instead.  Any failure to write is catastrophic.
+
+        Returns True if anything was saved.
+        """
+        if self._journal_shadow is None:
+            return self.save_to_file()
+
+        items, visits = self._journal_state()
+        old_items, old_visits = self._journal_shadow
+        record = {
+            key: value for key, value in items.items() if old_items.get(key) != value
+        }
+        changed_visits = {
+            tagid: [list(times) for times in visits.get(tagid, ())]
+            for tagid in visits.keys() | old_visits.keys()
+            if visits.get(tagid, ()) != old_visits.get(tagid, ())
+        }
+        if changed_visits:
+            record[TOKEN_BIKE_VISITS] = changed_visits
+        if not record:
+            return False
+
+        journal_filepath = self.journal_filepath(self.filepath)
+        try:
+            with open(journal_filepath, "a", encoding="utf-8") as file:
+                # Leading newline so a record torn by a crash stays on its own line
+                file.write("\n" + json.dumps(record, separators=(",", ":")))
+                file.flush()
+                os.fsync(file.fileno())
+        except Exception:  # pylint:disable=broad-exception-caught
+            print(
+                f"\n\nCRITICAL PROBLEM: Unable to save data to journal {journal_filepath}\n\n"
+            )
+            raise
+        self._journal_shadow = (items, visits)
+        return True
+
+    @staticmethod
+    def _replay_journal(data: dict, journal_filepath: str) -> int:
+        """Apply any journal records to datafile contents 'data'.
+
+        A record that doesn't parse (torn by a crash while being written)
+        is skipped.  Returns the number of records applied.
+        """
+        try:
+            with open(journal_filepath, "r", encoding="utf-8") as file:
+                lines = file.read().splitlines()
+        except FileNotFoundError:
+            return 0
+
+        applied = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.decoder.JSONDecodeError:
+                ut.squawk(f"Skipping unreadable journal record '{line}'", cfg.DEBUG)
+                continue
+            changed_visits = record.pop(TOKEN_BIKE_VISITS, {})
+            data.update(record)
+            if changed_visits:
+                changed_tagids = {TagID(tagid) for tagid in changed_visits}
+                regular_tagids = {TagID(tagid) for tagid in data[TOKEN_REGULAR_TAGIDS]}
+                bike_visits = [
+                    v
+                    for v in data[TOKEN_BIKE_VISITS]
+                    if TagID(v[TOKEN_TAGID]) not in changed_tagids
+                ]
+                for tagid, times in changed_visits.items():
+                    bike_size = (
+                        TrackerDay.REGULAR_BIKE
+                        if TagID(tagid) in regular_tagids
+                        else TrackerDay.OVERSIZE_BIKE
+                    )
+                    for time_in, time_out in times:
+                        bike_visits.append(
+                            {
+                                TOKEN_TAGID: tagid,
+                                TOKEN_BIKE_SIZE: bike_size,
+                                TOKEN_TIME_IN: time_in,
+                                TOKEN_TIME_OUT: time_out,
+                            }
+                        )
+                data[TOKEN_BIKE_VISITS] = bike_visits
+            applied += 1
+        return applied
+
     @staticmethod
     def load_from_file(filepath, validate_schema: bool = False) -> "TrackerDay":
         """Load the TrackerDay from file.
 
+        Any changes in the datafile's journal are replayed on top of it.
+
         Some error testing is done, but a lint check is still required.
         """
         try:
             with open(filepath, "r", encoding="utf-8") as file:
                 data = json.load(file)
+            TrackerDay._replay_journal(data, TrackerDay.journal_filepath(filepath))
             if validate_schema:
                 TrackerDay.validate_data(data)
             loaded_day = TrackerDay._day_from_json_dict(data, filepath)
         except json.decoder.JSONDecodeError as e:
             raise TrackerDayError(f"JSON error {e}") from e
+        loaded_day._journal_shadow = loaded_day._journal_state()
         loaded_day.determine_tagids_conformity()
         # Make sure the notes (and their visits) are linked
         loaded_day.harmonize_biketags()
@@ -904,30 +1086,41 @@ class TrackerDay:
 
         return "\n".join(self.dump(detailed=False))
 
+    def event_index(self) -> EventIndex:
+        """Return the index of this day's events, (re)building it if needed.
+
+        Once built, the BikeTags keep it current through check-ins,
+        check-outs, edits and deletes.
+        """
+        if self._event_index is None or not self._event_index.is_current_for(
+            self.biketags
+        ):
+            self._event_index = EventIndex.from_biketags(self.biketags)
+        return self._event_index
+
+    def invalidate_event_index(self):
+        """Discard the event index, e.g. after changing visits directly."""
+        if self._event_index is not None:
+            for biketag in self.biketags.values():
+                if biketag.event_index is self._event_index:
+                    biketag.event_index = None
+        self._event_index = None
+
+    @staticmethod
+    def _as_of_seconds(as_of_when) -> int:
+        """Seconds for an as-of time (default now); -1 if not a valid time."""
+        as_of_when = VTime(as_of_when or "now")
+        return -1 if not as_of_when else as_of_when.as_seconds
+
     def num_bikes_parked(self, as_of_when: str = "") -> int:
         """Number of bikes parked as of as_of_when.
 
         Returns (total,regular,oversize).
         """
-        as_of_when = VTime(as_of_when or "now")
-
-        regular_in = 0
-        oversize_in = 0
-        for biketag in self.biketags.values():
-            regular_in += len(
-                [
-                    v
-                    for v in biketag.visits
-                    if v.time_in <= as_of_when and biketag.bike_type == REGULAR
-                ]
-            )
-            oversize_in += len(
-                [
-                    v
-                    for v in biketag.visits
-                    if v.time_in <= as_of_when and biketag.bike_type == OVERSIZE
-                ]
-            )
+        as_of = self._as_of_seconds(as_of_when)
+        index = self.event_index()
+        regular_in = index.num_in(as_of, REGULAR)
+        oversize_in = index.num_in(as_of, OVERSIZE)
         total_in = regular_in + oversize_in
         return total_in, regular_in, oversize_in
 
@@ -938,18 +1131,14 @@ class TrackerDay:
 
         A bike has been returned if it has checked out before now.
         """
-        as_of_when = VTime(as_of_when or "now")
-
-        regular_out = 0
-        oversize_out = 0
-        for biketag in self.biketags.values():
-            for visit in biketag.visits:
-                if visit.time_out and visit.time_out < as_of_when:
-                    if biketag.bike_type == REGULAR:
-                        regular_out += 1
-                    else:
-                        oversize_out += 1
-
+        as_of = self._as_of_seconds(as_of_when)
+        index = self.event_index()
+        regular_out = index.num_out(as_of, REGULAR)
+        oversize_out = sum(
+            index.num_out(as_of, bike_type)
+            for bike_type in index.bike_types()
+            if bike_type != REGULAR
+        )
         total_out = regular_out + oversize_out
         return total_out, regular_out, oversize_out
 
@@ -963,21 +1152,27 @@ class TrackerDay:
         Critical to this working is the constraint that a tagid will
         only be used for one visit at any one time.
         """
-
-        as_of_when = VTime(as_of_when or "now")
+        _, in_use = self.event_index().tags_started_and_in_use(
+            self._as_of_seconds(as_of_when)
+        )
+        if not in_use:
+            return []
         return [
             b.tagid
             for b in self.biketags.values()
-            if b.status_as_at(as_of_when) == BikeTag.IN_USE
+            if b.tagid in in_use and b.status != BikeTag.RETIRED
         ]
 
     def tags_done(self, as_of_when: str = "") -> list:
         """List of tagids of biketags that are in a 'DONE' state as_of_when."""
-        as_of_when = VTime(as_of_when or "now")
+        started, in_use = self.event_index().tags_started_and_in_use(
+            self._as_of_seconds(as_of_when)
+        )
+        done = started - in_use
         return [
             b.tagid
             for b in self.biketags.values()
-            if b.status_as_at(as_of_when) == BikeTag.DONE
+            if b.tagid in done and b.status != BikeTag.RETIRED
         ]
 
     def max_bikes_up_to_time(self, as_of_when: str = ""):
@@ -985,33 +1180,7 @@ class TrackerDay:
 
         # FIXME: extend this for regular/oversize/total
 
-        as_of_when = VTime(as_of_when or "now")
-        # Collect all time_in and time_out events up to as_of_when
-        events = []
-        for visit in self.all_visits():
-            if visit.time_in <= as_of_when:
-                events.append((visit.time_in, "in"))
-            if visit.time_out and visit.time_out <= as_of_when:
-                events.append((visit.time_out, "out"))
-
-        # Sort events by time then 'in' before 'out'if times are the same.
-        events.sort(key=lambda x: (x[0], x[1] == "out"))
-
-        max_bikes = 0
-        current_bikes = 0
-        max_time = ""
-
-        # Iterate through sorted events and track the number of bikes
-        for event in events:
-            if event[1] == "in":
-                current_bikes += 1
-                if current_bikes > max_bikes:
-                    max_bikes = current_bikes
-                    max_time = event[0]
-            elif event[1] == "out":
-                current_bikes -= 1
-
-        return max_bikes, max_time
+        return self.event_index().max_bikes_up_to(self._as_of_seconds(as_of_when))
 
     def dump(self, detailed: bool = False) -> list[str]:
         """Return a compact textual summary of this object."""
@@ -26,6 +26,7 @@ import os
 import sys
 import datetime
 import re
+import threading
 
 # import collections
 import random
@@ -403,6 +404,64 @@ def writable_dir(filepath: str) -> bool:
         return False
 
 
+class AtomicFile:
+    """A text file that replaces filepath only once completely written.
+
+    Writes go to a temporary file in the same folder.  commit() flushes
+    and fsyncs it then renames it over filepath, so readers (and a crash)
+    only ever see the old file or the new one, never a partial one.
+    discard() abandons the temporary file, leaving filepath untouched.
+
+    As a context manager, commits on normal exit and discards on exception.
+    """
+
+    def __init__(self, filepath: str, encoding: str = "utf-8") -> None:
+        self.filepath = filepath
+        self.temp_filepath = f"{filepath}.{os.getpid()}-{threading.get_ident()}.tmp"
+        self.file = open(self.temp_filepath, "w", encoding=encoding)
+
+    def write(self, text: str) -> int:
+        return self.file.write(text)
+
+    def commit(self) -> None:
+        """Make the written file durable and rename it into place."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        # Keep the permissions of the file being replaced
+        try:
+            os.chmod(self.temp_filepath, os.stat(self.filepath).st_mode)
+        except OSError:
+            pass
+        os.replace(self.temp_filepath, self.filepath)
+        # Make the rename itself durable (not possible on all platforms)
+        try:
+            folder_fd = os.open(os.path.dirname(os.path.abspath(self.filepath)), os.O_RDONLY)
+            try:
+                os.fsync(folder_fd)
+            finally:
+                os.close(folder_fd)
+        except OSError:
+            pass
+
+    def discard(self) -> None:
+        """Abandon the temporary file."""
+        self.file.close()
+        try:
+            os.remove(self.temp_filepath)
+        except OSError:
+            pass
+
+    def __enter__(self) -> "AtomicFile":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+
 def is_int(obj, *, strict=False) -> bool:
     """Tests whether s represents a (positive or negative) integer.
 
@@ -83,6 +83,9 @@ CREATE TABLE DAY (  -- Summary data about one org at one site on one day
             AND time_closed BETWEEN '00:00' AND '24:00'
         ),
     weekday INTEGER NOT NULL,
+    year INTEGER, -- calendar keys of date, for filtering & grouping
+    month INTEGER,
+    iso_week INTEGER, -- ISO year & week number, as YYYYWW
 
     num_parked_regular INTEGER,
     num_parked_oversize INTEGER,
@@ -142,7 +145,9 @@ CREATE TABLE VISIT ( -- one bike visit for one org/site/date
                 AND time_out BETWEEN '00:00' AND '24:00'
             )
         ),
-    duration INTEGER,
+    duration INTEGER, -- minutes
+    time_in_min INTEGER, -- time_in as minutes after midnight
+    time_out_min INTEGER, -- time_out as minutes after midnight (NULL if none)
     bike_type TEXT
         CHECK (bike_type IN ('R', 'O')),
     bike_id TEXT, -- optional str to identify the bike (eg a tagid)
@@ -150,7 +155,9 @@ CREATE TABLE VISIT ( -- one bike visit for one org/site/date
 );
 
 CREATE INDEX visit_day_id_idx ON VISIT (day_id);
--- Removed indexes on derived minute columns; minute values computed on demand.
+-- Covers queries that work with visit times as minutes
+CREATE INDEX visit_day_minutes_idx
+    ON VISIT (day_id, time_in_min, time_out_min, duration);
 
 CREATE TABLE BLOCK ( -- activity in a given half hour for an org/site/date
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -161,6 +168,7 @@ CREATE TABLE BLOCK ( -- activity in a given half hour for an org/site/date
             time_start LIKE "__:__"
             AND time_start BETWEEN '00:00' AND '24:00'
         ),
+    time_start_min INTEGER, -- time_start as minutes after midnight
 
         num_incoming_regular INTEGER,
         num_incoming_oversize INTEGER,
@@ -197,6 +205,11 @@ CREATE TABLE BLOCK ( -- activity in a given half hour for an org/site/date
     FOREIGN KEY (day_id) REFERENCES DAY (id) ON DELETE CASCADE
 );
 
+-- Covers the block activity reports
+CREATE INDEX block_day_start_min_idx
+    ON BLOCK (day_id, time_start_min, num_incoming_combined,
+        num_outgoing_combined, num_on_hand_combined);
+
 -- Information about the most recent successful data load
 CREATE TABLE DATALOADS ( -- info about most recent successful data loads
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -206,6 +219,56 @@ CREATE TABLE DATALOADS ( -- info about most recent successful data loads
     datafile_timestamp TEXT, -- timestamp of the file
     load_timestamp TEXT,    -- time at which the file was loaded
     batch TEXT,
+    datafile_size INTEGER, -- size of the file (bytes)
+    datafile_mtime INTEGER, -- modification time of the file (ns since epoch)
+    FOREIGN KEY (day_id) REFERENCES DAY (id) ON DELETE CASCADE
+);
+
+-- Per-period rollups of DAY & VISIT, by orgsite, kept up to date by
+-- db_from_datafile.  See database/tt_rollups.py (which also has these).
+CREATE TABLE ROLLUP ( -- sums & maxima of DAY for one orgsite for a week/month/year
+    orgsite_id INTEGER,
+    period_type TEXT CHECK (period_type IN ('Y', 'M', 'W')), -- year, month, ISO week
+    period_start DATE, -- first date of the period
+    period_end DATE, -- last date of the period
+    total_days_open INTEGER,
+    total_parked_combined INTEGER,
+    total_parked_regular INTEGER,
+    total_parked_oversize INTEGER,
+    total_bikes_registered INTEGER,
+    max_bikes_registered INTEGER,
+    min_max_temperature FLOAT,
+    max_max_temperature FLOAT,
+    total_precipitation FLOAT,
+    max_precipitation FLOAT,
+    total_remaining_combined INTEGER,
+    max_remaining_combined INTEGER,
+    total_hours_open FLOAT,
+    max_parked_combined INTEGER,
+    max_parked_combined_date DATE,
+    max_fullest_combined INTEGER,
+    max_fullest_combined_date DATE,
+    total_visit_minutes INTEGER, -- sum of VISIT durations
+    PRIMARY KEY (orgsite_id, period_type, period_start)
+);
+
+CREATE TABLE ROLLUP_DURATION ( -- histogram of visit durations for a ROLLUP period
+    orgsite_id INTEGER,
+    period_type TEXT,
+    period_start DATE,
+    duration INTEGER, -- minutes
+    num_visits INTEGER, -- number of visits of this duration
+    PRIMARY KEY (orgsite_id, period_type, period_start, duration)
+);
+
+-- Each day's cumulative ins & outs by the minute (16-bit little-endian ints,
+-- 00:00 to 24:00), kept up to date by db_from_datafile for the estimator.
+-- See database/tt_day_curves.py (which also has this).
+CREATE TABLE DAY_CURVE ( -- stored OccupancyCurve of one day
+    day_id INTEGER PRIMARY KEY,
+    first_event INTEGER, -- minute of the day's first visit in or out
+    ins_through BLOB, -- cumulative ins at each minute
+    outs_through BLOB, -- cumulative outs at each minute
     FOREIGN KEY (day_id) REFERENCES DAY (id) ON DELETE CASCADE
 );
 
@@ -214,6 +277,8 @@ CREATE INDEX IF NOT EXISTS visit_day_in_idx
     ON VISIT(day_id, time_in);
 CREATE INDEX IF NOT EXISTS day_orgsite_date_idx
     ON DAY(orgsite_id, date);
+CREATE INDEX IF NOT EXISTS day_orgsite_weekday_date_idx
+    ON DAY(orgsite_id, weekday, date);
 CREATE INDEX IF NOT EXISTS day_orgsite_open_close_idx
     ON DAY(orgsite_id, time_open, time_closed);
 CREATE INDEX IF NOT EXISTS visit_day_out_idx
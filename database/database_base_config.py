@@ -37,6 +37,13 @@ Copyright (C) 2023-2024 Julias Hocking & Todd Glover
 # Database filename
 DB_FILENAME = ""  # Filepath to sqlite3 database
 
+# Put the database in WAL (write-ahead log) mode when loading or updating
+# it, so that reports can go on reading it while it is written.  With WAL
+# on, everything that reads the database (including the web server's
+# user) needs write access to the folder it is in, for its -wal and -shm
+# files.  When off, a database left in WAL mode is put back to normal.
+DB_WAL_MODE = False
+
 # Weather update configuration
 # WX_SITES is an ordered list of mappings with keys:
 #   url: CSV endpoint (may include {year} placeholder)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""Add stored derived columns (and their indexes) to an existing TagTracker database.
+
+VISIT gets time_in_min & time_out_min and BLOCK gets time_start_min: the
+HH:MM text times as integer minutes after midnight, so that reports can
+use (and index) them without converting every row.  VISIT.duration is
+made integer minutes if it is not already.
+
+DAY gets year, month & iso_week (see tt_dbutil.day_calendar_keys()),
+for filtering and grouping days without computing them from each date.
+
+Databases made from create_database.sql already have these, and
+db_from_datafile calls add_derived_columns() itself, so this is only
+needed to migrate a database without loading anything into it (e.g.
+after upgrading, before the web pages use it; they refuse to use a
+database that is missing these columns).
+
+Usage: python -m database.db_add_derived_columns [--verbose] [database_file]
+
+Copyright (C) 2023-2024 Julias Hocking & Todd Glover
+
+    Notwithstanding the licensing information below, this code may not
+    be used in a commercial (for-profit, non-profit or government) setting
+    without the copyright-holder's written consent.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import argparse
+import sqlite3
+import sys
+
+from database.database_base_config import DB_FILENAME
+import database.tt_dbutil as db
+
+# (table, minutes column, HH:MM text column it is from)
+MINUTE_COLUMNS = [
+    ("VISIT", "time_in_min", "time_in"),
+    ("VISIT", "time_out_min", "time_out"),
+    ("BLOCK", "time_start_min", "time_start"),
+]
+
+# Indexes that use the minute columns (as in create_database.sql)
+MINUTE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS visit_day_minutes_idx "
+    "ON VISIT(day_id, time_in_min, time_out_min, duration);",
+    "CREATE INDEX IF NOT EXISTS block_day_start_min_idx "
+    "ON BLOCK(day_id, time_start_min, num_incoming_combined, "
+    "num_outgoing_combined, num_on_hand_combined);",
+]
+
+
+def _minutes_sql(column: str) -> str:
+    """SQL expression for HH:MM text column as minutes (NULL if not HH:MM)."""
+    return (
+        f"CASE WHEN length({column}) = 5 THEN "
+        f"CAST(substr({column}, 1, 2) AS INTEGER) * 60 "
+        f"+ CAST(substr({column}, 4, 2) AS INTEGER) END"
+    )
+
+
+def add_minute_columns(dbconx: sqlite3.Connection, verbose: bool = False) -> bool:
+    """Add & fill any missing minute columns, and make their indexes.
+
+    Returns True if the database needed changing.
+    """
+    cursor = dbconx.cursor()
+    changed = False
+    for table, minutes_col, text_col in MINUTE_COLUMNS:
+        columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+        if minutes_col in columns:
+            continue
+        if verbose:
+            print(f"Adding column {minutes_col} to table {table}.")
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {minutes_col} INTEGER")
+        cursor.execute(f"UPDATE {table} SET {minutes_col} = {_minutes_sql(text_col)}")
+        changed = True
+    if not changed:
+        cursor.close()
+        return False
+
+    # Older databases may have durations as text
+    cursor.execute(
+        "UPDATE VISIT SET duration = CAST(duration AS INTEGER) "
+        "WHERE typeof(duration) = 'text' AND duration != ''"
+    )
+    if verbose:
+        print("Creating indexes.")
+    for index_sql in MINUTE_INDEXES:
+        cursor.execute(index_sql)
+    dbconx.commit()
+    cursor.execute("ANALYZE;")
+    dbconx.commit()
+    cursor.close()
+    return True
+
+
+# DAY calendar columns, as from tt_dbutil.day_calendar_keys()
+CALENDAR_COLUMNS = ["year", "month", "iso_week"]
+
+# Indexes that use the calendar columns (as in create_database.sql)
+CALENDAR_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS day_orgsite_weekday_date_idx "
+    "ON DAY(orgsite_id, weekday, date);",
+]
+
+
+def add_calendar_columns(dbconx: sqlite3.Connection, verbose: bool = False) -> bool:
+    """Add & fill DAY's calendar columns if missing, and make their indexes.
+
+    Returns True if the database needed changing.
+    """
+    cursor = dbconx.cursor()
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(DAY)")]
+    missing = [col for col in CALENDAR_COLUMNS if col not in columns]
+    if not missing:
+        cursor.close()
+        return False
+    for col in missing:
+        if verbose:
+            print(f"Adding column {col} to table DAY.")
+        cursor.execute(f"ALTER TABLE DAY ADD COLUMN {col} INTEGER")
+    rows = cursor.execute("SELECT id, date FROM DAY").fetchall()
+    cursor.executemany(
+        "UPDATE DAY SET year = ?, month = ?, iso_week = ? WHERE id = ?",
+        [(*db.day_calendar_keys(date), day_id) for day_id, date in rows],
+    )
+    if verbose:
+        print("Creating indexes.")
+    for index_sql in CALENDAR_INDEXES:
+        cursor.execute(index_sql)
+    dbconx.commit()
+    cursor.execute("ANALYZE;")
+    dbconx.commit()
+    cursor.close()
+    return True
+
+
+# For those who find a database missing them
+MIGRATE_MESSAGE = (
+    "The database needs upgrading for this version of TagTracker. "
+    "Run 'python3 -m database.db_add_derived_columns' "
+    "(or load datafiles into it) to upgrade it."
+)
+
+
+def missing_derived_columns(cursor: sqlite3.Cursor) -> list[str]:
+    """Return the derived columns the database lacks, as 'TABLE.column'.
+
+    The web pages need them, so check before using a database that may
+    not have been migrated (or loaded into) since TagTracker was upgraded.
+    """
+    wanted = [(table, col) for table, col, _ in MINUTE_COLUMNS] + [
+        ("DAY", col) for col in CALENDAR_COLUMNS
+    ]
+    columns = {}
+    for table in {table for table, _ in wanted}:
+        columns[table] = {
+            row[1] for row in cursor.execute(f"PRAGMA table_info({table})")
+        }
+    return [f"{table}.{col}" for table, col in wanted if col not in columns[table]]
+
+
+def add_derived_columns(dbconx: sqlite3.Connection, verbose: bool = False) -> bool:
+    """Add any missing derived columns.  Returns True if the database needed changing."""
+    added_minutes = add_minute_columns(dbconx, verbose=verbose)
+    added_calendar = add_calendar_columns(dbconx, verbose=verbose)
+    return added_minutes or added_calendar
+
+
+def main():
+    """Migrate the database named on the command line (default DB_FILENAME)."""
+    parser = argparse.ArgumentParser(
+        description="Add stored derived columns to a TagTracker database."
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Print progress while running."
+    )
+    parser.add_argument(
+        "database_file",
+        nargs="?",
+        default=DB_FILENAME,
+        help="database to migrate (default: DB_FILENAME)",
+    )
+    args = parser.parse_args()
+
+    dbconx = db.db_connect(args.database_file)
+    if not dbconx:
+        sys.exit(1)
+    try:
+        changed = add_derived_columns(dbconx, verbose=args.verbose)
+    except tuple(db.SQL_MODERATE_ERRORS + db.SQL_CRITICAL_ERRORS) as e:
+        print(f"SQL error: {e}", file=sys.stderr)
+        dbconx.rollback()
+        sys.exit(1)
+    print(
+        "Added derived columns."
+        if changed
+        else "Database already has derived columns; nothing to do."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,8 @@ files (with fingerprints) to avoid accidental duplicate loads.
 
 Features:
     - Automatically calculates file fingerprints (md5) and timestamps.
+      Files whose size and mtime are unchanged since they were last loaded
+      are not re-read; the others are fingerprinted in parallel.
     - Skips files already loaded successfully unless --force is given.
     - Handles duplicate filenames by keeping only the newest (--newest-only)
       or last-seen (--tail-only).
@@ -25,6 +27,11 @@ Command-line options:
     --newest-only  For files with the same basename, only load the newest one
     --tail-only    For files with the same basename, only load the last in the list
     --org          Organization handle (default: "no_org")
+    --jobs N       Read datafiles in N parallel processes, writing them
+                   to the database in batched transactions
+    --rebuild      Build a new database from create_database.sql and the
+                   datafiles (indexes made once, at the end), then copy it
+                   over the existing database
 
 Database path:
     Taken from database.database_base_config.DB_FILENAME (overridable via database_local_config).
@@ -33,7 +40,8 @@ Arguments:
     dataglob       One or more file globs specifying the datafiles to load
 
 Requirements:
-    - The SQLite database must already exist (see create_database.sql).
+    - The SQLite database must already exist (see create_database.sql),
+      unless using --rebuild.
     - Database schema must include tables for DAY, VISIT, BLOCK, and DATALOADS.
 
 Intended usage:
@@ -61,12 +69,13 @@ Copyright (C) 2024 Todd Glover & Julias Hocking
 """
 
 import argparse
+import concurrent.futures
 import glob
 import os
+import re
 import sqlite3
 import sys
 from dataclasses import dataclass, field
-import subprocess
 from datetime import datetime
 import hashlib
 
@@ -74,6 +83,9 @@ from database.database_base_config import DB_FILENAME
 
 # import tt_datafile
 import database.tt_dbutil as db
+import database.tt_rollups as rollups
+import database.tt_day_curves as day_curves
+from database.db_add_derived_columns import add_derived_columns
 from database.tt_dbutil import SQL_CRITICAL_ERRORS, SQL_MODERATE_ERRORS
 
 # import tt_globals
@@ -109,6 +121,18 @@ COL_FINGERPRINT = "datafile_fingerprint"
 COL_DATAFILE = "datafile_name"
 COL_TIMESTAMP = "datafile_timestamp"
 COL_BATCH = "batch"
+COL_SIZE = "datafile_size"
+COL_MTIME = "datafile_mtime"
+
+# Bytes to read at a time when fingerprinting a file
+FINGERPRINT_CHUNK_SIZE = 1024 * 1024
+
+# With --jobs, the most datafiles to write in one transaction
+FILES_PER_TRANSACTION = 50
+
+# For --rebuild
+REBUILD_SCHEMA = os.path.join(os.path.dirname(__file__), "create_database.sql")
+REBUILD_CACHE_SIZE = -262144  # Negative means KiB, so this is 256 MiB
 
 
 class DBError(Exception):
@@ -151,6 +175,8 @@ class FileInfo:
     status: str = STATUS_GOOD
     fingerprint: str = None
     timestamp: str = None
+    size: int = None
+    mtime: int = None  # In nanoseconds
     errors: int = 0
     error_list: list = field(default_factory=list)
 
@@ -173,50 +199,65 @@ class FileInfo:
                 print_first_line(error_msg)
 
 
+@dataclass
+class PreparedDay:
+    """One datafile read, checked & summarized into rows for the database.
 
-def is_linux() -> bool:
-    """Check if running in linux."""
-    system_platform = sys.platform
-    return system_platform.startswith("linux")
+    Holds only plain data so that it can be made in a worker process.
+    """
 
+    filename: str
+    found: bool = True
+    repair_notes: list = field(default_factory=list)
+    errors: list = field(default_factory=list)  # Each a message or list of lines
+    date: str = ""
+    site_handle: str = ""
+    site_name: str = ""
+    day_values: tuple = ()  # As from day_values()
+    visit_rows: list = field(default_factory=list)  # As from visit_rows()
+    block_rows: list = field(default_factory=list)  # As from block_rows()
+
+    @property
+    def num_parked(self) -> int:
+        return self.day_values[6] if self.day_values else 0
+
+    @property
+    def num_remaining(self) -> int:
+        return self.day_values[9] if self.day_values else 0
 
-def get_file_fingerprint(file_path):
-    """Get a file's fingerprint."""
 
-    def get_file_md5_linux(file_path):
-        """Get an md5 digest by calling the system program."""
-        try:
-            result = subprocess.run(
-                ["md5sum", file_path], capture_output=True, text=True, check=True
-            )
-            md5sum_output = result.stdout.strip().split()[0]
-            return md5sum_output
-        except subprocess.CalledProcessError as e:
-            print(f"    Error: {e}", file=sys.stderr)
-            return None
 
-    def get_file_md5_windows(file_path):
-        """Calculate the MD5 checksum for a given file by reading the file.
+def get_file_fingerprint(file_path):
+    """Get a file's fingerprint (an md5 digest, read in chunks).
 
-        This one would be OS independent.
-        """
-        # Open the file in binary mode
+    hashlib releases the GIL while digesting, so this can usefully be
+    run in several threads at once.
+    """
+    md5_hash = hashlib.md5()
+    try:
         with open(file_path, "rb") as file:
-            # Create an MD5 hash object
-            md5_hash = hashlib.md5()
-            # Read the file in chunks to avoid loading the entire file into memory
-            for chunk in iter(lambda: file.read(4096), b""):
-                # Update the hash object with the chunk
+            for chunk in iter(lambda: file.read(FINGERPRINT_CHUNK_SIZE), b""):
                 md5_hash.update(chunk)
-        # Get the hexadecimal digest of the hash
-        md5_checksum = md5_hash.hexdigest()
-        return md5_checksum
+    except OSError as e:
+        print(f"    Error: {e}", file=sys.stderr)
+        return None
+    return md5_hash.hexdigest()
 
-    # On linux, prefer calling the system md5sum program
-    if is_linux():
-        return get_file_md5_linux(file_path)
-    else:
-        return get_file_md5_windows(file_path)
+
+def assure_dataloads_columns(dbconx: sqlite3.Connection) -> None:
+    """Add the file size & mtime columns to DATALOADS if it lacks them.
+
+    (Databases made before these columns were in create_database.sql.)
+    """
+    cursor = dbconx.cursor()
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({TABLE_LOADS})")]
+    for col in (COL_SIZE, COL_MTIME):
+        if col not in columns:
+            if args.verbose:
+                print(f"Adding column {col} to table {TABLE_LOADS}.")
+            cursor.execute(f"ALTER TABLE {TABLE_LOADS} ADD COLUMN {col} INTEGER")
+    dbconx.commit()
+    cursor.close()
 
 
 def get_load_fingerprints(dbconx: sqlite3.Connection) -> list[str]:
@@ -232,15 +273,30 @@ def get_load_fingerprints(dbconx: sqlite3.Connection) -> list[str]:
     return fingerprints
 
 
-def get_file_timestamp(file_path):
-    """Get a file's timestamp as an iso8601 string."""
-    try:
-        timestamp = os.path.getmtime(file_path)
-        modified_time = datetime.fromtimestamp(timestamp)
-        return modified_time.strftime("%Y-%m-%dT%H:%M:%S")
-    except FileNotFoundError as e:
-        print(f"    File {file_path} not found {e}.", file=sys.stderr)
-        return None
+def get_load_file_stats(dbconx: sqlite3.Connection) -> dict[str, tuple]:
+    """Get the (size, mtime, fingerprint) of files last loaded ok, by filename."""
+    cursor = dbconx.cursor()
+    rows = cursor.execute(
+        f"SELECT {COL_DATAFILE}, {COL_SIZE}, {COL_MTIME}, {COL_FINGERPRINT} "
+        f"FROM {TABLE_LOADS} ORDER BY id"
+    ).fetchall()
+    cursor.close()
+    # Later loads (higher ids) replace earlier ones of the same file
+    return {name: (size, mtime, fingerprint) for name, size, mtime, fingerprint in rows}
+
+
+def update_load_file_stats(dbconx: sqlite3.Connection, file_infos: list) -> None:
+    """Record current sizes & mtimes for files previously loaded with the same content."""
+    if not file_infos:
+        return
+    if args.verbose:
+        print(f"Updating sizes & mtimes of {len(file_infos)} previously loaded files.")
+    dbconx.executemany(
+        f"UPDATE {TABLE_LOADS} SET {COL_SIZE} = ?, {COL_MTIME} = ? "
+        f"WHERE {COL_DATAFILE} = ? AND {COL_FINGERPRINT} = ?",
+        [(f.size, f.mtime, f.name, f.fingerprint) for f in file_infos],
+    )
+    dbconx.commit()
 
 
 def fetch_existing_weather(
@@ -252,7 +308,8 @@ def fetch_existing_weather(
     if args.verbose:
         print(f"   Fetching existing weather (temp/precip) for {orgsite_id=}/'{date}'.")
     row = cursor.execute(
-        f"SELECT max_temperature, precipitation FROM day WHERE orgsite_id = {orgsite_id} AND date = '{date}';"
+        "SELECT max_temperature, precipitation FROM day WHERE orgsite_id = ? AND date = ?;",
+        (orgsite_id, date),
     ).fetchone()
 
     if not row:
@@ -364,18 +421,192 @@ def delete_one_day_data(cursor: sqlite3.Connection.cursor, date: str, orgsite_id
         print(f"   Deleting records for '{orgsite_id=}'/'{date}'.")
 
     if day_id is not None:
-        cursor.execute(f"DELETE FROM VISIT WHERE day_id = {day_id}")
-        cursor.execute(f"DELETE FROM BLOCK WHERE day_id = {day_id}")
-        cursor.execute(f"DELETE FROM DATALOADS WHERE day_id = {day_id}")
-        cursor.execute(f"DELETE FROM DAY WHERE id = {day_id}")
+        cursor.execute("DELETE FROM VISIT WHERE day_id = ?", (day_id,))
+        cursor.execute("DELETE FROM BLOCK WHERE day_id = ?", (day_id,))
+        cursor.execute("DELETE FROM DATALOADS WHERE day_id = ?", (day_id,))
+        cursor.execute("DELETE FROM DAY WHERE id = ?", (day_id,))
+
+
+# Statements for writing a datafile's rows.  These are always the same
+# text, so sqlite3 prepares each once and reuses it from its statement cache.
+SQL_INSERT_DAY = """
+    INSERT INTO DAY (
+        orgsite_id,
+        date,
+        time_open,
+        time_closed,
+        weekday,
+
+        num_parked_regular,
+        num_parked_oversize,
+        num_parked_combined,
+
+        num_remaining_regular,
+        num_remaining_oversize,
+        num_remaining_combined,
+
+        num_fullest_regular,
+        num_fullest_oversize,
+        num_fullest_combined,
+
+        time_fullest_regular,
+        time_fullest_oversize,
+        time_fullest_combined,
+
+        bikes_registered,
+        batch,
+
+        max_temperature,
+        precipitation,
+
+        year,
+        month,
+        iso_week
+    )
+    VALUES (
+        ?,?,?,?,?,
+        ?,?,?,    ?,?,?,   ?,?,?,   ?,?,?,
+        ?,?,
+        ?,?,
+        ?,?,?
+    )
+"""
+
+SQL_INSERT_VISIT = """
+    INSERT INTO VISIT (
+        day_id,
+        time_in,
+        time_out,
+        duration,
+        bike_type,
+        bike_id,
+        time_in_min,
+        time_out_min
+    )
+    VALUES (?,?,?,?,?,?,?,?)
+"""
+
+SQL_INSERT_BLOCK = """
+    INSERT INTO block (
+        day_id,
+        time_start,
+
+        num_incoming_regular,
+        num_incoming_oversize,
+        num_incoming_combined,
+
+        num_outgoing_regular,
+        num_outgoing_oversize,
+        num_outgoing_combined,
+
+        num_on_hand_regular,
+        num_on_hand_oversize,
+        num_on_hand_combined,
+
+        num_fullest_regular,
+        num_fullest_oversize,
+        num_fullest_combined,
+
+        time_fullest_regular,
+        time_fullest_oversize,
+        time_fullest_combined,
+
+        time_start_min
+    )
+    VALUES (?,?,  ?,?,?,  ?,?,?,  ?,?,?,  ?,?,?, ?,?,?, ?)
+"""
+
+
+def day_values(td: TrackerDay, summary: DaySummary) -> tuple:
+    """Values for a DAY row, from date to bikes_registered."""
+    whole_day = summary.whole_day
+    return (
+        str(whole_day.date),
+        str(whole_day.time_open),
+        str(whole_day.time_closed),
+        ut.dow_int(td.date),
+        whole_day.num_parked_regular,
+        whole_day.num_parked_oversize,
+        whole_day.num_parked_combined,
+        whole_day.num_remaining_regular,
+        whole_day.num_remaining_oversize,
+        whole_day.num_remaining_combined,
+        whole_day.num_fullest_regular,
+        whole_day.num_fullest_oversize,
+        whole_day.num_fullest_combined,
+        str(whole_day.time_fullest_regular),
+        str(whole_day.time_fullest_oversize),
+        str(whole_day.time_fullest_combined),
+        td.registrations.num_registrations,
+    )
+
+
+def visit_rows(day: TrackerDay) -> list[tuple]:
+    """Values for the day's VISIT rows, except day_id."""
+    rows = []
+    for visit in day.all_visits():
+        visit: BikeVisit
+        if not visit.time_in:
+            continue
+        biketype = "R" if day.biketags[visit.tagid].bike_type == REGULAR else "O"
+
+        time_in_text = str(visit.time_in) if visit.time_in else "00:00"
+        time_out_text = str(visit.time_out) if visit.time_out else ""
+
+        rows.append(
+            (
+                time_in_text,
+                time_out_text,
+                visit.duration(day.time_closed, is_close_of_business=True),
+                biketype,
+                str(visit.tagid),
+                visit.time_in.num,
+                visit.time_out.num if visit.time_out else None,
+            )
+        )
+    return rows
+
+
+def block_rows(summary: DaySummary) -> list[tuple]:
+    """Values for the day's BLOCK rows, except day_id."""
+    rows = []
+    for block in summary.blocks.values():
+        block: PeriodDetail
+        rows.append(
+            (
+                str(block.time_start),
+                block.num_incoming[REGULAR],
+                block.num_incoming[OVERSIZE],
+                block.num_incoming[COMBINED],
+                block.num_outgoing[REGULAR],
+                block.num_outgoing[OVERSIZE],
+                block.num_outgoing[COMBINED],
+                block.num_on_hand[REGULAR],
+                block.num_on_hand[OVERSIZE],
+                block.num_on_hand[COMBINED],
+                block.num_fullest[REGULAR],
+                block.num_fullest[OVERSIZE],
+                block.num_fullest[COMBINED],
+                str(block.time_fullest[REGULAR]),
+                str(block.time_fullest[OVERSIZE]),
+                str(block.time_fullest[COMBINED]),
+                block.time_start.num,
+            )
+        )
+    return rows
+
+
 def insert_into_day(
     orgsite_id: int,
-    td: TrackerDay,
-    summary: DaySummary,
+    date: str,
+    values: tuple,
     batch_id: str,
     cursor: sqlite3.Connection.cursor,
 ) -> int:
-    """Load into the DAY table.  Returns the rowid of the record inserted. None if failed."""
+    """Load into the DAY table.  Returns the rowid of the record inserted. None if failed.
+
+    values are as from day_values().
+    """
 
     # This requires some fancy footwork in order to preserve any existing
     # environmental values (rain, temp, sunset)
@@ -392,78 +623,25 @@ def insert_into_day(
 
     # Fetch current temp and precip
     existing_temp, existing_precip = fetch_existing_weather(
-        cursor=cursor, date=td.date, orgsite_id=orgsite_id
+        cursor=cursor, date=date, orgsite_id=orgsite_id
     )
 
     # Delete existing data for this day
-    delete_one_day_data(cursor=cursor, date=td.date, orgsite_id=orgsite_id)
+    delete_one_day_data(cursor=cursor, date=date, orgsite_id=orgsite_id)
 
     if args.verbose:
         print("   Adding day summary to database.")
 
     # Save to DAY table
     cursor.execute(
-        """
-        INSERT INTO DAY (
-            orgsite_id,
-            date,
-            time_open,
-            time_closed,
-            weekday,
-
-            num_parked_regular,
-            num_parked_oversize,
-            num_parked_combined,
-
-            num_remaining_regular,
-            num_remaining_oversize,
-            num_remaining_combined,
-
-            num_fullest_regular,
-            num_fullest_oversize,
-            num_fullest_combined,
-
-            time_fullest_regular,
-            time_fullest_oversize,
-            time_fullest_combined,
-
-            bikes_registered,
-            batch,
-
-            max_temperature,
-            precipitation
-        )
-        VALUES (
-            ?,?,?,?,?,
-            ?,?,?,    ?,?,?,   ?,?,?,   ?,?,?,
-            ?,?,
-            ?,?
-        )
-    """,
+        SQL_INSERT_DAY,
         (
-            # td.org_id,  # Add org_id to TrackerDay class
-            # td.site_id,  # Add site_id to TrackerDay class
             orgsite_id,
-            summary.whole_day.date,
-            summary.whole_day.time_open,
-            summary.whole_day.time_closed,
-            ut.dow_int(td.date),
-            summary.whole_day.num_parked_regular,
-            summary.whole_day.num_parked_oversize,
-            summary.whole_day.num_parked_combined,
-            summary.whole_day.num_remaining_regular,
-            summary.whole_day.num_remaining_oversize,
-            summary.whole_day.num_remaining_combined,
-            summary.whole_day.num_fullest_regular,
-            summary.whole_day.num_fullest_oversize,
-            summary.whole_day.num_fullest_combined,
-            summary.whole_day.time_fullest_regular,
-            summary.whole_day.time_fullest_oversize,
-            summary.whole_day.time_fullest_combined,
-            td.registrations.num_registrations,
+            *values,
             batch_id,
             existing_temp,
             existing_precip,
+            *db.day_calendar_keys(date),
         ),
     )
 
@@ -472,126 +650,31 @@ def insert_into_day(
     return day_id
 
 
-
-
 def insert_into_visit(
-    day: TrackerDay,
+    rows: list[tuple],
     cursor: sqlite3.Connection.cursor,
     day_id: int,
 ) -> bool:
-    """Load this day's visits into the database."""
-    # if args.verbose:
-    #     print("   Deleting any existing visits info for this day from database.")
-    # sql_error = sql_exec_and_error(
-    #     f"DELETE FROM {TABLE_VISITS} WHERE date = '{day_totals.date}'", dbconx
-    # )
-    # if sql_error:
-    #     file_info.set_bad(f"Error deleting VISIT rows: {sql_error}")
-    #     return False
+    """Load this day's visits (as from visit_rows()) into the database."""
 
     if args.verbose:
-        print(f"   Adding {len(day.all_visits())} visits to database.")
+        print(f"   Adding {len(rows)} visits to database.")
 
-    for visit in day.all_visits():
-        visit: BikeVisit
-        if not visit.time_in:
-            continue
-        biketype = "R" if day.biketags[visit.tagid].bike_type == REGULAR else "O"
-
-        time_in_text = str(visit.time_in) if visit.time_in else "00:00"
-        time_out_text = str(visit.time_out) if visit.time_out else ""
-
-        # Save to VISIT table
-        cursor.execute(
-            """
-            INSERT INTO VISIT (
-                day_id,
-                time_in,
-                time_out,
-                duration,
-                bike_type,
-                bike_id
-            )
-
-            VALUES (?,?,?,?,?,?)
-        """,
-            (
-                day_id,
-                time_in_text,
-                time_out_text,
-                visit.duration(day.time_closed, is_close_of_business=True),
-                biketype,
-                visit.tagid,
-            ),
-        )
+    cursor.executemany(SQL_INSERT_VISIT, [(day_id, *row) for row in rows])
     return True
 
 
 def insert_into_block(
-    summary: DaySummary,
+    rows: list[tuple],
     cursor: sqlite3.Connection.cursor,
     day_id: int,
 ) -> bool:
-    """Load this day's block data into the database."""
+    """Load this day's block data (as from block_rows()) into the database."""
 
     if args.verbose:
-        print(f"   Adding {len(summary.blocks)} data blocks to database.")
-
-    for block in summary.blocks.values():
-        block: PeriodDetail
-        # Save to BLOCK table
-        cursor.execute(
-            """
-            INSERT INTO block (
-
-                day_id,
-                time_start,
+        print(f"   Adding {len(rows)} data blocks to database.")
 
-                num_incoming_regular,
-                num_incoming_oversize,
-                num_incoming_combined,
-
-                num_outgoing_regular,
-                num_outgoing_oversize,
-                num_outgoing_combined,
-
-                num_on_hand_regular,
-                num_on_hand_oversize,
-                num_on_hand_combined,
-
-                num_fullest_regular,
-                num_fullest_oversize,
-                num_fullest_combined,
-
-                time_fullest_regular,
-                time_fullest_oversize,
-                time_fullest_combined
-
-
-            )
-
-            VALUES (?,?,  ?,?,?,  ?,?,?,  ?,?,?,  ?,?,?, ?,?,?)
-        """,
-            (
-                day_id,
-                block.time_start,
-                block.num_incoming[REGULAR],
-                block.num_incoming[OVERSIZE],
-                block.num_incoming[COMBINED],
-                block.num_outgoing[REGULAR],
-                block.num_outgoing[OVERSIZE],
-                block.num_outgoing[COMBINED],
-                block.num_on_hand[REGULAR],
-                block.num_on_hand[OVERSIZE],
-                block.num_on_hand[COMBINED],
-                block.num_fullest[REGULAR],
-                block.num_fullest[OVERSIZE],
-                block.num_fullest[COMBINED],
-                block.time_fullest[REGULAR],
-                block.time_fullest[OVERSIZE],
-                block.time_fullest[COMBINED],
-            ),
-        )
+    cursor.executemany(SQL_INSERT_BLOCK, [(day_id, *row) for row in rows])
     return True
 
 
@@ -607,17 +690,24 @@ def insert_into_dataloads(
             {COL_DATAFILE},
             {COL_TIMESTAMP},
             {COL_FINGERPRINT},
-            {COL_BATCH}
-        ) VALUES (
-            '{day_id}',
-            '{file_info.name}',
-            '{file_info.timestamp}',
-            '{file_info.fingerprint}',
-            '{batch}'
-        ) """
+            {COL_BATCH},
+            {COL_SIZE},
+            {COL_MTIME}
+        ) VALUES (?,?,?,?,?,?,?) """
     cursor = dbconx.cursor()
     try:
-        cursor.execute(sql)
+        cursor.execute(
+            sql,
+            (
+                day_id,
+                file_info.name,
+                file_info.timestamp,
+                file_info.fingerprint,
+                batch,
+                file_info.size,
+                file_info.mtime,
+            ),
+        )
     except tuple(SQL_MODERATE_ERRORS) as e:
         print(f"Non-fatal error occurred: {e}")
         return False
@@ -710,45 +800,133 @@ def _sanitize_day_visits(day: TrackerDay) -> list[str]:
             else:
                 biketag.status = biketag.IN_USE
 
+    # Visits were changed directly, not through BikeTag methods
+    day.invalidate_event_index()
+
     return notes
 
 
-def read_datafile(filename: str) -> tuple[TrackerDay, DaySummary]:
-    """Read and prepare one filename into TrackerDay & DaySummary obects."""
-    file_info: FileInfo = Statuses.files[filename]
+def prepare_datafile(filename: str) -> PreparedDay:
+    """Read, check & summarize one datafile into rows for the database.
 
-    if not os.path.isfile(filename):
-        file_info.set_bad("File not found")
-        return None, None
+    This reports nothing and changes no shared state (record_prepared()
+    does that) so that it can run in a worker process.
+    """
+    prepared = PreparedDay(filename=filename)
 
-    if args.verbose:
-        print(f"Reading {filename}:")
+    if not os.path.isfile(filename):
+        prepared.found = False
+        prepared.errors.append("File not found")
+        return prepared
 
     try:
         day = TrackerDay.load_from_file(filename)
     except (TrackerDayError, BikeTagError) as e:
-        msg = f"Error reading file {filename=}: {e}. Skipping file."
-        file_info.set_bad(msg)
-        # print(msg)
-        return None, None
+        prepared.errors.append(f"Error reading file {filename=}: {e}. Skipping file.")
+        return prepared
 
     lint_msgs = day.lint_check(strict_datetimes=True, allow_quick_checkout=True)
     if lint_msgs:
-        repair_notes = _sanitize_day_visits(day)
-        if repair_notes:
-            file_info.error_list.extend([f"AUTO-REPAIR: {note}" for note in repair_notes])
-            if args.verbose:
-                print(f"   Auto-repaired visits in {filename}:")
-                for note in repair_notes:
-                    print(f"      {note}")
+        prepared.repair_notes = _sanitize_day_visits(day)
         lint_msgs = day.lint_check(strict_datetimes=True, allow_quick_checkout=True)
         if lint_msgs:
-            msg = [f"Errors reading datafile {filename}:"] + lint_msgs
-            file_info.set_bad(msg)
-            return None, None
+            prepared.errors.append([f"Errors reading datafile {filename}:"] + lint_msgs)
+            return prepared
 
     day_summary = DaySummary(day=day, as_of_when="24:00")
-    return day, day_summary
+    prepared.date = day.date
+    prepared.site_handle = day.site_handle
+    prepared.site_name = day.site_name
+    prepared.day_values = day_values(day, day_summary)
+    prepared.visit_rows = visit_rows(day)
+    prepared.block_rows = block_rows(day_summary)
+    return prepared
+
+
+def record_prepared(prepared: PreparedDay) -> bool:
+    """Report how preparing a datafile went, into its FileInfo.
+
+    Returns True if the datafile is ready to write to the database.
+    """
+    file_info: FileInfo = Statuses.files[prepared.filename]
+
+    if prepared.found and args.verbose:
+        print(f"Reading {prepared.filename}:")
+
+    if prepared.repair_notes:
+        file_info.error_list.extend(
+            [f"AUTO-REPAIR: {note}" for note in prepared.repair_notes]
+        )
+        if args.verbose:
+            print(f"   Auto-repaired visits in {prepared.filename}:")
+            for note in prepared.repair_notes:
+                print(f"      {note}")
+
+    for error_msg in prepared.errors:
+        file_info.set_bad(error_msg)
+
+    return not prepared.errors
+
+
+def fetch_or_insert_orgsite_id(
+    cursor: sqlite3.Connection.cursor, org_id: int, prepared: PreparedDay
+) -> int:
+    """Fetch the orgsite_id for a prepared datafile, adding the site if new."""
+    orgsite_id = db.fetch_orgsite_id(
+        cursor=cursor,
+        site_handle=prepared.site_handle,
+        maybe_org_id=org_id,
+        null_ok=True,
+    )
+    if orgsite_id is None:
+        if args.verbose:
+            print(f"  Adding new orgsite {args.org=},{prepared.site_handle=}")
+        orgsite_id = insert_new_orgsite(
+            cursor=cursor,
+            org_id=org_id,
+            site_handle=prepared.site_handle,
+            site_name=prepared.site_name,
+        )
+    return orgsite_id
+
+
+def write_prepared_day(
+    prepared: PreparedDay,
+    orgsite_id: int,
+    batch: str,
+    cursor: sqlite3.Connection.cursor,
+    dbconx: sqlite3.Connection,
+) -> None:
+    """Write one prepared datafile's rows (within the caller's transaction)."""
+    if args.verbose:
+        print(
+            f"   Date:{prepared.date}  "
+            f"Open:{prepared.day_values[1]}-{prepared.day_values[2]}"
+            f"  Visits:{prepared.num_parked}  "
+            f"Leftover:{prepared.num_remaining}  "
+            f"Registrations:{prepared.day_values[-1]}"
+        )
+
+    day_id = insert_into_day(
+        orgsite_id=orgsite_id,
+        date=prepared.date,
+        values=prepared.day_values,
+        batch_id=batch,
+        cursor=cursor,
+    )
+    insert_into_visit(
+        rows=prepared.visit_rows,
+        cursor=cursor,
+        day_id=day_id,
+    )
+    insert_into_block(
+        rows=prepared.block_rows,
+        cursor=cursor,
+        day_id=day_id,
+    )
+    insert_into_dataloads(
+        Statuses.files[prepared.filename], day_id=day_id, batch=batch, dbconx=dbconx
+    )
 
 
 def one_datafile_into_db(filename: str, batch, dbconx) -> str:
@@ -764,8 +942,8 @@ def one_datafile_into_db(filename: str, batch, dbconx) -> str:
     This should create then destroy a cursor, which means rollback or commit.
     """
 
-    day, day_summary = read_datafile(filename=filename)
-    if day is None or day_summary is None:
+    prepared = prepare_datafile(filename)
+    if not record_prepared(prepared):
         return None
 
     # Datafile fully loaded, now start db stuff
@@ -774,54 +952,12 @@ def one_datafile_into_db(filename: str, batch, dbconx) -> str:
         print("   Fetching org and orgsize ids")
     org_id = db.fetch_org_id(cursor=cursor, org_handle=args.org)
     if org_id is None:
-        raise DBError(f"No org matches {args.org_handle}")
-    orgsite_id = db.fetch_orgsite_id(
-        cursor=cursor, site_handle=day.site_handle, maybe_org_id=org_id, null_ok=True
-    )
-    if orgsite_id is None:
-        if args.verbose:
-            print(f"  Adding new orgsite {args.org=},{day.site_handle=}")
-        orgsite_id = insert_new_orgsite(
-            cursor=cursor,
-            org_id=org_id,
-            site_handle=day.site_handle,
-            site_name=day.site_name,
-        )
-
-    if args.verbose:
-        print(
-            f"   Date:{day.date}  Open:{day.time_open}-{day.time_closed}"
-            f"  Visits:{day_summary.whole_day.num_parked_combined}  "
-            f"Leftover:{day_summary.whole_day.num_remaining_combined}  "
-            f"Registrations:{day.registrations.num_registrations}"
-        )
+        raise DBError(f"No org matches {args.org}")
+    orgsite_id = fetch_or_insert_orgsite_id(cursor, org_id, prepared)
 
     # Save data to database
     try:
-
-        day_id = insert_into_day(
-            td=day,
-            summary=day_summary,
-            orgsite_id=orgsite_id,
-            batch_id=batch,
-            cursor=cursor,
-        )
-        insert_into_visit(
-            day=day,
-            cursor=cursor,
-            day_id=day_id,
-        )
-        insert_into_block(
-            summary=day_summary,
-            cursor=cursor,
-            day_id=day_id,
-        )
-        # day_tags_context_into_db(file_info, day, day_totals, batch, dbconx)
-        # day_blocks_into_db()
-
-        insert_into_dataloads(
-            Statuses.files[filename], day_id=day_id, batch=batch, dbconx=dbconx
-        )
+        write_prepared_day(prepared, orgsite_id, batch, cursor, dbconx)
 
     except (sqlite3.Error, DBError) as err:
         print(f"Error:{err}", file=sys.stderr)
@@ -834,11 +970,58 @@ def one_datafile_into_db(filename: str, batch, dbconx) -> str:
     dbconx.commit()  # commit as one datafile transaction
 
     if args.verbose:
-        print(
-            f"   Committed {day_summary.whole_day.num_parked_combined} visits for {day.date}."
-        )
+        print(f"   Committed {prepared.num_parked} visits for {prepared.date}.")
+
+    return prepared.date
+
+
+def datafiles_into_db_parallel(
+    filenames: list[str], batch: str, dbconx: sqlite3.Connection, jobs: int
+) -> None:
+    """Record datafiles to the database, reading them in worker processes.
+
+    A pool of 'jobs' processes reads, checks & summarizes the datafiles
+    while this process writes their rows to the database, in filename
+    order, as they come in.  Rows are written in transactions of up to
+    FILES_PER_TRANSACTION datafiles; each datafile is written inside its
+    own savepoint so that one that fails is rolled back without losing
+    the others.  Reporting is per datafile, as with one_datafile_into_db().
+    """
+    cursor = dbconx.cursor()
+    if args.verbose:
+        print(f"Reading datafiles with {jobs} worker processes.")
+        print("   Fetching org id")
+    org_id = db.fetch_org_id(cursor=cursor, org_handle=args.org)
+    if org_id is None:
+        raise DBError(f"No org matches {args.org}")
 
-    return day.date
+    num_in_transaction = 0
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            for prepared in pool.map(prepare_datafile, filenames, chunksize=4):
+                if not record_prepared(prepared):
+                    continue
+                if not dbconx.in_transaction:
+                    cursor.execute("BEGIN;")
+                cursor.execute("SAVEPOINT datafile;")
+                try:
+                    orgsite_id = fetch_or_insert_orgsite_id(cursor, org_id, prepared)
+                    write_prepared_day(prepared, orgsite_id, batch, cursor, dbconx)
+                except (sqlite3.Error, DBError) as err:
+                    print(f"Error:{err}", file=sys.stderr)
+                    cursor.execute("ROLLBACK TO datafile;")
+                    cursor.execute("RELEASE datafile;")
+                    continue
+                cursor.execute("RELEASE datafile;")
+                num_in_transaction += 1
+                if num_in_transaction >= FILES_PER_TRANSACTION:
+                    dbconx.commit()
+                    num_in_transaction = 0
+                if args.verbose:
+                    print(f"   Wrote {prepared.num_parked} visits for {prepared.date}.")
+        dbconx.commit()
+    finally:
+        cursor.close()
 
 
 def sql_begin_transaction(dbconx: sqlite3.Connection) -> sqlite3.Connection.cursor:
@@ -866,6 +1049,213 @@ def sql_exec_and_error(sql_statement: str, dbconx) -> int:
     return ""
 
 
+def split_schema_indexes(schema_sql: str) -> tuple[str, list[str]]:
+    """Split a schema script into (script without indexes, CREATE INDEX statements)."""
+    # Drop comments first so that commented-out indexes aren't picked up
+    schema_sql = re.sub(r"/\*.*?\*/", "", schema_sql, flags=re.DOTALL)
+    schema_sql = re.sub(r"--[^\n]*", "", schema_sql)
+    index_re = re.compile(
+        r"^\s*CREATE\s+(?:UNIQUE\s+)?INDEX\b[^;]*;", re.IGNORECASE | re.MULTILINE
+    )
+    indexes = [m.group(0).strip() for m in index_re.finditer(schema_sql)]
+    return index_re.sub("", schema_sql), indexes
+
+
+def create_rebuild_database(
+    rebuild_file: str, database_file: str
+) -> tuple[sqlite3.Connection, list[str]]:
+    """Create a fresh database to rebuild into, tuned for bulk loading.
+
+    The tables come from create_database.sql, but its indexes are returned
+    (for finish_rebuild() to make) rather than created.  Orgs and sites are
+    copied from the live database, if there is one, so their ids stay the same.
+    """
+    if os.path.exists(rebuild_file):  # Left from a rebuild that didn't finish
+        os.remove(rebuild_file)
+    with open(REBUILD_SCHEMA, "r", encoding="utf-8") as f:
+        tables_sql, indexes = split_schema_indexes(f.read())
+
+    if args.verbose:
+        print(f"Creating new database {rebuild_file} (indexes deferred).")
+    dbconx = sqlite3.connect(rebuild_file)
+    live_exists = os.path.exists(database_file)
+    if live_exists:
+        # finish_rebuild() copies pages to the live database, so (as a
+        # WAL database can't change page size) they must be the same size
+        dbconx.execute("ATTACH DATABASE ? AS live;", (database_file,))
+        page_size = dbconx.execute("PRAGMA live.page_size;").fetchone()[0]
+        dbconx.execute(f"PRAGMA main.page_size={int(page_size)};")
+    # WAL rather than no journal at all, so a datafile that fails can be rolled back
+    dbconx.execute("PRAGMA main.journal_mode=WAL;")
+    dbconx.execute("PRAGMA synchronous=OFF;")
+    dbconx.execute(f"PRAGMA cache_size={REBUILD_CACHE_SIZE};")
+    dbconx.execute("PRAGMA foreign_keys=OFF;")
+    dbconx.executescript(tables_sql)
+
+    if live_exists:
+        if args.verbose:
+            print(f"Copying orgs and sites from {database_file}.")
+        dbconx.execute("INSERT OR REPLACE INTO org SELECT * FROM live.org;")
+        dbconx.execute("INSERT OR REPLACE INTO orgsite SELECT * FROM live.orgsite;")
+        dbconx.commit()
+        dbconx.execute("DETACH DATABASE live;")
+
+    return dbconx, indexes
+
+
+def finish_rebuild(
+    dbconx: sqlite3.Connection,
+    indexes: list[str],
+    rebuild_file: str,
+    database_file: str,
+) -> None:
+    """Finish a rebuilt database and move it into place as the live database.
+
+    Carries over weather data from the live database, makes the indexes,
+    analyzes, then copies the new database over the old one.
+
+    The copy is made by SQLite (Connection.backup()) in one transaction,
+    not by renaming the file: readers still connected to a live WAL
+    database would otherwise go on using its old -wal and -shm files
+    with the new file.  Anyone reading the live database sees either
+    all the old one or all the new one.
+    """
+    if os.path.exists(database_file):
+        if args.verbose:
+            print(f"Copying weather data from {database_file}.")
+        dbconx.execute("ATTACH DATABASE ? AS live;", (database_file,))
+        dbconx.execute(
+            """
+            UPDATE day SET (max_temperature, precipitation) = (
+                SELECT l.max_temperature, l.precipitation FROM live.day l
+                WHERE l.orgsite_id = day.orgsite_id AND l.date = day.date
+            )
+            WHERE EXISTS (
+                SELECT 1 FROM live.day l
+                WHERE l.orgsite_id = day.orgsite_id AND l.date = day.date
+            );
+            """
+        )
+        dbconx.commit()
+        dbconx.execute("DETACH DATABASE live;")
+
+    if args.verbose:
+        print(f"Creating {len(indexes)} indexes.")
+    for index_sql in indexes:
+        dbconx.execute(index_sql)
+    dbconx.commit()
+    if args.verbose:
+        print("Making rollups and day curves.")
+    rollups.refresh_rollups(dbconx)
+    day_curves.refresh_day_curves(dbconx)
+    if args.verbose:
+        print("Analyzing.")
+    dbconx.execute("ANALYZE;")
+    dbconx.commit()
+    # Out of WAL, which (being in the file header) would otherwise be copied too
+    dbconx.execute("PRAGMA main.journal_mode=DELETE;")
+
+    if os.path.exists(database_file):
+        if args.verbose:
+            print(f"Copying rebuilt database over {database_file}.")
+        liveconx = sqlite3.connect(database_file)
+        try:
+            # Retries (every half second) while the live database is being written
+            dbconx.backup(liveconx, sleep=0.5)
+        except sqlite3.Error as e:
+            print(
+                f"Unable to copy rebuilt database over {database_file}: {e}\n"
+                f"The rebuilt database is left in {rebuild_file}.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        finally:
+            liveconx.close()
+            dbconx.close()
+        os.remove(rebuild_file)
+        return
+
+    # No live database, so no one reading it: just move the new file there
+    dbconx.close()
+    if args.verbose:
+        print(f"Moving rebuilt database to {database_file}.")
+    with open(rebuild_file, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(rebuild_file, database_file)
+    try:
+        folder_fd = os.open(os.path.dirname(os.path.abspath(database_file)), os.O_RDONLY)
+        try:
+            os.fsync(folder_fd)
+        finally:
+            os.close(folder_fd)
+    except OSError:
+        pass
+
+
+def rebuild_problem(sql_errors: int) -> str:
+    """Return why a rebuilt database is not fit to replace the live one ("" if it is)."""
+    num_bad = Statuses.num_files(STATUS_BAD)
+    if num_bad:
+        return f"{num_bad} {ut.plural(num_bad, 'datafile')} had errors."
+    if sql_errors or Statuses.errors:
+        return "There were errors while loading."
+    if not Statuses.num_files(STATUS_GOOD):
+        return "No datafiles were loaded."
+    return ""
+
+
+def abandon_rebuild(
+    dbconx: sqlite3.Connection, rebuild_file: str, database_file: str, problem: str
+) -> None:
+    """Discard a rebuilt database, leaving the live one as it was, and exit."""
+    dbconx.close()
+    for filepath in (rebuild_file, f"{rebuild_file}-wal", f"{rebuild_file}-shm"):
+        if os.path.exists(filepath):
+            os.remove(filepath)
+    if not args.quiet:
+        print_summary()
+    print(
+        f"{problem}\nRebuild abandoned; {database_file} has not been changed.",
+        file=sys.stderr,
+    )
+    sys.exit(1)
+
+
+def update_rollups(dbconx: sqlite3.Connection, batch: str) -> None:
+    """Bring the rollups and day curves up to date with this batch's days.
+
+    If the database doesn't have their tables yet, they are made and
+    filled from all its days.
+    """
+    if rollups.assure_rollup_tables(dbconx):
+        if args.verbose:
+            print("Making rollup tables for all days.")
+        rollups.refresh_rollups(dbconx)
+    elif batch:
+        dates = [
+            row[0]
+            for row in dbconx.execute(
+                "SELECT DISTINCT date FROM day WHERE batch = ?", (batch,)
+            )
+        ]
+        num_periods = rollups.refresh_rollups(dbconx, dates)
+        if args.verbose:
+            print(f"Updated rollups for {num_periods} periods.")
+
+    if day_curves.assure_day_curve_table(dbconx):
+        if args.verbose:
+            print("Making day curves for all days.")
+        day_curves.refresh_day_curves(dbconx)
+    elif batch:
+        day_ids = [
+            row[0]
+            for row in dbconx.execute("SELECT id FROM day WHERE batch = ?", (batch,))
+        ]
+        num_days = day_curves.refresh_day_curves(dbconx, day_ids)
+        if args.verbose:
+            print(f"Updated day curves for {num_days} days.")
+
+
 def get_args() -> argparse.Namespace:
     """Get program arguments."""
 
@@ -900,6 +1290,19 @@ def get_args() -> argparse.Namespace:
         default=DEFAULT_ORG,
         help=f"Organization org_handle (default: '{DEFAULT_ORG}')",
     )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="build a new database from scratch from the datafiles, "
+        "then copy it over the existing one",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="read datafiles in this many parallel processes (default: 1)",
+    )
     parser.add_argument(
         "dataglob", type=str, nargs="+", help="Fileglob(s) of datafiles to load"
     )
@@ -910,6 +1313,10 @@ def get_args() -> argparse.Namespace:
         prog_args.quiet = False
         print("Arg --verbose set; ignoring arg --quiet.")
 
+    if prog_args.jobs < 1:
+        print("Error: --jobs must be at least 1", file=sys.stderr)
+        sys.exit(1)
+
     if prog_args.tail_only and prog_args.newest_only:
         print(
             "Error: Cannot use --newest-only and --tail-only together", file=sys.stderr
@@ -966,23 +1373,49 @@ def convert_paths_to_absolute(files: list) -> list:
     return abs_paths
 
 
-def get_files_metadata(maybe_datafiles: list):
-    """Gets metadata for the files, loads it into Statuses class."""
+def get_files_metadata(maybe_datafiles: list, loaded_stats: dict = None):
+    """Gets metadata for the files, loads it into Statuses class.
+
+    loaded_stats is as from get_load_file_stats().  A file whose size
+    and mtime are as when it was last loaded ok gets the fingerprint
+    recorded then; only the others are read, several at once.
+    """
+    loaded_stats = loaded_stats or {}
+    to_fingerprint = []
     for f in maybe_datafiles:
         f_info = FileInfo(f)
         Statuses.files[f] = f_info
-        if not os.path.exists(f):
+        try:
+            stat = os.stat(f)
+        except OSError:
             f_info.set_bad("File not found")
             continue
         f_info.basename = os.path.basename(f)
-        f_info.fingerprint = get_file_fingerprint(f)
-        if not f_info.fingerprint:
-            f_info.set_bad("Cannot read md5sum")
-            continue
-        f_info.timestamp = get_file_timestamp(f)
-        if not f_info.timestamp:
-            f_info.set_bad("Cannot read timestamp")
-            continue
+        f_info.size = stat.st_size
+        f_info.mtime = stat.st_mtime_ns
+        f_info.timestamp = datetime.fromtimestamp(stat.st_mtime).strftime(
+            "%Y-%m-%dT%H:%M:%S"
+        )
+        size, mtime, fingerprint = loaded_stats.get(f, (None, None, None))
+        if fingerprint and size == f_info.size and mtime == f_info.mtime:
+            f_info.fingerprint = fingerprint
+        else:
+            to_fingerprint.append(f_info)
+
+    if args.verbose:
+        print(
+            f"Fingerprinting {len(to_fingerprint)} files; "
+            f"{len(maybe_datafiles) - len(to_fingerprint)} others "
+            "unchanged since loaded or not found."
+        )
+    with concurrent.futures.ThreadPoolExecutor() as pool:
+        fingerprints = pool.map(
+            get_file_fingerprint, [f_info.name for f_info in to_fingerprint]
+        )
+        for f_info, fingerprint in zip(to_fingerprint, fingerprints):
+            f_info.fingerprint = fingerprint
+            if not f_info.fingerprint:
+                f_info.set_bad("Cannot read md5sum")
 
     ok_datafiles = [
         f for f in Statuses.files if Statuses.files[f].status == STATUS_GOOD
@@ -1101,10 +1534,6 @@ def main():
     if not args.quiet:
         print(f"Load requested for {len(ordered_file_list)} files.")
 
-    if args.verbose:
-        print("Calculating metadata of datafiles.")
-    get_files_metadata(ordered_file_list)
-
     database_file = DB_FILENAME or ""
     if not database_file:
         print(
@@ -1112,9 +1541,13 @@ def main():
             file=sys.stderr,
         )
         sys.exit(1)
-    if args.verbose:
-        print(f"Connecting to database {database_file}.")
-    dbconx = db.db_connect(database_file)
+    if args.rebuild:
+        rebuild_file = f"{database_file}.rebuild.tmp"
+        dbconx, deferred_indexes = create_rebuild_database(rebuild_file, database_file)
+    else:
+        if args.verbose:
+            print(f"Connecting to database {database_file}.")
+        dbconx = db.db_connect(database_file)
     if not dbconx:
         print(f"Error: unable to connect to db {database_file}", file=sys.stderr)
         try:
@@ -1123,6 +1556,17 @@ def main():
             print(f"Error {e}")
         sys.exit(1)
 
+    if args.verbose:
+        print("Calculating metadata of datafiles.")
+    try:
+        assure_dataloads_columns(dbconx)
+        add_derived_columns(dbconx, verbose=args.verbose)
+        loaded_stats = get_load_file_stats(dbconx)
+    except tuple(SQL_MODERATE_ERRORS + SQL_CRITICAL_ERRORS) as e:
+        print(f"SQL error: {e}", file=sys.stderr)
+        sys.exit(1)
+    get_files_metadata(ordered_file_list, loaded_stats)
+
     if args.tail_only:
         skip_non_tail_dups(ordered_file_list)
 
@@ -1148,6 +1592,22 @@ def main():
         ):
             finfo.status = STATUS_SKIP_GOOD
 
+    # Skipped files that had to be fingerprinted (eg loaded before sizes &
+    # mtimes were recorded, or touched since) won't need it next time.
+    try:
+        update_load_file_stats(
+            dbconx,
+            [
+                finfo
+                for finfo in Statuses.files.values()
+                if finfo.status == STATUS_SKIP_GOOD
+                and loaded_stats.get(finfo.name, (None, None))[:2]
+                != (finfo.size, finfo.mtime)
+            ],
+        )
+    except tuple(SQL_MODERATE_ERRORS) as e:
+        print(f"SQL error: {e}", file=sys.stderr)
+
     if not args.quiet:
         num_skipped = Statuses.num_files(STATUS_SKIP_GOOD)
         # ut.squawk(f"{num_skipped=},{args.force=},{args.quiet=}")
@@ -1166,7 +1626,7 @@ def main():
 
     num_good = Statuses.num_files(STATUS_GOOD)
 
-    if num_good:
+    if num_good and not args.rebuild:
         if args.verbose:
             print("Assuring foreign key constraints are enabled.")
         try:
@@ -1182,6 +1642,7 @@ def main():
         finally:
             cursor.close()
 
+    if num_good:
         batch = Statuses.start_time[
             :-3
         ]  # For some reason batch does not include seconds
@@ -1189,22 +1650,48 @@ def main():
             print(f"Batch ID is {batch}.")
 
     # Load the datafiles.
-    for file_name in sorted(
+    files_to_load = sorted(
         [f.name for f in Statuses.files.values() if f.status == STATUS_GOOD]
-    ):
+    )
+    sql_errors = 0
+    if args.jobs > 1 and len(files_to_load) > 1:
+        try:
+            datafiles_into_db_parallel(files_to_load, batch, dbconx, args.jobs)
+        except tuple(SQL_MODERATE_ERRORS) as e:
+            print(f"SQL error: {e}")
+            sql_errors += 1
+        except tuple(SQL_CRITICAL_ERRORS) as e:
+            print(f"Serious SQL error occurred: {e}")
+            raise
+        files_to_load = []
+    for file_name in files_to_load:
         try:
             one_datafile_into_db(file_name, batch, dbconx)
 
         except tuple(SQL_MODERATE_ERRORS) as e:
             print(f"SQL error: {e}")
+            sql_errors += 1
             continue
         except tuple(SQL_CRITICAL_ERRORS) as e:
             print(f"Serious SQL error occurred: {e}")
             raise
 
-    if args.verbose:
-        print("Closing database connection.")
-    dbconx.close()
+    if args.rebuild:
+        problem = rebuild_problem(sql_errors)
+        if problem:
+            abandon_rebuild(dbconx, rebuild_file, database_file, problem)
+        finish_rebuild(dbconx, deferred_indexes, rebuild_file, database_file)
+    else:
+        try:
+            update_rollups(dbconx, batch if num_good else "")
+        except tuple(SQL_MODERATE_ERRORS) as e:
+            print(f"SQL error updating rollups: {e}", file=sys.stderr)
+        except tuple(SQL_CRITICAL_ERRORS) as e:
+            print(f"Serious SQL error occurred: {e}", file=sys.stderr)
+            raise
+        if args.verbose:
+            print("Closing database connection.")
+        dbconx.close()
 
     if not args.quiet:
         print_summary()
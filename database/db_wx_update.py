@@ -26,6 +26,7 @@ from typing import Dict, Optional
 
 from database import database_base_config as cfg
 import database.tt_dbutil as db
+import database.tt_rollups as rollups
 
 
 @dataclass
@@ -206,24 +207,32 @@ def apply_site(
         if newvals.precipitation is not None and (
             force or current["precipitation"] is None
         ):
-            assignments.append(f"precipitation = {newvals.precipitation}")
+            assignments.append(("precipitation", newvals.precipitation))
             current["precipitation"] = newvals.precipitation
             precip_updates += 1
 
         if newvals.max_temperature is not None and (
             force or current["max_temperature"] is None
         ):
-            assignments.append(f"max_temperature = {newvals.max_temperature}")
+            assignments.append(("max_temperature", newvals.max_temperature))
             current["max_temperature"] = newvals.max_temperature
             max_temp_updates += 1
 
         if not assignments:
             continue
 
-        sql = f"update day set {', '.join(assignments)} where date = '{date}';"
-        db.db_update(ttdb, sql, commit=False)
+        sql = (
+            f"update day set {', '.join(f'{col} = ?' for col, _ in assignments)} "
+            "where date = ?;"
+        )
+        db.db_update(
+            ttdb, sql, commit=False, params=[val for _, val in assignments] + [date]
+        )
         if verbose:
-            print(f"[{label}] {date}: {'; '.join(assignments)}")
+            print(
+                f"[{label}] {date}: "
+                f"{'; '.join(f'{col} = {val}' for col, val in assignments)}"
+            )
 
     return precip_updates, max_temp_updates
 
@@ -257,6 +266,8 @@ def main():
         print("No DAY rows found before cutoff; nothing to update.")
         sys.exit(0)
 
+    original = {date: dict(vals) for date, vals in existing.items()}
+
     if not have_blanks(existing) and not args.force:
         print(f"No empty weather fields before cutoff {cutoff_date}; exiting.")
         sys.exit(0)
@@ -303,6 +314,13 @@ def main():
 
     db.db_commit(ttdb)
 
+    # Totals of the weather are in the rollups of the days that changed.
+    changed_dates = [
+        date for date, vals in existing.items() if vals != original.get(date)
+    ]
+    if changed_dates and rollups.rollup_tables_exist(ttdb.cursor()):
+        rollups.refresh_rollups(ttdb, changed_dates)
+
     if per_site_stats:
         label_width = max(len(label) for label, _, _, _ in per_site_stats)
         note_width = max(len(note) for _, _, _, note in per_site_stats)
@@ -50,6 +50,13 @@ import sqlite3
 from dataclasses import dataclass
 from typing import List, Tuple, Optional, Dict, Callable
 from datetime import datetime, timedelta, date
+from pathlib import Path as _P
+
+_BIN_DIR = _P(__file__).resolve().parent.parent  # .../TagTracker/bin
+if str(_BIN_DIR) not in sys.path:
+    sys.path.insert(0, str(_BIN_DIR))
+from common.tt_occupancy import OccupancyCurve  # pylint:disable=wrong-import-position
+from database.tt_day_curves import fetch_day_curves  # pylint:disable=wrong-import-position
 
 # Optional acceleration / numeric helpers
 try:
@@ -218,49 +225,6 @@ def load_visits_for_days(
         return by_day
 
 
-def counts_for_time(visits: List[Tuple[VTime, Optional[VTime]]], t: VTime) -> Tuple[int, int, int, int, int]:
-    """Compute counts relative to time t.
-
-    Returns tuple:
-      before_ins, after_ins, outs_up_to_t, ins_next_hr, outs_next_hr
-    """
-    t_end = VTime(min(t.num + 60, 24 * 60))
-    before_ins = sum(1 for tin, _ in visits if tin and tin <= t)
-    after_ins = sum(1 for tin, _ in visits if tin and tin > t)
-    outs_up_to_t = sum(1 for _, tout in visits if tout and tout <= t)
-    ins_next = sum(1 for tin, _ in visits if tin and t < tin <= t_end)
-    outs_next = sum(1 for _, tout in visits if tout and t < tout <= t_end)
-    return before_ins, after_ins, outs_up_to_t, ins_next, outs_next
-
-
-def peak_future_occupancy(visits: List[Tuple[VTime, Optional[VTime]]], t: VTime, close: VTime) -> Tuple[int, VTime]:
-    """Compute max occupancy from t to close and when it occurs.
-
-    Occupancy at t is (#in<=t - #out<=t). Then walk events in (t, close].
-    """
-    occ_now = sum(1 for tin, _ in visits if tin and tin <= t) - sum(
-        1 for _, tout in visits if tout and tout <= t
-    )
-    # Build event stream between t and close
-    events: List[Tuple[int, int]] = []  # (time_min, delta)
-    for tin, tout in visits:
-        if tin and t < tin <= close:
-            events.append((int(VTime(tin).num), +1))
-        if tout and t < tout <= close:
-            events.append((int(VTime(tout).num), -1))
-    events.sort(key=lambda x: (x[0], -x[1]))  # ins before outs at same minute
-
-    peak = occ_now
-    peak_time = t
-    occ = occ_now
-    for tm, delta in events:
-        occ += delta
-        if occ > peak:
-            peak = occ
-            peak_time = VTime(tm)
-    return peak, peak_time
-
-
 def simple_match_prediction(
     train_pairs: List[Tuple[int, int]],  # (before, after)
     x: int,
@@ -459,9 +423,26 @@ def backtest(
     if not days:
         print("No days in range")
         return
-    # Preload visits for target days and all potential training days if not supplied
+    # Stored occupancy curves (if the database has them) for all days
+    try:
+        curves: Dict[int, OccupancyCurve] = fetch_day_curves(
+            conn.cursor(), [d.day_id for d in days]
+        )
+    except sqlite3.Error:
+        curves = {}
+    # Preload visits for days without stored curves if not supplied
     if visits_by_day is None:
-        visits_by_day = load_visits_for_days(conn, days)
+        visits_by_day = load_visits_for_days(
+            conn, [d for d in days if d.day_id not in curves]
+        )
+
+    # Other days' occupancy curves are built once, on first use
+
+    def curve_for_day(day_id: int) -> OccupancyCurve:
+        if day_id not in curves:
+            curves[day_id] = OccupancyCurve(visits_by_day.get(day_id, []))
+        return curves[day_id]
+
     # Default result writer prints to screen when not provided
     if result_writer is None:
         def result_writer(s: str = "") -> None:  # type: ignore[no-redef]
@@ -552,12 +533,12 @@ def backtest(
             continue
 
         # Fetch visits for train & target from cache
-        target_visits = visits_by_day.get(target.day_id, [])
+        target_curve = curve_for_day(target.day_id)
 
         t = VTime(target.time_open)
         while t < target.time_closed:
             # counts for target
-            before, after_true, outs_to_t, ins_next_true, outs_next_true = counts_for_time(target_visits, t)
+            before, after_true, outs_to_t, ins_next_true, outs_next_true = target_curve.counts_at(t)
             frac_elapsed = 0.0
             total_span = max(1, target.time_closed.num - target.time_open.num)
             if t.num >= target.time_open.num:
@@ -571,8 +552,8 @@ def backtest(
             nxh_pairs_act_2d = []  # ((before, frac_elapsed), activity)
             peaks_pairs_2d = []  # ((before, frac_elapsed), peak)
             for d in train_days:
-                vlist = visits_by_day.get(d.day_id, [])
-                b, a, _, ins_nxh, outs_nxh = counts_for_time(vlist, t)
+                curve = curve_for_day(d.day_id)
+                b, a, _, ins_nxh, outs_nxh = curve.counts_at(t)
                 # compute fraction elapsed relative to that day's schedule
                 tot = max(1, d.time_closed.num - d.time_open.num)
                 f = 0.0
@@ -582,7 +563,7 @@ def backtest(
                 nxh_pairs_net.append((b, ins_nxh - outs_nxh))
                 nxh_pairs_act.append((b, ins_nxh + outs_nxh))
                 # peak future for that day
-                p, _pt = peak_future_occupancy(vlist, t, d.time_closed)
+                p, _pt = curve.peak_after(t, d.time_closed)
                 peaks_pairs.append((b, p))
                 if compare_time_feature:
                     train_pairs_2d.append(((float(b), float(f)), float(a)))
@@ -704,14 +685,14 @@ def backtest(
 
             # Peak fullness from now to close (median across matched days)
             # Compute target peak
-            peak_true, _ = peak_future_occupancy(target_visits, t, target.time_closed)
+            peak_true, _ = target_curve.peak_after(t, target.time_closed)
             # Compute per-day peaks for matched days
             peaks = []
             for d in train_days:
-                vlist = visits_by_day.get(d.day_id, [])
-                b, _a, *_rest = counts_for_time(vlist, t)
+                curve = curve_for_day(d.day_id)
+                b, _a, *_rest = curve.counts_at(t)
                 if abs(b - before) <= variance:
-                    p, _pt = peak_future_occupancy(vlist, t, d.time_closed)
+                    p, _pt = curve.peak_after(t, d.time_closed)
                     peaks.append(p)
             if peaks:
                 pred_peak_sm = int(statistics.median(peaks))
@@ -967,10 +948,6 @@ def main():
         outln("=" * 72)
         outln("Single fixed configuration as above")
 
-        # Preload visits once for this window and reuse
-        days_window = fetch_days(conn, start, end)
-        visits_cache = load_visits_for_days(conn, days_window)
-
         backtest(
             conn,
             start=start,
@@ -982,7 +959,6 @@ def main():
             lookback_days=365,
             compare_time_feature=True,
             result_writer=outln,
-            visits_by_day=visits_cache,
             lr_min_n=args.lr_min_n,
             lr2_min_n=args.lr2_min_n,
             ridge_l2=args.ridge_l2,
@@ -68,6 +68,8 @@ import json
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
+from common.tt_occupancy import OccupancyCurve
+from database.tt_day_curves import fetch_day_curves
 from database import database_base_config
 
 # Optional acceleration / numeric helpers
@@ -215,39 +217,6 @@ def fetch_visits_by_day(
     return by_day
 
 
-def counts_for_time(
-    visits: List[Tuple[VTime, Optional[VTime]]], t: VTime
-) -> Tuple[int, int, int, int, int]:
-    t_end = VTime(min(t.num + 60, 24 * 60))
-    before_ins = sum(1 for tin, _ in visits if tin and tin <= t)
-    after_ins = sum(1 for tin, _ in visits if tin and tin > t)
-    outs_up_to_t = sum(1 for _, tout in visits if tout and tout <= t)
-    ins_next = sum(1 for tin, _ in visits if tin and t < tin <= t_end)
-    outs_next = sum(1 for _, tout in visits if tout and t < tout <= t_end)
-    return before_ins, after_ins, outs_up_to_t, ins_next, outs_next
-
-
-def peak_all_day(visits: List[Tuple[VTime, Optional[VTime]]]) -> Tuple[int, VTime]:
-    events: List[Tuple[int, int]] = []
-    for tin, tout in visits:
-        if tin:
-            events.append((int(tin.num), +1))
-        if tout:
-            events.append((int(tout.num), -1))
-    if not events:
-        return 0, VTime("00:00")
-    events.sort(key=lambda x: (x[0], -x[1]))
-    occ = 0
-    peak = 0
-    pt = VTime(events[0][0])
-    for tm, d in events:
-        occ += d
-        if occ > peak:
-            peak = occ
-            pt = VTime(tm)
-    return peak, pt
-
-
 def percentiles(vals: List[float], plo=0.05, phi=0.95) -> Tuple[float, float]:
     if not vals:
         return None, None  # type: ignore[return-value]
@@ -534,7 +503,15 @@ def main():
 
     conn = db_connect(args.db)
     days = fetch_days(conn, args.start, args.end)
-    visits_by_day = fetch_visits_by_day(conn, days)
+    # Stored occupancy curves where the database has them, else from visits
+    curves_by_day = fetch_day_curves(conn.cursor(), [d.id for d in days])
+    visits_by_day = fetch_visits_by_day(
+        conn, [d for d in days if d.id not in curves_by_day]
+    )
+    curves_by_day.update(
+        (day_id, OccupancyCurve(visits)) for day_id, visits in visits_by_day.items()
+    )
+    no_visits = OccupancyCurve([])
     bins = parse_bins(args.time_bins)
 
     # Collect residuals per model/measure/bin
@@ -573,15 +550,16 @@ def main():
         sims = similar_days(days[:idx], tgt, args.open_tol, args.close_tol)
         if not sims:
             continue
-        v_tgt = visits_by_day.get(tgt.id, [])
+        c_tgt = curves_by_day.get(tgt.id, no_visits)
         t = VTime(tgt.time_open.num)
         while t.num < tgt.time_closed.num:
             before, after_true, outs_to_t, ins_next_true, outs_next_true = (
-                counts_for_time(v_tgt, t)
+                c_tgt.counts_at(t)
             )
             # Observed measures
             act_true = ins_next_true + outs_next_true
-            peak_true, ptime_true = peak_all_day(v_tgt)
+            peak_true, ptime_true = c_tgt.peak()
+            ptime_true = VTime(ptime_true)
             # Frac elapsed
             span = max(1, tgt.time_closed.num - tgt.time_open.num)
             frac = max(0.0, min(1.0, (t.num - tgt.time_open.num) / span))
@@ -601,14 +579,14 @@ def main():
             peaks: List[int] = []
             ptimes: List[int] = []
             for d in sims:
-                v = visits_by_day.get(d.id, [])
-                b, a, _o, insn, outn = counts_for_time(v, t)
+                c = curves_by_day.get(d.id, no_visits)
+                b, a, _o, insn, outn = c.counts_at(t)
                 befores.append(int(b))
                 afters.append(int(a))
                 acts.append(int(insn + outn))
-                p, pt = peak_all_day(v)
+                p, pt = c.peak()
                 peaks.append(int(p))
-                ptimes.append(int(pt.num))
+                ptimes.append(int(pt))
 
             def percentile_bounds_int(
                 values: List[int],
@@ -704,13 +682,13 @@ def main():
             rec_peaks_vals: List[int] = []
             rec_ptimes_vals: List[int] = []
             for d in rec_days:
-                v = visits_by_day.get(d.id, [])
-                _b_r, a_r, _o_r, ins_r, out_r = counts_for_time(v, t)
+                c = curves_by_day.get(d.id, no_visits)
+                _b_r, a_r, _o_r, ins_r, out_r = c.counts_at(t)
                 rec_afters_vals.append(int(a_r))
                 rec_acts_vals.append(int(ins_r + out_r))
-                p_r, pt_r = peak_all_day(v)
+                p_r, pt_r = c.peak()
                 rec_peaks_vals.append(int(p_r))
-                rec_ptimes_vals.append(int(pt_r.num))
+                rec_ptimes_vals.append(int(pt_r))
 
             def med_recent(arr: List[int]) -> Optional[int]:
                 return int(statistics.median(arr)) if arr else None
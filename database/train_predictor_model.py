@@ -152,7 +152,7 @@ def main(argv: List[str]) -> int:
     _ensure_folder(out_dir)
 
     # Connect DB
-    conn = db.db_connect(db_path)
+    conn = db.db_connect(db_path, db.DB_READ_ONLY)
     if conn is None:
         print("ERROR: Could not open DB.", file=sys.stderr)
         return 2
@@ -0,0 +1,144 @@
+"""Stored per-day occupancy curves of the TagTracker database.
+
+The DAY_CURVE table holds each day's cumulative ins and outs, minute by
+minute, as saved by OccupancyCurve.to_blobs().  The estimator and its
+backtest & calibration scripts read them with fetch_day_curves() rather
+than rebuilding each day's curve from its visits.
+
+db_from_datafile keeps DAY_CURVE up to date (alongside the rollups) by
+calling refresh_day_curves() for the days it loads.
+
+Copyright (C) 2023-2025 Julias Hocking & Todd Glover
+
+    Notwithstanding the licensing information below, this code may not
+    be used in a commercial (for-profit, non-profit or government) setting
+    without the copyright-holder's written consent.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import sqlite3
+from typing import Iterable
+
+from common.tt_occupancy import NUM_SLOTS, OccupancyCurve
+
+# The table.  This is also in create_database.sql; it is here so
+# that it can be added to databases made before it existed.
+DAY_CURVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS DAY_CURVE (
+    day_id INTEGER PRIMARY KEY,
+    first_event INTEGER,
+    ins_through BLOB,
+    outs_through BLOB,
+    FOREIGN KEY (day_id) REFERENCES DAY (id) ON DELETE CASCADE
+);
+"""
+
+# Bytes in each blob: a 16-bit count for each minute 00:00 to 24:00
+BLOB_BYTES = NUM_SLOTS * 2
+
+# Largest number of ids to put in one "IN (...)" list
+_IDS_PER_QUERY = 500
+
+
+def assure_day_curve_table(conn: sqlite3.Connection) -> bool:
+    """Make the DAY_CURVE table if it is not there.
+
+    Returns True if it had to be made (and so needs a full refresh_day_curves()).
+    """
+    if day_curve_table_exists(conn.cursor()):
+        return False
+    conn.executescript(DAY_CURVE_SCHEMA)
+    return True
+
+
+def day_curve_table_exists(cursor: sqlite3.Cursor) -> bool:
+    """Tell whether this database has the DAY_CURVE table."""
+    row = cursor.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' "
+        "AND UPPER(name) = 'DAY_CURVE'"
+    ).fetchone()
+    return row[0] == 1
+
+
+def _chunks(day_ids: list[int]):
+    for start in range(0, len(day_ids), _IDS_PER_QUERY):
+        yield day_ids[start : start + _IDS_PER_QUERY]
+
+
+def refresh_day_curves(
+    conn: sqlite3.Connection, day_ids: Iterable[int] = None, commit: bool = True
+) -> int:
+    """Recompute the stored curves of these days from their visits.
+
+    If day_ids is None, the curves of all days are remade.  Curves of
+    days no longer in DAY are dropped either way.  Returns the number
+    of days recomputed.
+    """
+    cursor = conn.cursor()
+    if day_ids is None:
+        cursor.execute("DELETE FROM day_curve;")
+        day_ids = [row[0] for row in cursor.execute("SELECT id FROM day;")]
+    else:
+        cursor.execute(
+            "DELETE FROM day_curve WHERE day_id NOT IN (SELECT id FROM day);"
+        )
+    day_ids = sorted(set(day_ids))
+
+    for some_ids in _chunks(day_ids):
+        visits_by_day = {day_id: [] for day_id in some_ids}
+        for day_id, time_in, time_out in cursor.execute(
+            "SELECT day_id, time_in_min, time_out_min FROM visit "
+            f"WHERE day_id IN ({','.join('?' * len(some_ids))})",
+            some_ids,
+        ):
+            visits_by_day[day_id].append((time_in, time_out))
+        cursor.executemany(
+            "INSERT OR REPLACE INTO day_curve "
+            "(day_id, first_event, ins_through, outs_through) VALUES (?,?,?,?);",
+            [
+                (day_id, *OccupancyCurve(visits).to_blobs())
+                for day_id, visits in visits_by_day.items()
+            ],
+        )
+    cursor.close()
+    if commit:
+        conn.commit()
+    return len(day_ids)
+
+
+def fetch_day_curves(
+    cursor: sqlite3.Cursor, day_ids: Iterable[int]
+) -> dict[int, OccupancyCurve]:
+    """Fetch the stored curves of these days, as {day_id: OccupancyCurve}.
+
+    Days with no (usable) stored curve are left out, as is everything
+    if the database has no DAY_CURVE table; callers build those from
+    the days' visits instead.
+    """
+    curves = {}
+    if not day_curve_table_exists(cursor):
+        return curves
+    for some_ids in _chunks(sorted(set(day_ids))):
+        for day_id, first_event, ins_blob, outs_blob in cursor.execute(
+            "SELECT day_id, first_event, ins_through, outs_through FROM day_curve "
+            f"WHERE day_id IN ({','.join('?' * len(some_ids))})",
+            some_ids,
+        ):
+            if len(ins_blob or b"") == len(outs_blob or b"") == BLOB_BYTES:
+                curves[day_id] = OccupancyCurve.from_blobs(
+                    first_event, ins_blob, outs_blob
+                )
+    return curves
@@ -23,14 +23,18 @@ Copyright (C) 2023-2024 Julias Hocking & Todd Glover
 
 import sqlite3
 import sys
+import datetime
 import os
-from typing import Iterable
+import pathlib
+import threading
+from typing import Iterable, TYPE_CHECKING
 
 # from collections import defaultdict
 from dataclasses import dataclass, field
 from common.tt_statistics import VisitStats
+import database.tt_rollups as rollups
+import database.database_base_config as dbcfg
 
-from common.tt_trackerday import TrackerDay
 from common.tt_daysummary import DaySummary, DayTotals, PeriodDetail
 from common.tt_tag import TagID
 from common.tt_time import VTime
@@ -40,6 +44,9 @@ from common.tt_bikevisit import BikeVisit
 import common.tt_util as ut
 import common.tt_constants as k
 
+if TYPE_CHECKING:
+    from common.tt_trackerday import TrackerDay
+
 
 # These errors will mean a rollback but keep going
 SQL_MODERATE_ERRORS = [
@@ -58,6 +65,35 @@ SQL_CRITICAL_ERRORS = [
 ]
 
 
+# Connection profiles for db_connect()
+DB_READ_WRITE = "rw"  # Loaders & updaters
+DB_READ_ONLY = "ro"  # Reports, web pages & other readers
+
+# Settings for each connection profile.
+DB_PROFILE_PRAGMAS = {
+    DB_READ_WRITE: ("PRAGMA cache_size=-32768;",),  # KiB
+    DB_READ_ONLY: (
+        "PRAGMA query_only=ON;",
+        "PRAGMA mmap_size=268435456;",  # Bytes
+        "PRAGMA cache_size=-32768;",  # KiB
+        "PRAGMA temp_store=MEMORY;",
+    ),
+}
+
+# WAL is a setting of the database file, not of a connection, so
+# read-write connections set it (or unset it) as DB_WAL_MODE says.
+DB_WAL_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",  # Safe with WAL
+)
+
+# Prepared statements to keep per connection (the sqlite3 default is 128)
+DB_CACHED_STATEMENTS = 256
+
+# Open connections, per thread: {(filepath, profile): (connection, file identity)}
+_connections = threading.local()
+
+
 class DBRow:
     """A generic class for holding database rows.
 
@@ -74,7 +110,7 @@ def fetch_org_id(cursor: sqlite3.Connection.cursor, org_handle: str) -> int:
     """Fetch the org id."""
     org_handle = org_handle.strip().lower()
     row = cursor.execute(
-        f"SELECT id FROM org WHERE org_handle = '{org_handle}';"
+        "SELECT id FROM org WHERE org_handle = ?;", (org_handle,)
     ).fetchone()
 
     if not row:
@@ -110,7 +146,8 @@ def fetch_orgsite_id(
         org_id = maybe_org_id
 
     row = cursor.execute(
-        f"SELECT id FROM orgsite WHERE site_handle = '{site_handle}' AND org_id = {org_id};",
+        "SELECT id FROM orgsite WHERE site_handle = ? AND org_id = ?;",
+        (site_handle, org_id),
     ).fetchone()
     if not row:
         if null_ok:
@@ -141,7 +178,7 @@ def fetch_date_range_limits(conn_or_cursor, orgsite_id: int=1) -> tuple[str, str
 
     # Execute the query and fetch all rows
     raw_rows = curs.execute(
-        f"select min(date),max(date) from day where orgsite_id = {orgsite_id}"
+        "select min(date),max(date) from day where orgsite_id = ?", (orgsite_id,)
     ).fetchone()
     if should_close_cursor:
         curs.close()
@@ -203,7 +240,7 @@ def fetch_day_id(
 
     if maybe_orgsite_id is None:
         orgsite_id = fetch_orgsite_id(
-            cursor == cursor,
+            cursor=cursor,
             site_handle=maybe_site_handle,
             maybe_org_id=maybe_org_id,
             maybe_org_handle=maybe_org_handle,
@@ -212,7 +249,7 @@ def fetch_day_id(
         orgsite_id = maybe_orgsite_id
 
     row = cursor.execute(
-        f"SELECT id FROM day WHERE orgsite_id = {orgsite_id} AND date = '{date}';"
+        "SELECT id FROM day WHERE orgsite_id = ? AND date = ?;", (orgsite_id, date)
     ).fetchone()
 
     if not row:
@@ -227,6 +264,74 @@ def fetch_day_id(
     return this_id
 
 
+def day_calendar_keys(date: str) -> tuple[int, int, int]:
+    """Return the (year, month, iso_week) DAY columns for an ISO date.
+
+    iso_week is the ISO year & week number as one integer, YYYYWW.
+    """
+    iso_year, iso_week, _ = datetime.date.fromisoformat(date).isocalendar()
+    return int(date[:4]), int(date[5:7]), iso_year * 100 + iso_week
+
+
+@dataclass
+class DayFilter:
+    """Which of an orgsite's days a query is about.
+
+    where() makes SQL predicates on DAY's own columns (no per-row
+    functions), so that they can use DAY's (orgsite_id, weekday, date)
+    and (orgsite_id, date) indexes.  Attributes left empty don't filter.
+    """
+
+    orgsite_id: int = 1
+    start_date: str = ""
+    end_date: str = ""
+    weekdays: Iterable[int] = ()  # ISO weekdays, 1 (Monday) .. 7 (Sunday)
+    year: int = None
+    month: int = None
+    iso_week: int = None  # YYYYWW, as in day_calendar_keys()
+
+    @staticmethod
+    def parse_weekdays(dow_value) -> list[int]:
+        """Return the valid ISO weekdays in a dow value (int or "1,2,3" str), sorted."""
+        if isinstance(dow_value, int):
+            tokens = [dow_value]
+        else:
+            tokens = [
+                int(token)
+                for token in str(dow_value or "").split(",")
+                if token.strip().isdigit()
+            ]
+        return sorted({d for d in tokens if 1 <= d <= 7})
+
+    def where(self, table_alias: str = "") -> tuple[str, list]:
+        """Return (SQL predicate, its parameters) that selects these days.
+
+        table_alias is the alias (if any) of DAY in the query.
+        """
+        prefix = f"{table_alias}." if table_alias else ""
+        clauses = []
+        params = []
+        if self.orgsite_id:
+            clauses.append(f"{prefix}orgsite_id = ?")
+            params.append(self.orgsite_id)
+        weekdays = sorted(set(self.weekdays or ()))
+        if weekdays and weekdays != list(range(1, 8)):
+            clauses.append(f"{prefix}weekday IN ({','.join('?' * len(weekdays))})")
+            params += weekdays
+        if self.start_date:
+            clauses.append(f"{prefix}date >= ?")
+            params.append(self.start_date)
+        if self.end_date:
+            clauses.append(f"{prefix}date <= ?")
+            params.append(self.end_date)
+        for column in ("year", "month", "iso_week"):
+            value = getattr(self, column)
+            if value is not None:
+                clauses.append(f"{prefix}{column} = ?")
+                params.append(value)
+        return " AND ".join(clauses) if clauses else "1 = 1", params
+
+
 def fetch_day_id_list(
     cursor: sqlite3.Connection.cursor,
     orgsite_id: int,
@@ -249,6 +354,7 @@ def db_fetch(
     conn_or_cursor,  #: sqlite3.Connection | sqlite3.Connection.cursor,
     select_statement: str,
     col_names: list[str] = None,
+    params: Iterable = (),
 ) -> list[DBRow]:
     """
     Fetch a select statement into a list of database rows.
@@ -256,6 +362,8 @@ def db_fetch(
     The col_names list converts the database column names into
     other names. E.g., ['fred', 'smorg'] will save the value of
     the first column in attribute 'fred' and the second in 'smorg'.
+
+    params are values for any '?' placeholders in select_statement.
     """
 
     def flatten(raw_column_name: str) -> str:
@@ -276,7 +384,7 @@ def db_fetch(
         should_close_cursor = False
 
     # Execute the query and fetch all rows
-    raw_rows = curs.execute(select_statement).fetchall()
+    raw_rows = curs.execute(select_statement, tuple(params)).fetchall()
 
     # Generate column names if not provided
     if col_names is None:
@@ -314,40 +422,34 @@ def db_latest(ttdb: sqlite3.Connection) -> str:
     return f"Latest DB: load={latest_load}; event={latest_event}"
 
 
-def fetch_day_totals(cursor: sqlite3.Cursor, day_id: int) -> DayTotals:
-    """Fetch the full DayTotals -- essentially a single DAY row."""
-
-    column_names = [
-        "date",
-        "time_open",
-        "time_closed",
-        "weekday",
-        "num_parked_regular",
-        "num_parked_oversize",
-        "num_parked_combined",
-        "num_remaining_regular",
-        "num_remaining_oversize",
-        "num_remaining_combined",
-        "num_fullest_regular",
-        "num_fullest_oversize",
-        "num_fullest_combined",
-        "time_fullest_regular",
-        "time_fullest_oversize",
-        "time_fullest_combined",
-        "bikes_registered",
-        "max_temperature",
-        "precipitation",
-    ]
+# DAY columns that make up a DayTotals (with the same names)
+DAY_TOTALS_COLUMNS = [
+    "date",
+    "time_open",
+    "time_closed",
+    "weekday",
+    "num_parked_regular",
+    "num_parked_oversize",
+    "num_parked_combined",
+    "num_remaining_regular",
+    "num_remaining_oversize",
+    "num_remaining_combined",
+    "num_fullest_regular",
+    "num_fullest_oversize",
+    "num_fullest_combined",
+    "time_fullest_regular",
+    "time_fullest_oversize",
+    "time_fullest_combined",
+    "bikes_registered",
+    "max_temperature",
+    "precipitation",
+]
 
-    row = cursor.execute(
-        f"SELECT {', '.join(column_names)} FROM day WHERE id = ?", (day_id,)
-    ).fetchone()
-
-    if not row:
-        raise TagTrackerError(f"No day data for day_id={day_id}")
 
+def _day_totals_from_row(row: Iterable) -> DayTotals:
+    """Make a DayTotals from a row of DAY_TOTALS_COLUMNS."""
     # Horrifying dark magic to assign the db values to the DayTotals object
-    totals = DayTotals(**dict(zip(column_names, row)))
+    totals = DayTotals(**dict(zip(DAY_TOTALS_COLUMNS, row)))
 
     totals.time_open = VTime(totals.time_open)
     totals.time_closed = VTime(totals.time_closed)
@@ -360,6 +462,44 @@ def fetch_day_totals(cursor: sqlite3.Cursor, day_id: int) -> DayTotals:
     return totals
 
 
+def fetch_day_totals(cursor: sqlite3.Cursor, day_id: int) -> DayTotals:
+    """Fetch the full DayTotals -- essentially a single DAY row."""
+
+    row = cursor.execute(
+        f"SELECT {', '.join(DAY_TOTALS_COLUMNS)} FROM day WHERE id = ?", (day_id,)
+    ).fetchone()
+
+    if not row:
+        raise TagTrackerError(f"No day data for day_id={day_id}")
+
+    return _day_totals_from_row(row)
+
+
+def fetch_day_totals_range(
+    cursor: sqlite3.Cursor,
+    orgsite_id: int,
+    min_date: str = "",
+    max_date: str = "",
+    weekdays: Iterable[int] = None,
+) -> list[DayTotals]:
+    """Fetch the DayTotals for all of an orgsite's days in a date range, in one query.
+
+    Dates default as in fetch_day_id_list().  If weekdays (ISO 1..7)
+    are given, only days on those weekdays are fetched.
+    Returned in date order.
+    """
+
+    where, params = DayFilter(
+        orgsite_id=orgsite_id,
+        start_date=min_date or "0000-00-00",
+        end_date=max_date or ut.date_str("today"),
+        weekdays=weekdays,
+    ).where()
+    sql = f"SELECT {', '.join(DAY_TOTALS_COLUMNS)} FROM day WHERE {where} ORDER BY date;"
+
+    return [_day_totals_from_row(row) for row in cursor.execute(sql, params)]
+
+
 def fetch_day_blocks(
     cursor: sqlite3.Connection.cursor, day_id: int
 ) -> dict[VTime, PeriodDetail]:
@@ -453,15 +593,21 @@ def fetch_day_summary(
     )
 
 
-def db2day(ttdb: sqlite3.Connection, day_id: int) -> TrackerDay:
+def db2day(ttdb: sqlite3.Connection, day_id: int) -> "TrackerDay":
     """Create one day's TrackerDay from the database."""
+    # Imported here so that the web reports, which never call this,
+    # don't load TrackerDay and the client modules it needs.
+    # pylint:disable-next=import-outside-toplevel
+    from common.tt_trackerday import TrackerDay
+
     # Do we have info about the day?  Need its open/close times
     if not isinstance(day_id, int):
         ut.squawk(f"db2day received non-int {day_id=}")
     curs = ttdb.cursor()
     row = curs.execute(
         "select date, time_open,time_closed,bikes_registered "
-        f"from day where day.id = {day_id}"
+        "from day where day.id = ?",
+        (day_id,),
     ).fetchone()
     if not row:
         return None
@@ -560,182 +706,200 @@ class MultiDayTotals:
         start_date: str = "",
         end_date: str = "",
     ) -> "MultiDayTotals":
+        """Fetch the totals for an orgsite's days in a date range.
 
-        start_date = start_date or "0000-00-00"
-        end_date = end_date or "9999-99-99"
-
-        totals = MultiDayTotals()
-
-        # Query for combined aggregates from DAY
-        query_combined = """
-        SELECT
-            SUM(num_parked_combined) AS total_parked_combined,
-            SUM(num_parked_regular) AS total_parked_regular,
-            SUM(num_parked_oversize) AS total_parked_oversize,
-            SUM(bikes_registered) AS total_bikes_registered,
-            MAX(bikes_registered) AS max_bikes_registered,
-            MIN(max_temperature) AS min_max_temperature,
-            MAX(max_temperature) AS max_max_temperature,
-            SUM(precipitation) AS total_precipitation,
-            MAX(precipitation) AS max_precipitation,
-            SUM(num_remaining_combined) AS total_remaining_combined,
-            MAX(num_remaining_combined) AS max_remaining_combined,
-            SUM((julianday(time_closed) - julianday(time_open)) * 24) AS total_hours_open,
-            COUNT(DISTINCT date) AS total_days_open
-        FROM DAY
-        WHERE orgsite_id = ? AND date BETWEEN ? AND ?;
+        Whole weeks, months & years are read from the rollup tables (if
+        the database has them); only the rest of the range is aggregated
+        from DAY & VISIT.
         """
 
-        # Query for max combined bikes
-        query_max_combined_bikes = """
-        SELECT
-            num_parked_combined AS max_parked_combined,
-            date AS max_parked_combined_date
-        FROM DAY
-        WHERE orgsite_id = ? AND date BETWEEN ? AND ?
-        ORDER BY num_parked_combined DESC
-        LIMIT 1;
-        """
+        start_date = start_date or "0000-00-00"
+        end_date = end_date or "9999-99-99"
 
-        # Query for max fullest combined
-        query_max_fullest_combined = """
-        SELECT
-            num_fullest_combined AS max_fullest_combined,
-            date AS max_fullest_combined_date
-        FROM DAY
-        WHERE orgsite_id = ? AND date BETWEEN ? AND ?
-        ORDER BY num_fullest_combined DESC
-        LIMIT 1;
-        """
+        with conn:
+            cursor = conn.cursor()
+            pieces, histogram = rollups.fetch_range_pieces(
+                cursor, orgsite_id, start_date, end_date
+            )
+            cursor.close()
 
-        # Query for total visit hours
-        query_total_visit_hours = """
-        SELECT
-            SUM(duration) / 60.0 AS total_visit_hours
-        FROM
-            VISIT
-        WHERE
-            day_id IN (
-                SELECT id FROM DAY
-                WHERE orgsite_id = ?
-                AND date BETWEEN ? AND ?
-            );
-        """
+        totals = MultiDayTotals()
 
-        # Query for individual visit durations
-        query_visit_durations = """
-        SELECT
-            duration
-        FROM
-            VISIT
-        WHERE
-            day_id IN (
-                SELECT id FROM DAY
-                WHERE orgsite_id = ?
-                AND date BETWEEN ? AND ?
-            );
-        """
+        def _combined(column: str, func):
+            vals = [p[column] for p in pieces if p[column] is not None]
+            return func(vals) if vals else None
+
+        totals.total_days_open = sum(p["total_days_open"] for p in pieces)
+        for column in (
+            "total_parked_combined",
+            "total_parked_regular",
+            "total_parked_oversize",
+            "total_bikes_registered",
+            "total_precipitation",
+            "total_remaining_combined",
+            "total_hours_open",
+        ):
+            setattr(totals, column, _combined(column, sum))
+        for column in (
+            "max_bikes_registered",
+            "max_max_temperature",
+            "max_precipitation",
+            "max_remaining_combined",
+        ):
+            setattr(totals, column, _combined(column, max))
+        totals.min_max_temperature = _combined("min_max_temperature", min)
+
+        # Maxima that go with a date (the earliest, if tied)
+        for column in ("max_parked_combined", "max_fullest_combined"):
+            date_column = f"{column}_date"
+            candidates = [p for p in pieces if p[date_column]]
+            if candidates:
+                best = min(
+                    candidates,
+                    key=lambda p, c=column: (-(p[c] or 0), p[f"{c}_date"]),
+                )
+                setattr(totals, column, best[column])
+                setattr(totals, date_column, best[date_column])
 
-        with conn:
-            cursor = conn.cursor()
+        total_visit_minutes = _combined("total_visit_minutes", sum)
+        totals.total_visit_hours = (
+            None if total_visit_minutes is None else total_visit_minutes / 60.0
+        )
 
-            # Execute combined query and set results to totals
-            cursor.execute(query_combined, (orgsite_id, start_date, end_date))
-            result = cursor.fetchone()
-            (
-                totals.total_parked_combined,
-                totals.total_parked_regular,
-                totals.total_parked_oversize,
-                totals.total_bikes_registered,
-                totals.max_bikes_registered,
-                totals.min_max_temperature,
-                totals.max_max_temperature,
-                totals.total_precipitation,
-                totals.max_precipitation,
-                totals.total_remaining_combined,
-                totals.max_remaining_combined,
-                totals.total_hours_open,
-                totals.total_days_open,
-            ) = result
-
-            # Execute max combined bikes query and set results to totals
-            cursor.execute(query_max_combined_bikes, (orgsite_id, start_date, end_date))
-            max_combined_bikes_result = cursor.fetchone()
-            if max_combined_bikes_result:
-                (
-                    totals.max_parked_combined,
-                    totals.max_parked_combined_date,
-                ) = max_combined_bikes_result
-
-            # Execute max fullest combined query and set results to totals
-            cursor.execute(
-                query_max_fullest_combined, (orgsite_id, start_date, end_date)
-            )
-            max_fullest_combined_result = cursor.fetchone()
-            if max_fullest_combined_result:
-                (
-                    totals.max_fullest_combined,
-                    totals.max_fullest_combined_date,
-                ) = max_fullest_combined_result
-
-            # Execute total visit hours query and set results to totals
-            cursor.execute(query_total_visit_hours, (orgsite_id, start_date, end_date))
-            total_visit_hours_result = cursor.fetchone()
-            if total_visit_hours_result:
-                totals.total_visit_hours = total_visit_hours_result[0]
-
-            # Execute individual visit durations query and process results
-            cursor.execute(query_visit_durations, (orgsite_id, start_date, end_date))
-            visit_durations = [row[0] for row in cursor.fetchall()]
-
-            # Calculate mean, median, and modes from visit_durations
-            if visit_durations:
-                stats = VisitStats(visit_durations)
-                totals.visits_mean = stats.mean
-                totals.visits_median = stats.median
-                totals.visits_modes = stats.modes
-                totals.num_visit_modes_occurrences = stats.mode_occurences
+        # Calculate mean, median, and modes from the visit durations
+        if histogram:
+            stats = VisitStats.from_histogram(histogram)
+            totals.visits_mean = stats.mean
+            totals.visits_median = stats.median
+            totals.visits_modes = stats.modes
+            totals.num_visit_modes_occurrences = stats.mode_occurences
 
         # Now 'totals' object has all the required data populated
         return totals
 
 
-def db_connect(db_file) -> sqlite3.Connection:
-    """Connect to (existing) SQLite database. Returns None if fails."""
+def db_connect(db_file, profile: str = DB_READ_WRITE) -> sqlite3.Connection:
+    """Connect to (existing) SQLite database. Returns None if fails.
+
+    profile is DB_READ_WRITE or DB_READ_ONLY; see DB_PROFILE_PRAGMAS.
+
+    Connections are kept open and handed out again to later calls (from
+    the same thread, for the same file & profile), so that each one's
+    cache of prepared statements lasts.  A connection that has been
+    closed, or whose file has since been replaced (e.g. by a rebuild),
+    is replaced with a new one.
+    """
 
     if not os.path.exists(db_file):
         print(f"Database file {db_file} not found")
         return None
+    key = (os.path.abspath(db_file), profile)
+    file_id = _file_identity(db_file)
+    if not hasattr(_connections, "cache"):
+        _connections.cache = {}
+    cached = _connections.cache.get(key)
+    if cached:
+        connection, cached_file_id = cached
+        if cached_file_id == file_id and _is_open(connection):
+            return connection
+        del _connections.cache[key]
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+
     try:
-        connection = sqlite3.connect(db_file)
+        if profile == DB_READ_ONLY:
+            uri = f"{pathlib.Path(db_file).absolute().as_uri()}?mode=ro"
+            connection = sqlite3.connect(
+                uri, uri=True, cached_statements=DB_CACHED_STATEMENTS
+            )
+        else:
+            connection = sqlite3.connect(
+                db_file, cached_statements=DB_CACHED_STATEMENTS
+            )
         cursor = connection.cursor()
         tables = cursor.execute(
             "SELECT name FROM sqlite_master WHERE type='table';"
         ).fetchall()
-        cursor.close()
         if not tables:
+            cursor.close()
             print(f"Database {db_file} is empty.")
             return None
+        for pragma in DB_PROFILE_PRAGMAS[profile]:
+            cursor.execute(pragma)
+        if profile == DB_READ_WRITE:
+            _set_journal_mode(cursor)
+        cursor.close()
     except (sqlite3.Error, sqlite3.DatabaseError) as sqlite_err:
         print(f"Sqlite ERROR: {sqlite_err}")
+        if profile == DB_READ_ONLY and _is_wal_file(db_file):
+            print(
+                f"Database {db_file} is in WAL mode (DB_WAL_MODE), so reading "
+                "it needs write access to its folder."
+            )
         return None
 
+    _connections.cache[key] = (connection, file_id)
     return connection
 
 
+def _set_journal_mode(cursor: sqlite3.Cursor) -> None:
+    """Put the database in or out of WAL mode, as DB_WAL_MODE says."""
+    if getattr(dbcfg, "DB_WAL_MODE", False):
+        for pragma in DB_WAL_PRAGMAS:
+            cursor.execute(pragma)
+        return
+    if cursor.execute("PRAGMA journal_mode;").fetchone()[0].lower() == "wal":
+        try:
+            cursor.execute("PRAGMA journal_mode=DELETE;")
+        except sqlite3.OperationalError:
+            # Others have it open; leave it till next time
+            pass
+
+
+def _is_wal_file(filepath: str) -> bool:
+    """Tell whether a database file is in WAL mode (from its header)."""
+    try:
+        with open(filepath, "rb") as f:
+            header = f.read(20)
+    except OSError:
+        return False
+    return len(header) == 20 and header[18] == header[19] == 2
+
+
+def _file_identity(filepath: str) -> tuple[int, int]:
+    """Identify a file (device & inode), to know if it has been replaced."""
+    stat = os.stat(filepath)
+    return stat.st_dev, stat.st_ino
+
+
+def _is_open(connection: sqlite3.Connection) -> bool:
+    """Check whether a connection is still open."""
+    try:
+        connection.total_changes  # pylint:disable=pointless-statement
+    except sqlite3.ProgrammingError:
+        return False
+    return True
+
+
 def db_commit(db: sqlite3.Connection):
     """Just a database commit.  Only here for completeness."""
     db.commit()
 
 
-def db_update(db: sqlite3.Connection, update_sql: str, commit: bool = True) -> bool:
+def db_update(
+    db: sqlite3.Connection, update_sql: str, commit: bool = True, params: Iterable = ()
+) -> bool:
     """Execute a SQL UPDATE statement.  T/F indicates success.
 
     (This could be any SQL statement, but the error checking and
     return is based on assumption it's an UPDATE)
+
+    params are values for any '?' placeholders in update_sql.
     """
     try:
-        db.cursor().execute(update_sql)
+        db.cursor().execute(update_sql, tuple(params))
         if commit:
             db.commit()
     except (sqlite3.OperationalError, sqlite3.IntegrityError) as e:
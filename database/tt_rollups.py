@@ -0,0 +1,343 @@
+"""Per-period rollups of the TagTracker database.
+
+The ROLLUP table holds the sums & maxima of DAY (and total visit time) for
+each orgsite by ISO week, month and year.  ROLLUP_DURATION holds a histogram
+of visit durations (by the minute) for the same periods, which is enough
+to get the mean, median and modes of visit durations exactly.
+
+db_from_datafile (and db_wx_update) keep the rollups up to date by calling
+refresh_rollups() for the dates they change.  MultiDayTotals reads them
+with fetch_range_pieces(), using raw DAY/VISIT rows only for the parts of a
+date range that are not whole periods.
+
+Copyright (C) 2023-2024 Julias Hocking & Todd Glover
+
+    Notwithstanding the licensing information below, this code may not
+    be used in a commercial (for-profit, non-profit or government) setting
+    without the copyright-holder's written consent.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import sqlite3
+import collections
+import datetime
+from typing import Iterable
+
+# Rollup period types
+ROLLUP_YEAR = "Y"
+ROLLUP_MONTH = "M"
+ROLLUP_WEEK = "W"  # ISO week, Monday to Sunday
+ROLLUP_PERIOD_TYPES = (ROLLUP_YEAR, ROLLUP_MONTH, ROLLUP_WEEK)
+
+# The rollup tables.  These are also in create_database.sql; they are
+# here so that they can be added to databases made before they existed.
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ROLLUP (
+    orgsite_id INTEGER,
+    period_type TEXT CHECK (period_type IN ('Y', 'M', 'W')),
+    period_start DATE,
+    period_end DATE,
+    total_days_open INTEGER,
+    total_parked_combined INTEGER,
+    total_parked_regular INTEGER,
+    total_parked_oversize INTEGER,
+    total_bikes_registered INTEGER,
+    max_bikes_registered INTEGER,
+    min_max_temperature FLOAT,
+    max_max_temperature FLOAT,
+    total_precipitation FLOAT,
+    max_precipitation FLOAT,
+    total_remaining_combined INTEGER,
+    max_remaining_combined INTEGER,
+    total_hours_open FLOAT,
+    max_parked_combined INTEGER,
+    max_parked_combined_date DATE,
+    max_fullest_combined INTEGER,
+    max_fullest_combined_date DATE,
+    total_visit_minutes INTEGER,
+    PRIMARY KEY (orgsite_id, period_type, period_start)
+);
+CREATE TABLE IF NOT EXISTS ROLLUP_DURATION (
+    orgsite_id INTEGER,
+    period_type TEXT,
+    period_start DATE,
+    duration INTEGER,
+    num_visits INTEGER,
+    PRIMARY KEY (orgsite_id, period_type, period_start, duration)
+);
+"""
+
+# The columns of aggregate values in ROLLUP, in the order of AGGREGATES_SQL
+ROLLUP_COLUMNS = [
+    "total_days_open",
+    "total_parked_combined",
+    "total_parked_regular",
+    "total_parked_oversize",
+    "total_bikes_registered",
+    "max_bikes_registered",
+    "min_max_temperature",
+    "max_max_temperature",
+    "total_precipitation",
+    "max_precipitation",
+    "total_remaining_combined",
+    "max_remaining_combined",
+    "total_hours_open",
+    "max_parked_combined",
+    "max_parked_combined_date",
+    "max_fullest_combined",
+    "max_fullest_combined_date",
+    "total_visit_minutes",
+]
+
+# Aggregates of one orgsite's DAY & VISIT rows over a date range.
+# This is used both to make the rollups and for the parts of a date
+# range that are read directly rather than from the rollups.
+_DAYS_IN_RANGE = "orgsite_id = :orgsite_id AND date BETWEEN :start_date AND :end_date"
+AGGREGATES_SQL = f"""
+    SELECT
+        COUNT(*) AS num_days,
+        SUM(num_parked_combined),
+        SUM(num_parked_regular),
+        SUM(num_parked_oversize),
+        SUM(bikes_registered),
+        MAX(bikes_registered),
+        MIN(max_temperature),
+        MAX(max_temperature),
+        SUM(precipitation),
+        MAX(precipitation),
+        SUM(num_remaining_combined),
+        MAX(num_remaining_combined),
+        SUM((julianday(time_closed) - julianday(time_open)) * 24),
+        MAX(num_parked_combined),
+        (SELECT date FROM day WHERE {_DAYS_IN_RANGE}
+            ORDER BY num_parked_combined DESC, date LIMIT 1),
+        MAX(num_fullest_combined),
+        (SELECT date FROM day WHERE {_DAYS_IN_RANGE}
+            ORDER BY num_fullest_combined DESC, date LIMIT 1),
+        (SELECT SUM(v.duration) FROM visit v JOIN day d ON v.day_id = d.id
+            WHERE d.orgsite_id = :orgsite_id
+            AND d.date BETWEEN :start_date AND :end_date)
+    FROM day
+    WHERE {_DAYS_IN_RANGE}
+"""
+
+# Histogram of visit durations of one orgsite over a date range
+HISTOGRAM_SQL = """
+    SELECT v.duration, COUNT(*)
+    FROM visit v JOIN day d ON v.day_id = d.id
+    WHERE d.orgsite_id = :orgsite_id
+        AND d.date BETWEEN :start_date AND :end_date
+        AND v.duration IS NOT NULL
+    GROUP BY v.duration
+"""
+
+_PERIOD_KEY = (
+    "orgsite_id = :orgsite_id AND period_type = :period_type "
+    "AND period_start = :start_date"
+)
+
+
+def period_bounds(period_type: str, date: str) -> tuple[str, str]:
+    """Return (first date, last date) of the period of this type that has date."""
+    day = datetime.date.fromisoformat(date)
+    if period_type == ROLLUP_YEAR:
+        start = day.replace(month=1, day=1)
+        end = day.replace(month=12, day=31)
+    elif period_type == ROLLUP_MONTH:
+        start = day.replace(day=1)
+        next_month = (start + datetime.timedelta(days=32)).replace(day=1)
+        end = next_month - datetime.timedelta(days=1)
+    elif period_type == ROLLUP_WEEK:
+        start = day - datetime.timedelta(days=day.isoweekday() - 1)
+        end = start + datetime.timedelta(days=6)
+    else:
+        raise ValueError(f"Unknown rollup period type '{period_type}'")
+    return start.isoformat(), end.isoformat()
+
+
+def assure_rollup_tables(conn: sqlite3.Connection) -> bool:
+    """Make the rollup tables if they are not there.
+
+    Returns True if they had to be made (and so need a full refresh_rollups()).
+    """
+    if rollup_tables_exist(conn.cursor()):
+        return False
+    conn.executescript(ROLLUP_SCHEMA)
+    return True
+
+
+def rollup_tables_exist(cursor: sqlite3.Cursor) -> bool:
+    """Tell whether this database has the rollup tables."""
+    row = cursor.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' "
+        "AND UPPER(name) IN ('ROLLUP', 'ROLLUP_DURATION')"
+    ).fetchone()
+    return row[0] == 2
+
+
+def refresh_rollups(
+    conn: sqlite3.Connection, dates: Iterable[str] = None, commit: bool = True
+) -> int:
+    """Recompute the rollups of every period that includes any of these dates.
+
+    This is for every orgsite.  If dates is None, all the rollups are
+    remade from scratch.  Returns the number of periods recomputed.
+    """
+    cursor = conn.cursor()
+    if dates is None:
+        cursor.execute("DELETE FROM rollup;")
+        cursor.execute("DELETE FROM rollup_duration;")
+        dates = [row[0] for row in cursor.execute("SELECT DISTINCT date FROM day;")]
+    periods = {
+        (period_type, *period_bounds(period_type, date))
+        for date in set(dates)
+        for period_type in ROLLUP_PERIOD_TYPES
+    }
+    orgsite_ids = [row[0] for row in cursor.execute("SELECT id FROM orgsite;")]
+
+    for period_type, start_date, end_date in sorted(periods):
+        for orgsite_id in orgsite_ids:
+            key = {
+                "orgsite_id": orgsite_id,
+                "period_type": period_type,
+                "start_date": start_date,
+                "end_date": end_date,
+            }
+            cursor.execute(f"DELETE FROM rollup WHERE {_PERIOD_KEY};", key)
+            cursor.execute(f"DELETE FROM rollup_duration WHERE {_PERIOD_KEY};", key)
+            cursor.execute(
+                f"""
+                INSERT INTO rollup (orgsite_id, period_type, period_start,
+                    period_end, {', '.join(ROLLUP_COLUMNS)})
+                SELECT :orgsite_id, :period_type, :start_date, :end_date, *
+                FROM ({AGGREGATES_SQL}) WHERE num_days > 0;
+                """,
+                key,
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO rollup_duration (orgsite_id, period_type,
+                    period_start, duration, num_visits)
+                SELECT :orgsite_id, :period_type, :start_date, *
+                FROM ({HISTOGRAM_SQL});
+                """,
+                key,
+            )
+    cursor.close()
+    if commit:
+        conn.commit()
+    return len(periods)
+
+
+def plan_range(
+    start_date: str, end_date: str, data_start: str, data_end: str
+) -> list[tuple[str, str, str]]:
+    """Split a date range into whole rollup periods and runs of other days.
+
+    Returns a list of (period_type, start, end), where period_type is
+    None for a run of days to read directly from DAY/VISIT.  The start
+    and end of a rollup period are its own (so may be outside the range).
+
+    data_start and data_end are the dates of the orgsite's first and last
+    days of data.  A period that is only partly in the date range can
+    still be used if the rest of it is before or after all the data
+    (e.g. the current year, up to today).
+    """
+    start_date = max(start_date, data_start)
+    end_date = min(end_date, data_end)
+
+    def usable(period_type: str, date: str) -> tuple[str, str]:
+        """Return the bounds of the period that has date if it can be used, else None."""
+        first, last = period_bounds(period_type, date)
+        if max(first, data_start) >= date and min(last, data_end) <= end_date:
+            return first, last
+        return None
+
+    plan = []
+    date = start_date
+    while date <= end_date:
+        piece = None
+        for period_type in ROLLUP_PERIOD_TYPES:
+            bounds = usable(period_type, date)
+            if not bounds:
+                continue
+            if period_type == ROLLUP_WEEK and bounds[1][:7] != date[:7]:
+                # A week into the next month: if the month could be used
+                # instead, use days for the rest of this one.
+                if usable(ROLLUP_MONTH, period_bounds(ROLLUP_MONTH, bounds[1])[0]):
+                    continue
+            piece = (period_type, *bounds)
+            break
+        if piece:
+            plan.append(piece)
+        elif plan and plan[-1][0] is None:
+            plan[-1] = (None, plan[-1][1], date)
+        else:
+            plan.append((None, date, date))
+        date = (
+            datetime.date.fromisoformat(plan[-1][2]) + datetime.timedelta(days=1)
+        ).isoformat()
+    return plan
+
+
+def fetch_range_pieces(
+    cursor: sqlite3.Cursor, orgsite_id: int, start_date: str, end_date: str
+) -> tuple[list[dict], collections.Counter]:
+    """Fetch the aggregates for an orgsite's date range, as pieces to combine.
+
+    Returns a list of {column: value} (columns as in ROLLUP_COLUMNS), one
+    per part of the date range (only those with any days), and the
+    histogram of visit durations {minutes: num_visits} for the whole range.
+    Reads from the rollups if the database has them.
+    """
+    if rollup_tables_exist(cursor):
+        data_start, data_end = cursor.execute(
+            "SELECT MIN(date), MAX(date) FROM day WHERE orgsite_id = ?",
+            (orgsite_id,),
+        ).fetchone()
+        if data_start is None:
+            return [], collections.Counter()
+        plan = plan_range(start_date, end_date, data_start, data_end)
+    else:
+        plan = [(None, start_date, end_date)]
+
+    pieces = []
+    histogram = collections.Counter()
+    for period_type, first, last in plan:
+        key = {
+            "orgsite_id": orgsite_id,
+            "period_type": period_type,
+            "start_date": first,
+            "end_date": last,
+        }
+        if period_type:
+            row = cursor.execute(
+                f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM rollup WHERE {_PERIOD_KEY}",
+                key,
+            ).fetchone()
+            histogram_rows = cursor.execute(
+                "SELECT duration, num_visits FROM rollup_duration "
+                f"WHERE {_PERIOD_KEY}",
+                key,
+            )
+        else:
+            row = cursor.execute(AGGREGATES_SQL, key).fetchone()
+            histogram_rows = cursor.execute(HISTOGRAM_SQL, key)
+        for duration, num_visits in histogram_rows:
+            histogram[duration] += num_visits
+        if row and row[0]:
+            pieces.append(dict(zip(ROLLUP_COLUMNS, row)))
+    return pieces, histogram
@@ -87,9 +87,9 @@ args = parse_args()
 if not os.path.exists(args.database_file):
     print(f"Database file {args.database_file} not found", file=sys.stderr)
     sys.exit(1)
-database = db.db_connect(args.database_file)
+database = db.db_connect(args.database_file, db.DB_READ_ONLY)
 dbrows = db.db_fetch(
-    database, f"select max_total from day where date = '{args.date}'"
+    database, "select max_total from day where date = ?", params=(args.date,)
 )
 if not dbrows:
     print(f"No data for {args.date}", file=sys.stderr)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Check that DaySummary matches its previous (block-by-block) implementation.
+
+For checking changes to common/tt_daysummary.py.
+
+DaySummary builds its moments and blocks in one sorted pass.  This
+compares its moments (including order and tag descriptions), blocks
+and whole-day totals against the older implementation, kept here as
+the reference, which rescanned all the moments for every block.
+
+With datafiles, checks each at several as-of times.  Otherwise (or as
+well) checks synthetic days made by helpers.event_index_check.
+
+Run from the TagTracker root as:
+    python3 -m helpers.daysummary_check [datafile...]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.append("../")
+
+# pylint:disable=wrong-import-position
+import common.tt_constants as k
+from common.tt_daysummary import DaySummary, MomentDetail, PeriodDetail
+from common.tt_time import VTime
+from common.tt_trackerday import TrackerDay
+from common.tt_util import block_start
+from helpers.event_index_check import random_change, synthetic_day
+
+BIKE_TYPES = (k.REGULAR, k.OVERSIZE, k.COMBINED)
+
+
+def reference_moments(day: TrackerDay, as_of_when: VTime) -> dict:
+    """Moments as the previous implementation made them (as plain dicts)."""
+    moments = defaultdict(
+        lambda: {
+            "in": {k.REGULAR: 0, k.OVERSIZE: 0, k.COMBINED: 0},
+            "out": {k.REGULAR: 0, k.OVERSIZE: 0, k.COMBINED: 0},
+            "here": {k.REGULAR: 0, k.OVERSIZE: 0, k.COMBINED: 0},
+            "desc_in": [],
+            "desc_out": [],
+        }
+    )
+    for biketag in day.biketags.values():
+        for visit_num, visit in enumerate(biketag.visits, start=1):
+            if visit.time_in <= as_of_when:
+                bike_type = day.biketags[visit.tagid].bike_type
+                moments[visit.time_in]["in"][bike_type] += 1
+                moments[visit.time_in]["desc_in"].append(f"{visit.tagid}:{visit_num}")
+            if visit.time_out and visit.time_out <= as_of_when:
+                moments[visit.time_out]["out"][bike_type] += 1
+                moments[visit.time_out]["desc_out"].append(
+                    f"{visit.tagid}:{visit_num}"
+                )
+    here = {k.REGULAR: 0, k.OVERSIZE: 0, k.COMBINED: 0}
+    for moment_time in sorted(moments):
+        m = moments[moment_time]
+        m["in"][k.COMBINED] = m["in"][k.REGULAR] + m["in"][k.OVERSIZE]
+        m["out"][k.COMBINED] = m["out"][k.REGULAR] + m["out"][k.OVERSIZE]
+        for bike_type in BIKE_TYPES:
+            here[bike_type] += m["in"][bike_type] - m["out"][bike_type]
+            m["here"][bike_type] = here[bike_type]
+    return moments
+
+
+def reference_blocks(moments: dict) -> dict:
+    """Blocks as the previous implementation made them (rescan per block)."""
+    blocks = {}
+    if not moments:
+        return blocks
+    earliest_time = min(moments.keys())
+    latest_time = max(moments.keys())
+    day_here = {k.REGULAR: 0, k.OVERSIZE: 0, k.COMBINED: 0}
+    block_start_time = block_start(earliest_time)
+    while block_start_time.num <= latest_time.num:
+        block_end_time = VTime(block_start_time.num + k.BLOCK_DURATION - 1)
+        block = PeriodDetail(time_start=block_start_time)
+        for moment_time in sorted(moments):
+            m = moments[moment_time]
+            if block_start_time.num <= moment_time.num <= block_end_time.num:
+                for bike_type in BIKE_TYPES:
+                    block.num_incoming[bike_type] += m["in"][bike_type]
+                    block.num_outgoing[bike_type] += m["out"][bike_type]
+                    day_here[bike_type] += m["in"][bike_type] - m["out"][bike_type]
+                    if day_here[bike_type] > block.num_fullest[bike_type]:
+                        block.num_fullest[bike_type] = day_here[bike_type]
+                        block.time_fullest[bike_type] = moment_time
+        for bike_type in BIKE_TYPES:
+            block.num_on_hand[bike_type] = day_here[bike_type]
+            if not block.time_fullest[bike_type]:
+                block.num_fullest[bike_type] = block.num_on_hand[bike_type]
+                block.time_fullest[bike_type] = block_start_time
+        blocks[block_start_time] = block
+        block_start_time = VTime(block_start_time.num + k.BLOCK_DURATION)
+    return blocks
+
+
+def compare(day: TrackerDay, as_of_when: str, label: str) -> list[str]:
+    """Return a list of differences between DaySummary and the reference."""
+    summary = DaySummary(day=day, as_of_when=as_of_when)
+    ref_moments = reference_moments(day, summary.as_of_when)
+    problems = []
+    if list(summary.moments) != list(ref_moments):
+        problems.append(f"{label}: moments differ in keys or order")
+    for moment_time, ref in ref_moments.items():
+        moment: MomentDetail = summary.moments.get(moment_time)
+        if moment is None:
+            continue
+        got = {
+            "in": moment.num_incoming,
+            "out": moment.num_outgoing,
+            "here": moment.num_on_hand,
+            "desc_in": moment.tag_descriptions_incoming,
+            "desc_out": moment.tag_descriptions_outgoing,
+        }
+        if got != ref or moment.time != moment_time:
+            problems.append(f"{label}: moment {moment_time} {got} != {ref}")
+    ref_blocks = reference_blocks(ref_moments)
+    if list(summary.blocks) != list(ref_blocks):
+        problems.append(f"{label}: blocks differ in keys or order")
+    for block_time, ref in ref_blocks.items():
+        if summary.blocks.get(block_time) != ref:
+            problems.append(f"{label}: block {block_time} differs")
+    ref_whole = DaySummary._summarize_whole_day(  # pylint:disable=protected-access
+        day=day, blocks=ref_blocks
+    )
+    if summary.whole_day != ref_whole:
+        problems.append(f"{label}: whole day totals differ")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare DaySummary against its previous implementation."
+    )
+    parser.add_argument("datafiles", nargs="*", help="TagTracker JSON datafile(s)")
+    parser.add_argument("--days", type=int, default=20, help="Synthetic days")
+    args = parser.parse_args()
+
+    days = [(str(f), TrackerDay.load_from_file(f)) for f in args.datafiles]
+    rng = random.Random(1)
+    for n in range(args.days):
+        day = synthetic_day(40)
+        for _ in range(1500):
+            random_change(day, rng)
+        days.append((f"synthetic #{n}", day))
+
+    problems = []
+    elapsed = 0.0
+    for label, day in days:
+        for as_of_when in ("", "10:00", "12:17", "16:45", "24:00"):
+            start = time.perf_counter()
+            DaySummary(day=day, as_of_when=as_of_when)
+            elapsed += time.perf_counter() - start
+            problems += compare(day, as_of_when, f"{label} @{as_of_when or 'latest'}")
+
+    for problem in problems[:20]:
+        print(problem)
+    print(f"DaySummary time: {elapsed:.3f}s for {len(days) * 5} summaries")
+    print(f"{'OK' if not problems else 'FAILED'}: {len(problems)} differences")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Cross-check TrackerDay's event index against full scans.
+
+For checking changes to common/tt_eventindex.py.
+
+The as-of queries in TrackerDay (num_bikes_parked, num_bikes_returned,
+tags_in_use, tags_done, max_bikes_up_to_time) answer from an EventIndex.
+This compares them, minute by minute, to the scan-everything versions
+they replaced (kept here as the reference).
+
+With datafiles, checks each of them as loaded.  Then (or with no
+datafiles) it builds a synthetic day and pushes it through random
+check-ins, check-outs, edits and deletes, rechecking after each one.
+
+Run from the TagTracker root as:
+    python3 -m helpers.event_index_check [datafile...]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+
+sys.path.append("../")
+
+# pylint:disable=wrong-import-position
+from common.tt_biketag import BikeTag, BikeTagError
+from common.tt_constants import OVERSIZE, REGULAR
+from common.tt_tag import TagID
+from common.tt_time import VTime
+from common.tt_trackerday import TrackerDay
+
+# Reference implementations: full scans over every BikeTag and visit.
+
+
+def scan_num_bikes_parked(day: TrackerDay, as_of_when: VTime) -> tuple:
+    regular_in = oversize_in = 0
+    for biketag in day.biketags.values():
+        for v in biketag.visits:
+            if v.time_in <= as_of_when:
+                if biketag.bike_type == REGULAR:
+                    regular_in += 1
+                elif biketag.bike_type == OVERSIZE:
+                    oversize_in += 1
+    return regular_in + oversize_in, regular_in, oversize_in
+
+
+def scan_num_bikes_returned(day: TrackerDay, as_of_when: VTime) -> tuple:
+    regular_out = oversize_out = 0
+    for biketag in day.biketags.values():
+        for visit in biketag.visits:
+            if visit.time_out and visit.time_out < as_of_when:
+                if biketag.bike_type == REGULAR:
+                    regular_out += 1
+                else:
+                    oversize_out += 1
+    return regular_out + oversize_out, regular_out, oversize_out
+
+
+def scan_tags_with_status(day: TrackerDay, as_of_when: VTime, status: str) -> list:
+    return [
+        b.tagid for b in day.biketags.values() if b.status_as_at(as_of_when) == status
+    ]
+
+
+def scan_max_bikes_up_to_time(day: TrackerDay, as_of_when: VTime) -> tuple:
+    events = []
+    for visit in day.all_visits():
+        if visit.time_in <= as_of_when:
+            events.append((visit.time_in, "in"))
+        if visit.time_out and visit.time_out <= as_of_when:
+            events.append((visit.time_out, "out"))
+    events.sort(key=lambda x: (x[0], x[1] == "out"))
+    max_bikes = current_bikes = 0
+    max_time = ""
+    for event in events:
+        if event[1] == "in":
+            current_bikes += 1
+            if current_bikes > max_bikes:
+                max_bikes = current_bikes
+                max_time = event[0]
+        else:
+            current_bikes -= 1
+    return max_bikes, max_time
+
+
+def compare(day: TrackerDay, label: str) -> int:
+    """Compare indexed and scanned answers at every minute; return # of mismatches."""
+    mismatches = 0
+    for minute in range(0, 24 * 60 + 1):
+        t = VTime(minute)
+        checks = (
+            ("parked", day.num_bikes_parked(t), scan_num_bikes_parked(day, t)),
+            ("returned", day.num_bikes_returned(t), scan_num_bikes_returned(day, t)),
+            (
+                "in_use",
+                day.tags_in_use(t),
+                scan_tags_with_status(day, t, BikeTag.IN_USE),
+            ),
+            ("done", day.tags_done(t), scan_tags_with_status(day, t, BikeTag.DONE)),
+            ("max", day.max_bikes_up_to_time(t), scan_max_bikes_up_to_time(day, t)),
+        )
+        for what, indexed, scanned in checks:
+            if indexed != scanned:
+                mismatches += 1
+                if mismatches <= 10:
+                    print(f"{label} {t} {what}: index {indexed} != scan {scanned}")
+    return mismatches
+
+
+def synthetic_day(num_tags: int) -> TrackerDay:
+    """A blank day with some regular and oversize tags."""
+    day = TrackerDay("/dev/null")
+    day.regular_tagids = {TagID(f"wa{i}") for i in range(num_tags)}
+    day.oversize_tagids = {TagID(f"bd{i}") for i in range(num_tags // 3)}
+    day.initialize_biketags()
+    return day
+
+
+def random_change(day: TrackerDay, rng: random.Random) -> str:
+    """Make one random change through the BikeTag methods; describe it."""
+    biketag: BikeTag = rng.choice(list(day.biketags.values()))
+    bike_time = VTime(rng.randint(7 * 60, 22 * 60))
+    action = rng.choice(
+        ["check_in", "check_in", "check_out", "edit_in", "edit_out", "delete_in", "delete_out"]
+    )
+    try:
+        if action == "check_in":
+            biketag.check_in(bike_time)
+        elif action == "check_out":
+            if biketag.status == BikeTag.IN_USE and bike_time > biketag.latest_visit().time_in:
+                biketag.check_out(bike_time)
+        elif action == "edit_in":
+            biketag.edit_in(bike_time)
+        elif action == "edit_out":
+            biketag.edit_out(bike_time)
+        elif action == "delete_in":
+            biketag.delete_in()
+        elif action == "delete_out":
+            biketag.delete_out()
+    except BikeTagError:
+        pass
+    return f"{action} {biketag.tagid} {bike_time}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Cross-check the TrackerDay event index against full scans."
+    )
+    parser.add_argument("datafiles", nargs="*", help="TagTracker JSON datafile(s)")
+    parser.add_argument("--changes", type=int, default=300, help="Random changes")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    mismatches = 0
+    for datafile in args.datafiles:
+        day = TrackerDay.load_from_file(datafile)
+        mismatches += compare(day, datafile)
+
+    rng = random.Random(args.seed)
+    day = synthetic_day(30)
+    day.event_index()  # Build it now so the changes below update it incrementally
+    for n in range(args.changes):
+        change = random_change(day, rng)
+        if n % 10 == 0 or n == args.changes - 1:
+            mismatches += compare(day, f"after #{n} ({change})")
+
+    print(f"{'OK' if not mismatches else 'FAILED'}: {mismatches} mismatches")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
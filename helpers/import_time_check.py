@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Check that the entry points still start up within an import-time budget.
+
+For catching changes that slow down every CGI request or client start,
+e.g. a new top-level import of numpy/pandas in a module that every
+report loads.
+
+Imports each entry point in a fresh interpreter under `python -X importtime`
+(best of several runs, since timings are noisy), reports the total and
+the slowest imports, and exits 1 if any is over its budget.
+
+Run from the TagTracker root as:
+    python3 -m helpers.import_time_check [--runs N] [--budget MODULE=MS ...]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Cold-start import budgets (milliseconds) for each entry point.  These are
+# the best-of-5 times measured on a modest server, plus about 25% for noise,
+# so that going over means an import has got slower.  Raise or lower them
+# (or use --budget) for much faster or slower machines.
+IMPORT_BUDGETS_MS = {
+    "tagtracker": 450,
+    "web.web_reports": 350,
+    "web.web_download_data": 350,
+}
+
+# Lines of -X importtime output: "import time: self | cumulative | name"
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)")
+
+
+def measure_imports(module: str) -> tuple[float, list[tuple[float, str]]]:
+    """Import module in a fresh interpreter.
+
+    Returns (total milliseconds, [(cumulative milliseconds, name), ...]).
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=root,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr}")
+
+    total_us = 0
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative_us, indent, name = int(match[2]), match[3], match[4]
+        imports.append((cumulative_us / 1000, name))
+        # Top-level imports (indented by one space) add up to the total
+        if len(indent) == 1:
+            total_us += cumulative_us
+    return total_us / 1000, imports
+
+
+def check_module(module: str, budget_ms: float, runs: int, show: int) -> bool:
+    """Print the best-of-runs import time for module; return True if in budget."""
+    best_ms, best_imports = None, []
+    for _ in range(runs):
+        total_ms, imports = measure_imports(module)
+        if best_ms is None or total_ms < best_ms:
+            best_ms, best_imports = total_ms, imports
+    ok = best_ms <= budget_ms
+    print(
+        f"{module:25s} {best_ms:8.1f} ms  (budget {budget_ms:.0f} ms)  "
+        f"{'ok' if ok else 'OVER BUDGET'}"
+    )
+    # When over budget, show where the time went
+    num_to_show = show or (0 if ok else 10)
+    for cumulative_ms, name in sorted(best_imports, reverse=True)[:num_to_show]:
+        print(f"    {cumulative_ms:8.1f} ms  {name}")
+    return ok
+
+
+def parse_budget(text: str) -> tuple[str, float]:
+    module, _, budget = text.partition("=")
+    try:
+        return module, float(budget)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(f"expected MODULE=MS, not '{text}'") from err
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fail if entry point cold-start import time is over budget."
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="Runs per entry point (keeps the best)."
+    )
+    parser.add_argument(
+        "--budget",
+        type=parse_budget,
+        action="append",
+        default=[],
+        metavar="MODULE=MS",
+        help="Set (or add) the budget for an entry point; may repeat.",
+    )
+    parser.add_argument(
+        "--show", type=int, default=0, help="Also list the N slowest imports."
+    )
+    args = parser.parse_args()
+
+    budgets = dict(IMPORT_BUDGETS_MS)
+    budgets.update(args.budget)
+    results = [
+        check_module(module, budget, max(1, args.runs), args.show)
+        for module, budget in budgets.items()
+    ]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
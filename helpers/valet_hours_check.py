@@ -10,7 +10,7 @@ sys.path.append("../")
 
 dbfile = DB_FILENAME
 
-database = db.db_connect(dbfile)
+database = db.db_connect(dbfile, db.DB_READ_ONLY)
 if not database:
     sys.exit(1)
 vhours = db.db_fetch(
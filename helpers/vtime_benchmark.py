@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Micro-benchmark VTime variants against real TagTracker datafiles.
+
+For checking that a change to VTime is actually faster.
+
+Collects every time string in the given JSON datafiles (visit times
+plus opening/closing times) and times, for each VTime variant:
+    - construction from the raw strings
+    - sorting the resulting VTimes
+    - pairwise comparisons against a fixed VTime
+
+Run from the TagTracker root as:
+    python3 -m helpers.vtime_benchmark datafile [datafile...]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.append("../")
+
+# pylint:disable=wrong-import-position
+from common.tt_time import HMS_VTime, Int_VTime
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Time VTime construction, sorting and comparison."
+    )
+    parser.add_argument(
+        "datafiles",
+        type=Path,
+        nargs="+",
+        help="TagTracker JSON datafile(s) to take time strings from",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=20,
+        help="Number of passes over the time strings (default 20)",
+    )
+    return parser.parse_args()
+
+
+def load_time_strings(datafiles: list[Path]) -> list[str]:
+    """Return all the raw time strings found in the datafiles."""
+    times = []
+    for datafile in datafiles:
+        try:
+            with datafile.open("r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Skipping {datafile}: {e}")
+            continue
+        for key in ("time_open", "time_closed"):
+            if data.get(key):
+                times.append(str(data[key]))
+        for visit in data.get("bike_visits", []):
+            for key in ("time_in", "time_out"):
+                if visit.get(key):
+                    times.append(str(visit[key]))
+    return times
+
+
+def time_variant(vtime_class, times: list[str], repeat: int) -> dict[str, float]:
+    """Return elapsed seconds for each benchmarked operation."""
+    results = {}
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        vtimes = [vtime_class(t) for t in times]
+    results["construct"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        sorted(vtimes)
+    results["sort"] = time.perf_counter() - start
+
+    noon = vtime_class("12:00")
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for v in vtimes:
+            _ = v <= noon
+            _ = v == noon
+    results["compare"] = time.perf_counter() - start
+
+    return results
+
+
+def main() -> None:
+    args = parse_args()
+    times = load_time_strings(args.datafiles)
+    if not times:
+        print("No times found.")
+        return
+    print(
+        f"{len(times)} time strings from {len(args.datafiles)} file(s), "
+        f"{args.repeat} passes"
+    )
+    print()
+
+    results = {
+        cls.__name__: time_variant(cls, times, args.repeat)
+        for cls in (HMS_VTime, Int_VTime)
+    }
+    print(f"{'':10s}" + "".join(f"{name:>12s}" for name in results) + "     ratio")
+    for op in ("construct", "sort", "compare"):
+        old, new = results["HMS_VTime"][op], results["Int_VTime"][op]
+        ratio = f"{old / new:9.1f}x" if new else ""
+        print(f"{op:10s}{old:12.4f}{new:12.4f}{ratio}")
+
+
+if __name__ == "__main__":
+    main()
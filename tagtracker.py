@@ -101,6 +101,7 @@ def main_loop(today: TrackerDay):
 
     done = False
     todays_date = ut.date_str("today")
+    last_compacted = time.monotonic()
     while not done:
         pr.iprint()
         # Nag about bikes expected to be present if close to closing time
@@ -142,16 +143,27 @@ def main_loop(today: TrackerDay):
                 style=k.WARNING_STYLE,
             )
 
-        # Save if any data has changed
+        # Save if any data has changed.  If journalling, only append the
+        # changes, rewriting the whole datafile only now and then.
         if data_changed:
-            today.save_to_file()
+            if cfg.DATAFILE_JOURNAL and (
+                time.monotonic() - last_compacted
+                < cfg.JOURNAL_COMPACT_FREQUENCY * 60
+            ):
+                today.save_to_journal()
+            else:
+                today.save_to_file()
+                last_compacted = time.monotonic()
             data_changed = False
             publishment.maybe_publish(today)
             ##last_published = maybe_publish(last_published)
         # Flush any echo buffer
         pr.echo_flush()
-    # Exiting; one last  publishing
+    # Exiting; compact any journal into the datafile, one last publishing
+    if cfg.DATAFILE_JOURNAL:
+        today.save_to_file()
     publishment.publish(today)
+    publishment.wait_until_done()
 
 
 def custom_datafile() -> str:
@@ -1,6 +1,13 @@
 #!/usr/bin/env python3
 """Call the estimator from the terminal.
 
+get_estimate() asks the estimator for JSON in a background thread, so
+that data entry never waits on it.  The last good estimate of each
+estimation type is kept.  It is reused while its request (bikes so far,
+opening and closing times) is unchanged and it is no older than the
+server says it can be; otherwise it is shown, marked as out of date,
+while a new one is fetched.
+
 Copyright (C) 2023-2025 Julias Hocking & Todd Glover
 
     Notwithstanding the licensing information below, this code may not
@@ -21,7 +28,13 @@ Copyright (C) 2023-2025 Julias Hocking & Todd Glover
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import json
+import re
+import threading
+import time
+import urllib.error
 import urllib.request
+from dataclasses import dataclass
 from typing import Optional
 
 import client_base_config as cfg
@@ -29,19 +42,29 @@ import common.tt_util as ut
 from common.tt_time import VTime
 import common.tt_trackerday as tt_trackerday
 
+# Seconds to reuse an estimate for if the server doesn't say
+DEFAULT_MAX_AGE = 60
 
-def get_estimate_via_url(
+
+def _timeout() -> float:
+    return float(getattr(cfg, "ESTIMATOR_TIMEOUT", 10) or 10)
+
+
+def estimate_url(
     day: tt_trackerday.TrackerDay,
     bikes_so_far: Optional[int] = None,
     opening_time: str = "",
     closing_time: str = "",
     estimation_type: str = "standard",
-) -> list[str]:
-    """Call estimator URL to get the estimate.
+    response_format: str = "",
+) -> str:
+    """Return the URL to ask the estimator for an estimate ("" if none is set).
 
     API assumes: today, as of now. Parameters sent:
       opening_time, closing_time, bikes_so_far, [max_bikes_today], [max_bikes_time_today]
     """
+    if not cfg.ESTIMATOR_URL_BASE:
+        return ""
     now = VTime("now")
     if bikes_so_far is None:
         bikes_so_far, _, _ = day.num_bikes_parked(now)
@@ -50,9 +73,6 @@ def get_estimate_via_url(
     opening_time = opening_time or str(day.time_open)
     closing_time = closing_time or str(day.time_closed)
 
-    if not cfg.ESTIMATOR_URL_BASE:
-        return ["No estimator URL defined"]
-
     parts = [
         f"bikes_so_far={bikes_so_far}",
         f"opening_time={opening_time}",
@@ -65,16 +85,165 @@ def get_estimate_via_url(
             parts.append(f"time_closed={closing_time}")
             parts.append("dow=today")
             parts.append("as_of_when=now")
+    if response_format:
+        parts.append(f"format={response_format}")
 
-    url = f"{cfg.ESTIMATOR_URL_BASE}?" + "&".join(parts)
+    return f"{cfg.ESTIMATOR_URL_BASE}?" + "&".join(parts)
+
+
+def get_estimate_via_url(
+    day: tt_trackerday.TrackerDay,
+    bikes_so_far: Optional[int] = None,
+    opening_time: str = "",
+    closing_time: str = "",
+    estimation_type: str = "standard",
+) -> list[str]:
+    """Call estimator URL to get the estimate (as lines of text), and wait for it."""
+    url = estimate_url(day, bikes_so_far, opening_time, closing_time, estimation_type)
+    if not url:
+        return ["No estimator URL defined"]
     ##ut.squawk(f"{url=}")
     try:
-        response = urllib.request.urlopen(url)
-        data = response.read()
-        decoded_data = data.decode("utf-8")
+        with urllib.request.urlopen(url, timeout=_timeout()) as response:
+            decoded_data = response.read().decode("utf-8")
     except urllib.error.URLError as e:
         # Return a more helpful message for troubleshooting connectivity/config
         reason = getattr(e, 'reason', '') or getattr(e, 'code', '') or ''
         return [f"URLError: {reason} ({e})", f"URL: {url}"]
+    except OSError as e:  # e.g. timed out
+        return [f"Estimator not reachable: {e}", f"URL: {url}"]
 
     return decoded_data.splitlines()
+
+
+@dataclass
+class _Estimate:
+    """An estimate as fetched from the server."""
+
+    lines: list[str]
+    url: str = ""  # the request it answers
+    etag: str = ""
+    fetched: float = 0.0  # time.monotonic() when fetched or revalidated
+    max_age: int = DEFAULT_MAX_AGE
+    as_of: str = ""  # time of day when fetched, for display
+
+
+class _EstimateFetcher:
+    """Fetch estimates in background threads; keep the last good ones."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._estimates: dict[str, _Estimate] = {}  # by estimation type
+        self._problems: dict[str, list[str]] = {}  # from each type's last fetch
+        self._refreshes: dict[str, threading.Thread] = {}  # by url
+
+    def estimate(self, url: str, estimation_type: str) -> list[str]:
+        """Return lines of estimate for the estimation type, without waiting.
+
+        An estimate for this same url that is fresh enough is returned as
+        is.  Otherwise a new one is fetched in the background, and the
+        type's last estimate (if any) is returned with a note saying so.
+        """
+        with self._lock:
+            estimate = self._estimates.get(estimation_type)
+            if (
+                estimate
+                and estimate.url == url
+                and time.monotonic() - estimate.fetched < estimate.max_age
+            ):
+                return estimate.lines
+            if url not in self._refreshes:
+                etag = estimate.etag if estimate and estimate.url == url else ""
+                refresh = threading.Thread(
+                    target=self._fetch,
+                    args=(url, estimation_type, etag),
+                    name="estimator",
+                    daemon=True,
+                )
+                self._refreshes[url] = refresh
+                refresh.start()
+            problem = self._problems.get(estimation_type)
+
+        if not estimate:
+            lines = ["Fetching an estimate; ask again in a moment."]
+            if problem:
+                lines += ["", "The last try failed:"] + problem
+            return lines
+        note = [
+            "",
+            f"(This estimate is from {estimate.as_of}. "
+            "A new one is on its way; ask again in a moment.)",
+        ]
+        if problem:
+            note.append(f"(The last try to update it failed: {problem[0]})")
+        return estimate.lines + note
+
+    def _fetch(self, url: str, estimation_type: str, etag: str) -> None:
+        """Background thread: fetch an estimate and keep it if it is good."""
+        problem = []
+        try:
+            request = urllib.request.Request(url)
+            if etag:
+                request.add_header("If-None-Match", etag)
+            try:
+                with urllib.request.urlopen(request, timeout=_timeout()) as response:
+                    body = response.read().decode("utf-8")
+                    headers = response.headers
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                if e.code != 304:
+                    raise
+                body, headers, status = "", e.headers, e.code
+            max_age = _max_age(headers.get("Cache-Control", ""))
+            with self._lock:
+                estimate = self._estimates.get(estimation_type)
+                if status == 304 and estimate and estimate.url == url:
+                    # Unchanged since last fetched
+                    estimate.fetched = time.monotonic()
+                    estimate.max_age = max_age
+                    estimate.as_of = VTime("now").short
+                elif "json" in headers.get("Content-Type", ""):
+                    data = json.loads(body)
+                    if data.get("state") == "error":
+                        problem = data.get("lines") or [data.get("error", "")]
+                    else:
+                        self._estimates[estimation_type] = _Estimate(
+                            lines=data.get("lines") or [],
+                            url=url,
+                            etag=headers.get("ETag", ""),
+                            fetched=time.monotonic(),
+                            max_age=max_age,
+                            as_of=VTime("now").short,
+                        )
+                else:
+                    # An estimator that doesn't know JSON: show what it said
+                    problem = body.splitlines()
+        except urllib.error.URLError as e:
+            reason = getattr(e, "reason", "") or getattr(e, "code", "") or ""
+            problem = [f"URLError: {reason} ({e})", f"URL: {url}"]
+        except (OSError, ValueError) as e:  # e.g. timed out, bad JSON
+            problem = [f"Estimator not reachable: {e}", f"URL: {url}"]
+        finally:
+            with self._lock:
+                self._problems[estimation_type] = problem
+                self._refreshes.pop(url, None)
+        ut.squawk(f"estimate fetched for {estimation_type=}, {problem=}", cfg.DEBUG)
+
+
+def _max_age(cache_control: str) -> int:
+    """Return the max-age (seconds) of a Cache-Control header."""
+    match = re.search(r"max-age=(\d+)", cache_control or "")
+    return int(match.group(1)) if match else DEFAULT_MAX_AGE
+
+
+_fetcher = _EstimateFetcher()
+
+
+def get_estimate(
+    day: tt_trackerday.TrackerDay, estimation_type: str = "standard"
+) -> list[str]:
+    """Return the estimate (as lines of text) without keeping data entry waiting."""
+    url = estimate_url(day, estimation_type=estimation_type, response_format="json")
+    if not url:
+        return ["No estimator URL defined"]
+    return _fetcher.estimate(url, estimation_type)
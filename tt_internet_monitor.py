@@ -61,12 +61,10 @@ import json
 import argparse
 import tempfile
 import urllib.parse
-import urllib.request
 import urllib.error
 import socket
 import random
 import string
-import http.client
 from datetime import datetime
 from dataclasses import dataclass
 from pathlib import Path
@@ -532,6 +530,10 @@ class InternetMonitor:
     @classmethod
     def _check_httpbin(cls, probe_id: str) -> Tuple[bool, Optional[str]]:
         """Primary probe: call httpbin and confirm random token."""
+        # Imported here since urllib.request (with http.client) is slow to
+        # import, and only the monitor process's probes use it.
+        import http.client  # pylint:disable=import-outside-toplevel
+        import urllib.request  # pylint:disable=import-outside-toplevel
         random_string = cls._make_random_string()
         url = cls._create_httpbin_url(random_string)
         host = urllib.parse.urlparse(url).hostname or ""
@@ -635,6 +637,7 @@ class InternetMonitor:
     @classmethod
     def _check_gstatic_generate204(cls, probe_id: str) -> Tuple[bool, Optional[str]]:
         """Secondary HTTP probe: fetch Google's generate_204 endpoint."""
+        import urllib.request  # pylint:disable=import-outside-toplevel
         random_string = cls._make_random_string()
         url = f"https://www.gstatic.com/generate_204?rand={random_string}"
         host = urllib.parse.urlparse(url).hostname or ""
@@ -692,6 +695,7 @@ class InternetMonitor:
     @classmethod
     def _check_doh_confirmation(cls, probe_id: str) -> Tuple[bool, Optional[str]]:
         """Confirmation probe: query Google DoH for a random name."""
+        import urllib.request  # pylint:disable=import-outside-toplevel
         random_string = cls._make_random_string()
         query_name = f"{random_string}.invalid"
         url = cls._create_doh_url(query_name)
@@ -767,6 +771,7 @@ class InternetMonitor:
     @classmethod
     def _check_cloudflare_doh(cls, probe_id: str) -> Tuple[bool, Optional[str]]:
         """Confirmation probe: query Cloudflare DoH for a random name."""
+        import urllib.request  # pylint:disable=import-outside-toplevel
         random_string = cls._make_random_string()
         query_name = f"{random_string}.invalid"
         url = cls._create_cloudflare_doh_url(query_name)
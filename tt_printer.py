@@ -25,6 +25,7 @@ Copyright (C) 2023-2025 Julias Hocking & Todd Glover
 import os
 import sys
 import io
+import threading
 
 # The readline module magically solves arrow keys creating ANSI esc codes
 # on the Chromebook.  But it isn't on all platforms.
@@ -107,8 +108,21 @@ def tt_inp(prompt: str = "", style: str = "") -> str:
 
 
 # Output destination
-_destination: str = ""  # blank == screen
-_destination_file = None
+class _Output(threading.local):
+    """Where iprint() output goes.
+
+    This is per-thread, so reports written to file by the publishing
+    thread don't capture what the main thread is printing to the screen.
+    """
+
+    destination: str = ""  # blank == screen
+    destination_file: ut.AtomicFile = None
+
+
+_output = _Output()
+
+# Output destination name while iprint() output is being captured
+_CAPTURE = "<capture>"
 
 
 def set_output(filename: str = "") -> bool:
@@ -120,35 +134,59 @@ def set_output(filename: str = "") -> bool:
     Returns True/False if able to change to the new filename.
     (Always True if returning output to screen.)
     """
-    global _destination, _destination_file # pylint:disable=global-statement
-    if filename == _destination:
+    if filename == _output.destination:
         return True
-    if _destination:
-        _destination_file.close()
+    if _output.destination and _output.destination != _CAPTURE:
+        try:
+            _output.destination_file.commit()
+        except OSError:
+            _output.destination_file.discard()
+            _output.destination = ""
+            iprint(
+                f"OSError writing destination file '{_output.destination_file.filepath}'",
+                style=k.ERROR_STYLE,
+            )
     if filename:
         try:
-            _destination_file = open(filename, mode="wt", encoding="utf-8")
+            _output.destination_file = ut.AtomicFile(filename)
         except OSError:
+            _output.destination = ""
             iprint(
                 f"OSError opening destination file '{filename}'",
                 style=k.ERROR_STYLE,
             )
             iprint("Ignoring print redirect request.", style=k.ERROR_STYLE)
-            _destination = ""
             return False
-    _destination = filename
+    _output.destination = filename
     return True
 
 
+def start_capture() -> None:
+    """Send iprint() output (in this thread) to a string, not screen or file."""
+    set_output()
+    _output.destination_file = io.StringIO()
+    _output.destination = _CAPTURE
+
+
+def end_capture() -> str:
+    """Return print destination to screen; return what was captured."""
+    text = ""
+    if _output.destination == _CAPTURE:
+        text = _output.destination_file.getvalue()
+        _output.destination_file = None
+        _output.destination = ""
+    return text
+
+
 def get_output() -> str:
     """Get the current output destination (filename), or "" if screen."""
-    return _destination
+    return _output.destination
 
 
 def text_style(text: str, style=None) -> str:
     """Return text with style 'style' applied."""
     # If redirecting to file, do not apply style
-    if _destination:
+    if _output.destination:
         return text
     # If colour not active, do not apply colour styles
     if not COLOUR_ACTIVE:
@@ -173,9 +211,9 @@ def iprint(text: str = "", num_indents: int = None, style=None, end="\n") -> Non
     indent = _INDENT * num_indents
 
     # Going to screen?
-    if _destination:
+    if _output.destination:
         # Going to file - print with indents but no styling
-        _destination_file.write(f"{indent}{text}{end}")
+        _output.destination_file.write(f"{indent}{text}{end}")
     else:
         # Going to screen.  Style and indent.
         if COLOUR_ACTIVE and style:
@@ -185,7 +223,7 @@ def iprint(text: str = "", num_indents: int = None, style=None, end="\n") -> Non
             print(f"{indent}{text}", end=end)
 
     # Also echo?
-    if _echo_state and not _destination:
+    if _echo_state and not _output.destination:
         echo(f"{indent}{text}{end}")
 
 
@@ -228,7 +266,7 @@ def text_alert(message: str = "", style=None) -> None:
         return centred_string[:str_len]  # Make sure is correct length
 
     # I suspect this is unneccessary, but benign.
-    if _destination:
+    if _output.destination:
         return
 
     # Build the message centred with bracket decorations & color.
@@ -45,7 +45,6 @@ import tt_help
 import tt_audit_report as aud
 import tt_reports as rep
 import tt_tag_inv as inv
-import tt_retire
 
 # from tt_cmdparse import CmdBits
 from tt_commands import (
@@ -55,7 +54,6 @@ from tt_commands import (
     PARSED_EMPTY,
     COMMANDS,
 )
-import tt_call_estimator
 from tt_sounds import NoiseMaker
 import tt_main_bits as bits
 from tt_internet_monitor import InternetMonitorController
@@ -545,8 +543,13 @@ def estimate(today: TrackerDay, args: Optional[List[str]] = None) -> None:
     elif choice in {"SCHEDULE", "QUICK"}:
         estimation_type = choice.lower()
 
-    # STANDARD or empty uses default 'current'
-    message_lines: List[str] = tt_call_estimator.get_estimate_via_url(
+    # Imported here since it (with urllib.request) is slow to import
+    # and most sessions never ask for an estimate.
+    import tt_call_estimator  # pylint:disable=import-outside-toplevel
+
+    # STANDARD or empty uses default 'current'.  This doesn't wait for the
+    # estimator; if it has nothing to show yet, it says to ask again.
+    message_lines: List[str] = tt_call_estimator.get_estimate(
         today, estimation_type=estimation_type
     )
     if not message_lines:
@@ -658,6 +661,8 @@ def process_command(
         if today.registrations.process_registration("".join(args)):
             data_changed = True
     elif cmd == CmdKeys.CMD_RETIRE:
+        import tt_retire  # pylint:disable=import-outside-toplevel
+
         data_changed = tt_retire.retire(today=today, tags=args[0])
     elif cmd == CmdKeys.CMD_STATS:
         rep.summary_report(day=today, args=args)
@@ -667,6 +672,8 @@ def process_command(
     elif cmd == CmdKeys.CMD_TAGS:
         inv.tags_config_report(today, args, False)
     elif cmd == CmdKeys.CMD_UNRETIRE:
+        import tt_retire  # pylint:disable=import-outside-toplevel
+
         data_changed = tt_retire.unretire(today=today, tags=args[0])
     elif cmd in {CmdKeys.CMD_UPPERCASE, CmdKeys.CMD_LOWERCASE}:
         # Change to uc or lc tags
@@ -23,12 +23,27 @@ Copyright (C) 2023-2024 Julias Hocking & Todd Glover
 """
 
 import os
+import hashlib
+import json
+import threading
+
 #import pathlib
 
 import common.tt_constants as k
 from common.tt_time import VTime
 import common.tt_util as ut
-from common.tt_trackerday import TrackerDay
+from common.tt_trackerday import (
+    TrackerDay,
+    TOKEN_BIKE_VISITS,
+    TOKEN_COMMENT,
+    TOKEN_DATE,
+    TOKEN_NOTES,
+    TOKEN_OVERSIZE_TAGIDS,
+    TOKEN_REGULAR_TAGIDS,
+    TOKEN_TAGID,
+    TOKEN_TIME_IN,
+    TOKEN_TIME_OUT,
+)
 import tt_datafile as df
 import tt_printer as pr
 import tt_reports as rep
@@ -38,10 +53,42 @@ import client_base_config as cfg
 
 
 class Publisher:
-    """Keep track of publishing activity."""
+    """Keep track of publishing activity.
+
+    The publishing itself (datafile copy and reports) is done by a
+    background thread from a snapshot of the day, so data entry never
+    waits on it.  Requests made while it is busy are coalesced: it next
+    publishes only the latest snapshot, doing everything asked for since.
+
+    Publishing is incremental.  Each snapshot is compared to the one
+    last published to find which tags (and so which time blocks) have
+    changed.  Report sections are re-rendered only if something they
+    depend on has changed, and a file is only rewritten if its content
+    is different from what was last written there.
+    """
+
+    # Top-level datafile items that the reports don't show
+    _UNREPORTED_ITEMS = {TOKEN_COMMENT, TOKEN_NOTES}
+    # Top-level datafile items that the activity chart depends on
+    _CHART_ITEMS = {TOKEN_DATE, TOKEN_REGULAR_TAGIDS, TOKEN_OVERSIZE_TAGIDS}
 
     def __init__(self, destination: str, frequency: int) -> None:
         """Set up the Publisher object."""
+        # Publishing requests waiting for the background thread
+        self._pending: dict = None
+        self._busy = False
+        self._ready = threading.Condition()
+        self._worker: threading.Thread = None
+
+        # What has been published, so as to publish only what changes.
+        # These are only used by the background thread.
+        self._published_data: dict = None  # snapshot last published
+        self._data_version = 0  # increments when reported data changes
+        self._chart_version = 0  # increments when activity chart data changes
+        self._dirty_blocks: set[VTime] = set()  # changed, not yet in chart
+        self._sections: dict[str, tuple] = {}  # section: (key, text)
+        self._file_hashes: dict[str, str] = {}  # filepath: hash of content
+
         # If there's no reports folder set, just disable publishing
         if not frequency:
             self.able_to_publish = False
@@ -69,18 +116,12 @@ class Publisher:
             )
 
     def publish(self, day: TrackerDay, as_of_when: str = "") -> None:
-        """Publish."""
+        """Publish datafile copy and reports (in the background)."""
         ut.squawk(f"Entering .publish with {self.able_to_publish=}",cfg.DEBUG)
         if not self.able_to_publish:
             return
         ut.squawk(f"{type(day)=}, {day.date=}",cfg.DEBUG)
-        if not self.publish_datafile(day, self.destination):
-            pr.iprint("ERROR PUBLISHING DATAFILE", style=k.ERROR_STYLE)
-            pr.iprint("REPORT PUBLISHING TURNED OFF", style=k.ERROR_STYLE)
-            self.able_to_publish = False
-            return
-
-        self.publish_reports(day, [as_of_when])
+        self._request(day, as_of_when, datafile=True, summary=True)
         self.last_publish = VTime("now")
 
     def maybe_publish(self, day: TrackerDay, as_of_when: str = "") -> bool:
@@ -93,47 +134,236 @@ class Publisher:
             self.publish(day, as_of_when)
 
     def publish_audit(self, day: TrackerDay, args: list[str]) -> None:
-        """Publish the audit report."""
+        """Publish the audit report (in the background)."""
         if not self.able_to_publish:
             return
-        fn = "audit.txt"
-        fullfn = os.path.join(cfg.REPORTS_FOLDER, fn)
-        if not pr.set_output(fullfn):
+        self._request(day, (args + [None])[0], datafile=False, summary=False)
+
+    def publish_reports(self, day: TrackerDay, args: list = None,mention:bool=False) -> None:
+        """Publish reports to the PUBLISH directory (in the background)."""
+        if not self.able_to_publish:
+            return
+        as_of_when = (args + [None])[0]
+        if mention:
+            pr.iprint(f"Publishing a copy of reports to {cfg.REPORTS_FOLDER}.",
+                      style=k.SUBTITLE_STYLE)
+        self._request(day, as_of_when, datafile=False, summary=True)
+
+    def wait_until_done(self) -> None:
+        """Wait for any publishing in progress or pending to finish."""
+        with self._ready:
+            while self._pending is not None or self._busy:
+                self._ready.wait()
+
+    def _request(
+        self, day: TrackerDay, as_of_when: str, datafile: bool, summary: bool
+    ) -> None:
+        """Hand a snapshot of the day to the publishing thread."""
+        as_of_when = VTime(as_of_when or "now")
+        data = day.snapshot()
+        with self._ready:
+            if self._pending:
+                datafile = datafile or self._pending["datafile"]
+                summary = summary or self._pending["summary"]
+            self._pending = {
+                "data": data,
+                "filepath": day.filepath,
+                "as_of_when": as_of_when,
+                "datafile": datafile,
+                "summary": summary,
+            }
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._publishing_loop, name="publisher", daemon=True
+                )
+                self._worker.start()
+            self._ready.notify_all()
+
+    def _publishing_loop(self) -> None:
+        """Background thread: publish whatever is most recently requested."""
+        while True:
+            with self._ready:
+                while self._pending is None:
+                    self._ready.wait()
+                job = self._pending
+                self._pending = None
+                self._busy = True
+            try:
+                if self.able_to_publish:
+                    self._publish_job(job)
+            except Exception as e:  # pylint:disable=broad-exception-caught
+                pr.iprint(f"Error while publishing: {e}", style=k.ERROR_STYLE)
+            finally:
+                with self._ready:
+                    self._busy = False
+                    self._ready.notify_all()
+
+    def _publish_job(self, job: dict) -> None:
+        """Do the publishing for one (possibly coalesced) request."""
+        data = job["data"]
+        as_of_when = job["as_of_when"]
+        self._note_changes(data, as_of_when)
+        if job["datafile"] and not self.publish_datafile(data, self.destination):
+            pr.iprint("ERROR PUBLISHING DATAFILE", style=k.ERROR_STYLE)
+            pr.iprint("REPORT PUBLISHING TURNED OFF", style=k.ERROR_STYLE)
+            self.able_to_publish = False
             return
-        aud.audit_report(day, args, include_returns=True,retired_tag_str="<>")
-        pr.set_output()
+        day = TrackerDay.from_snapshot(data, job["filepath"])
+        self._write_audit(day, as_of_when)
+        if job["summary"]:
+            self._write_summary(day, as_of_when)
+
+    def _note_changes(self, data: dict, as_of_when: VTime) -> None:
+        """Update what needs re-rendering, from changes since the last publish."""
+        changed_tagids, changed_blocks, changed_items = self._what_changed(
+            self._published_data, data
+        )
+        self._published_data = data
+        ut.squawk(
+            f"publishing {len(changed_tagids)} changed tags, "
+            f"blocks {sorted(changed_blocks)}, items {sorted(changed_items)}",
+            cfg.DEBUG,
+        )
+        if changed_tagids or changed_items - self._UNREPORTED_ITEMS:
+            self._data_version += 1
+        # The chart goes only to as_of_when; later blocks wait till it gets there.
+        self._dirty_blocks |= changed_blocks
+        if changed_items & self._CHART_ITEMS or any(
+            b <= as_of_when for b in self._dirty_blocks
+        ):
+            self._chart_version += 1
+            self._dirty_blocks = {b for b in self._dirty_blocks if b > as_of_when}
 
-    def publish_datafile(self, day: TrackerDay, folder: str) -> bool:
-        """Publish a copy of today's datafile.
+    @staticmethod
+    def _what_changed(old: dict, new: dict) -> tuple[set, set, set]:
+        """Compare two day snapshots.
+
+        Returns sets of (changed tagids, start times of the time blocks
+        with changed events, other changed top-level datafile items).
+        If there is no old snapshot, everything has changed.
+        """
+
+        def visits_by_tag(data: dict) -> dict:
+            visits = {}
+            for visit in (data or {}).get(TOKEN_BIKE_VISITS, []):
+                visits.setdefault(visit[TOKEN_TAGID], []).append(
+                    (visit[TOKEN_TIME_IN], visit[TOKEN_TIME_OUT])
+                )
+            return visits
+
+        old_visits = visits_by_tag(old)
+        new_visits = visits_by_tag(new)
+        changed_tagids = set()
+        changed_blocks = set()
+        for tagid in old_visits.keys() | new_visits.keys():
+            before = old_visits.get(tagid, [])
+            after = new_visits.get(tagid, [])
+            if before == after:
+                continue
+            changed_tagids.add(tagid)
+            for visit in set(before) ^ set(after):
+                for atime in visit:
+                    if atime:
+                        changed_blocks.add(ut.block_start(VTime(atime)))
+
+        changed_items = {
+            key
+            for key in (new.keys() | (old or {}).keys()) - {TOKEN_BIKE_VISITS}
+            if old is None or old.get(key) != new.get(key)
+        }
+        return changed_tagids, changed_blocks, changed_items
+
+    def _section(self, name: str, key: tuple, render) -> str:
+        """Return the text of a report section, re-rendering only if key changed.
+
+        render() prints the section with pr.iprint().
+        """
+        cached = self._sections.get(name)
+        if cached and cached[0] == key:
+            return cached[1]
+        pr.start_capture()
+        try:
+            render()
+        finally:
+            text = pr.end_capture()
+        self._sections[name] = (key, text)
+        return text
+
+    def _write_if_changed(self, filepath: str, text: str, body: str = None) -> bool:
+        """Write text to filepath unless body (default: text) is as last written.
+
+        Returns False if unable to write.
+        """
+        body = text if body is None else body
+        content_hash = hashlib.sha256(body.encode("utf-8")).hexdigest()
+        if self._file_hashes.get(filepath) == content_hash and os.path.exists(
+            filepath
+        ):
+            ut.squawk(f"unchanged, not rewriting {filepath}", cfg.DEBUG)
+            return True
+        try:
+            with ut.AtomicFile(filepath) as file:
+                file.write(text)
+        except OSError as e:
+            pr.iprint(f"OSError writing file '{filepath}': {e}", style=k.ERROR_STYLE)
+            self._file_hashes.pop(filepath, None)
+            return False
+        self._file_hashes[filepath] = content_hash
+        return True
+
+    def publish_datafile(self, data: dict, folder: str) -> bool:
+        """Publish a copy of today's datafile (from a snapshot of the day).
         Returns False if failed.
         """
         if not self.able_to_publish:
             return
-        filepath = df.datafile_name(folder, day.date)
-        ut.squawk(f"Preparing to save to  {filepath=} based on {folder=} and {day.date=}",cfg.DEBUG)
+        filepath = df.datafile_name(folder, data[TOKEN_DATE])
+        ut.squawk(f"Preparing to save to  {filepath=} based on {folder=}",cfg.DEBUG)
         if not filepath:
             return False
-        return day.save_to_file(filepath)
+        return self._write_if_changed(filepath, json.dumps(data, indent=4))
 
-    def publish_reports(self, day: TrackerDay, args: list = None,mention:bool=False) -> None:
-        """Publish reports to the PUBLISH directory."""
-        if not self.able_to_publish:
-            return
-        as_of_when = (args + [None])[0]
-        as_of_when: VTime = VTime(as_of_when or "now")
-        if mention:
-            pr.iprint(f"Publishing a copy of reports to {cfg.REPORTS_FOLDER}.",
-                      style=k.SUBTITLE_STYLE)
-        self.publish_audit(day, [as_of_when])
+    def _write_audit(self, day: TrackerDay, as_of_when: VTime) -> None:
+        """Write the audit report file."""
+        fn = "audit.txt"
+        fullfn = os.path.join(cfg.REPORTS_FOLDER, fn)
+        # as_of_when is "now" (to the second) but reports show the minute
+        text = self._section(
+            "audit",
+            (as_of_when.num, self._data_version),
+            lambda: aud.audit_report(
+                day, [as_of_when], include_returns=True, retired_tag_str="<>"
+            ),
+        )
+        self._write_if_changed(fullfn, text)
+
+    def _write_summary(self, day: TrackerDay, as_of_when: VTime) -> None:
+        """Write the day summary report file.
 
+        The file is not rewritten just to update its 'Report generated' time.
+        """
         fn = "summary.txt"
         day_end_fn = os.path.join(cfg.REPORTS_FOLDER, fn)
-        if not pr.set_output(day_end_fn):
-            return
 
+        summary = self._section(
+            "summary",
+            (as_of_when.num, self._data_version),
+            lambda: rep.summary_report(day, [as_of_when]),
+        )
+
+        def render_chart():
+            pr.iprint()
+            rep.full_chart(day, as_of_when=as_of_when)
+
+        # The chart shows only events up to as_of_when; if the latest
+        # of those is unchanged and none have changed, neither has it.
+        chart = self._section(
+            "chart",
+            (self._chart_version, day.latest_event(as_of_when)),
+            render_chart,
+        )
+        pr.start_capture()
         pr.iprint(ut.date_str(day.date, long_date=True))
         pr.iprint(f"Report generated {ut.date_str('today')} {VTime('now')}")
-        rep.summary_report(day, [as_of_when])
-        pr.iprint()
-        rep.full_chart(day,as_of_when=as_of_when)
-        pr.set_output()
+        header = pr.end_capture()
+        self._write_if_changed(day_end_fn, header + summary + chart, summary + chart)
@@ -68,10 +68,9 @@ Copyright (C) 2023-2025 Julias Hocking & Todd Glover
 import re
 import math
 
-try:
-    import numpy as np
-except ImportError:  # pragma: no cover - numpy is optional at runtime
-    np = None  # type: ignore
+# numpy is optional at runtime, and only needed for CIELAB blending,
+# so it is imported by Color._require_numpy() when first needed.
+np = None  # type: ignore
 
 from web.color_names import COLOR_NAMES
 
@@ -393,7 +392,13 @@ class Color(tuple):
 
     @staticmethod
     def _require_numpy() -> None:
-        """Ensure numpy is available for LAB conversions."""
+        """Ensure numpy is available (imported) for LAB conversions."""
+        global np  # pylint:disable=global-statement
+        if np is None:
+            try:
+                import numpy as np  # pylint:disable=import-outside-toplevel
+            except ImportError:  # pragma: no cover
+                np = None  # type: ignore
         if np is None:
             raise RuntimeError(
                 "CIELAB blending requires numpy. Install numpy to use this mode."
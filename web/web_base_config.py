@@ -45,9 +45,21 @@ MAX_PAGES_BACK = 49
 # multiple lines.
 DATA_OWNER = ""
 
-# Database filename
+# Database filename.  If the database is in WAL mode (DB_WAL_MODE in
+# database_local_config.py), the web server's user needs write access
+# to the folder it is in, not just read access to the file.
 DB_FILENAME = ""  # Filepath to sqlite3 database
 
+# On-disk cache of report pages.  Set to a folder writable by the
+# web server to enable; clear it out after upgrading TagTracker.
+# A page is reused until the database changes or it is older than
+# RESPONSE_CACHE_MAX_AGE seconds (RESPONSE_CACHE_TODAY_MAX_AGE for pages
+# that include today, since they change through the day).
+RESPONSE_CACHE_FOLDER = ""
+RESPONSE_CACHE_MAX_AGE = 24 * 60 * 60
+RESPONSE_CACHE_TODAY_MAX_AGE = 60
+RESPONSE_CACHE_MAX_MB = 50
+
 # Estimator configuration (override in web_local_config.py if desired)
 # Confidence level thresholds: minimum matched cohort size (min_n) and
 # minimum fraction of day elapsed (min_frac) for Medium/High.
@@ -83,6 +95,19 @@ EST_Z_CUTOFF = 2.5
 # Recent-window size for schedule-only model
 EST_RECENT_DAYS = 30
 
+# Most random forest models to keep fitted between requests, when the
+# reports are served by a long-running process (web_wsgi).  Models are
+# refitted whenever the database changes.
+EST_MODEL_CACHE_SIZE = 32
+
+# Snapshot of today's estimates, precomputed every few minutes by
+# web_estimate_snapshot.py (e.g. from cron).  If set, estimates are
+# served from it when it has them and is no more than
+# EST_SNAPSHOT_MAX_AGE seconds old.  Must be writable by that job and
+# readable by the web server.
+EST_SNAPSHOT_FILE = ""
+EST_SNAPSHOT_MAX_AGE = 15 * 60
+
 # Optional path to calibration JSON
 # (produced by helpers/estimator_calibrate_models.py --recommended)
 # If set, estimator will use per-model, per-measure, per-time-bin residual bands and
@@ -80,81 +80,61 @@ def _process_iso_dow(
     orgsite_id: int,
     start_date: str = "",
     end_date: str = "",
-) -> tuple[str, str]:
+) -> tuple[str, db.DayFilter]:
     # Use dow to make report title prefix, and day filter for SQL queries.
-    conditions = [f"orgsite_id = {orgsite_id}"]
     title_bit = ""
-
-    if dow_value:
-        if isinstance(dow_value, int):
-            tokens = [dow_value]
+    validated = db.DayFilter.parse_weekdays(dow_value) if dow_value else []
+    if validated:
+        if len(validated) == 1:
+            title_bit = f"{ut.dow_str(validated[0])} "
         else:
-            tokens = [
-                int(piece.strip())
-                for piece in str(dow_value).split(",")
-                if piece.strip().isdigit()
-            ]
-        validated: list[int] = []
-        for value in tokens:
-            if 1 <= value <= 7:
-                validated.append(value)
-        validated = sorted(set(validated))
-
-        if validated:
-            zero_based = ["0" if value == 7 else str(value % 7) for value in validated]
-            if len(zero_based) == 1:
-                conditions.append(f"strftime('%w',date) = '{zero_based[0]}'")
-            else:
-                quoted = "','".join(zero_based)
-                conditions.append(f"strftime('%w',date) IN ('{quoted}')")
-
-            if len(validated) == 1:
-                title_bit = f"{ut.dow_str(validated[0])} "
+            option = find_dow_option(",".join(str(v) for v in validated))
+            if option.value:
+                title_bit = f"{option.title_bit} "
             else:
-                option = find_dow_option(",".join(str(v) for v in validated))
-                if option.value:
-                    title_bit = f"{option.title_bit} "
-                else:
-                    title_names = ", ".join(ut.dow_str(v) for v in validated)
-                    title_bit = f"{title_names} "
+                title_names = ", ".join(ut.dow_str(v) for v in validated)
+                title_bit = f"{title_names} "
 
-    if start_date:
-        conditions.append(f"date >= '{start_date}'")
-    if end_date:
-        conditions.append(f"date <= '{end_date}'")
-
-    day_where_clause = f" where {' and '.join(conditions)}"
-
-    return title_bit, day_where_clause
+    day_filter = db.DayFilter(
+        orgsite_id=orgsite_id,
+        start_date=start_date or "",
+        end_date=end_date or "",
+        weekdays=validated,
+    )
+    return title_bit, day_filter
 
 
-def _fetch_block_rows(ttdb: sqlite3.Connection, day_filter: str) -> list[db.DBRow]:
+def _fetch_block_rows(
+    ttdb: sqlite3.Connection, day_filter: db.DayFilter
+) -> list[db.DBRow]:
+    where, params = day_filter.where("day")
     sel = (
         "select "
         "    day.date,"
-        "    block.time_start,"
+        "    block.time_start_min,"
         "    block.num_incoming_combined,"
         "    block.num_outgoing_combined,"
         "    block.num_on_hand_combined "
         "from day "
         "JOIN block ON block.day_id = day.id"
-        f"    {day_filter} "
-        "order by day.date, block.time_start"
+        f"    where {where} "
+        "order by day.date, block.time_start_min"
     )
-    return db.db_fetch(ttdb, sel)
+    return db.db_fetch(ttdb, sel, params=params)
 
 
-def _fetch_day_data(ttdb: sqlite3.Connection, day_filter: str):
+def _fetch_day_data(ttdb: sqlite3.Connection, day_filter: db.DayFilter):
+    where, params = day_filter.where()
     sel = (
         "select "
         "   date, num_parked_combined day_total_bikes, "
         "      num_fullest_combined day_max_bikes, "
         "      time_fullest_combined day_max_bikes_time "
         "from day "
-        f"  {day_filter} "
+        f"  where {where} "
         "   order by date desc"
     )
-    return db.db_fetch(ttdb, sel)
+    return db.db_fetch(ttdb, sel, params=params)
 
 
 def process_day_data(dayrows: list) -> tuple[dict[str:_OneDay], _OneDay]:
@@ -180,9 +160,9 @@ def process_blocks_data(
 
     rows_by_date = defaultdict(dict)
     for row in blockrows:
-        block_time = VTime(row.time_start)
-        if not block_time:
+        if row.time_start_min is None:
             continue
+        block_time = VTime(row.time_start_min)
         rows_by_date[row.date][block_time] = row
 
     for date, day_summary in tabledata.items():
@@ -539,7 +519,7 @@ def blocks_report(
     )
     normalized_dow = filter_widget.selection.dow_value
 
-    _, day_where_clause = _process_iso_dow(
+    _, day_filter = _process_iso_dow(
         normalized_dow,
         orgsite_id=orgsite_id,
         start_date=start_date,
@@ -549,8 +529,8 @@ def blocks_report(
     filter_description = filter_widget.description()
     date_filter_html = filter_widget.html
 
-    dayrows: list[db.DBRow] = _fetch_day_data(ttdb, day_where_clause)
-    blockrows: list[db.DBRow] = _fetch_block_rows(ttdb, day_where_clause)
+    dayrows: list[db.DBRow] = _fetch_day_data(ttdb, day_filter)
+    blockrows: list[db.DBRow] = _fetch_block_rows(ttdb, day_filter)
 
     # range_label = f"({start_date} to {end_date})" if start_date or end_date else ""
 
@@ -26,6 +26,7 @@ import sys
 import os
 import sqlite3
 from dataclasses import dataclass, field, fields
+from typing import Iterable
 import copy
 import urllib
 from datetime import datetime, timedelta
@@ -75,6 +76,7 @@ WHAT_ESTIMATE_VERBOSE = "EstV"
 WHAT_PREDICT_FUTURE = "Ft"
 WHAT_DOWNLOAD_CSV = "d.v"
 WHAT_DOWNLOAD_DB = "d.b"
+WHAT_DOWNLOAD_PARQUET = "d.p"
 WHAT_VALID_VALUES = {
     WHAT_OVERVIEW,
     WHAT_BLOCKS,
@@ -98,6 +100,7 @@ WHAT_VALID_VALUES = {
     WHAT_ESTIMATE_VERBOSE,
     WHAT_DOWNLOAD_CSV,
     WHAT_DOWNLOAD_DB,
+    WHAT_DOWNLOAD_PARQUET,
     WHAT_DATERANGE_DETAIL,
     WHAT_PREDICT_FUTURE,
 }
@@ -153,6 +156,20 @@ def error_out(msg: str = ""):
     sys.exit(1)
 
 
+def commuter_hump_analyzer():
+    """Return the CommuterHumpAnalyzer class, or None if it can't be used.
+
+    It needs numpy and scipy, which are slow to import, so it is imported
+    the first time a report asks for it rather than by every report.
+    """
+    try:
+        # pylint:disable-next=import-outside-toplevel
+        from common.commuter_hump import CommuterHumpAnalyzer
+    except ImportError:  # pragma: no cover - optional dependency
+        return None
+    return CommuterHumpAnalyzer
+
+
 def test_dow_parameter(dow_parameter: str, list_ok: bool = True):
     """Check if dow_parameter is ok."""
     if list_ok:
@@ -824,20 +841,20 @@ def get_days_data(
     ttdb: sqlite3.Connection,
     min_date: str = "",
     max_date: str = "",
+    weekdays: Iterable[int] = None,
 ) -> list[DayTotals]:
-    """Create the list of totals about a set of days."""
+    """Create the list of totals about a set of days (optionally only some weekdays)."""
 
     orgsite_id = 1  # FIXME: hardcoded orgsite_id
     cursor = ttdb.cursor()
-    day_ids = db.fetch_day_id_list(
-        cursor=cursor, orgsite_id=orgsite_id, min_date=min_date, max_date=max_date
+    totals_list = db.fetch_day_totals_range(
+        cursor=cursor,
+        orgsite_id=orgsite_id,
+        min_date=min_date,
+        max_date=max_date,
+        weekdays=weekdays,
     )
-
-    totals_list = []
-    for day_id in day_ids:
-        # day = DayTotals()
-        day = db.fetch_day_totals(cursor=cursor, day_id=day_id)
-        totals_list.append(day)
+    cursor.close()
     return totals_list
 
 
@@ -40,11 +40,6 @@ import web.web_estimator as web_estimator
 from web import web_histogram
 from web.web_base_config import EST_TYPE_FOR_ONEDAY_SUMMARY, HIST_FIXED_Y_AXIS_FULLNESS
 
-try:
-    from common.commuter_hump import CommuterHumpAnalyzer
-except ImportError:  # pragma: no cover - optional dependency
-    CommuterHumpAnalyzer = None
-
 
 HIGHLIGHT_NONE = 0
 HIGHLIGHT_WARN = 1
@@ -259,9 +254,10 @@ def one_day_tags_report(
 
     commuter_mean = None
     commuter_confidence = None
-    if not is_today and CommuterHumpAnalyzer is not None:
+    hump_analyzer = cc.commuter_hump_analyzer()
+    if not is_today and hump_analyzer is not None:
         try:
-            analyzer = CommuterHumpAnalyzer(
+            analyzer = hump_analyzer(
                 db_path=ttdb,
                 start_date=thisday,
                 end_date=thisday,
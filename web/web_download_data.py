@@ -1,14 +1,14 @@
 #!/usr/bin/env python3
 
 import csv
+import importlib.util
+import io
 import os
-import shutil
 import sqlite3
 import sys
 import tempfile
 # import urllib.parse
 from pathlib import Path
-from typing import Optional
 import zipfile
 from datetime import datetime
 
@@ -17,11 +17,15 @@ from datetime import datetime
 
 from web.web_base_config import DB_FILENAME, DATA_OWNER
 import web.web_common as cc
+import common.tt_util as ut
 
 CSV_ARCHIVE_NAME = "bikedata-csv.zip"
+PARQUET_ARCHIVE_NAME = "bikedata-parquet.zip"
 DB_ARCHIVE_NAME = "bikedata-db.zip"
 DB_ARCHIVE_DB_NAME = "bikedata.db"
 TABLES = ["day", "visit"]
+FETCH_ROWS = 2000  # Rows read from the database at a time
+BACKUP_PAGES_PER_STEP = 1024  # Database pages copied per backup step
 DEBUG_ENV_FLAG = "TAGTRACKER_DEBUG"
 DEBUG_ENABLED = bool(os.environ.get(DEBUG_ENV_FLAG))
 
@@ -37,121 +41,228 @@ def debug(message: str) -> None:
 
 
 
-def write_data_owner(readme_file) -> None:
-    if isinstance(DATA_OWNER, list):
-        for owner in DATA_OWNER:
-            readme_file.write(f"{owner}\n")
-    else:
-        readme_file.write(f"{DATA_OWNER}\n")
+def readme_text(start_date: str = "", end_date: str = "") -> str:
+    """Return the text of the README.TXT that goes in each archive."""
+    lines = [f"Extraction Date: {datetime.now()}"]
+    if start_date or end_date:
+        lines.append(f"Dates: {start_date or 'earliest'} to {end_date or 'latest'}")
+    lines.append("")
+    lines.extend(DATA_OWNER if isinstance(DATA_OWNER, list) else [DATA_OWNER])
+    return "\n".join(lines) + "\n"
+
+
+def _table_query(
+    conn: sqlite3.Connection, table: str, start_date: str, end_date: str
+) -> tuple[str, list[str]]:
+    """Return (sql, params) selecting the rows of table within the date range."""
+    conditions = []
+    params = []
+    if start_date:
+        conditions.append("day.date >= ?")
+        params.append(start_date)
+    if end_date:
+        conditions.append("day.date <= ?")
+        params.append(end_date)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    if table == "visit":
+        # Include the date from the related day beside the foreign key.
+        visit_columns = [row[1] for row in conn.execute("PRAGMA table_info(visit)")]
+        select_columns = []
+        for column in visit_columns:
+            select_columns.append(f"visit.{column}")
+            if column == "day_id":
+                select_columns.append("day.date AS day_date")
+        return (
+            "SELECT "
+            + ", ".join(select_columns)
+            + " FROM visit LEFT JOIN day ON day.id = visit.day_id"
+            + where
+            + " ORDER BY visit.id",
+            params,
+        )
+    return f"SELECT * FROM {table}{where} ORDER BY day.id", params
+
+
+def _column_types(conn: sqlite3.Connection, cursor: sqlite3.Cursor) -> list[str]:
+    """Return the declared (upper case) SQLite type of each column in cursor."""
+    declared = {}
+    for table in TABLES:
+        for row in conn.execute(f"PRAGMA table_info({table})"):
+            declared.setdefault(row[1], (row[2] or "").upper())
+    declared["day_date"] = "TEXT"
+    return [declared.get(col[0], "") for col in cursor.description]
+
+
+def _fetch_chunks(cursor: sqlite3.Cursor):
+    """Yield the rows of cursor, FETCH_ROWS at a time."""
+    while rows := cursor.fetchmany(FETCH_ROWS):
+        yield rows
+
+
+def _write_csv_entry(zf: zipfile.ZipFile, name: str, cursor: sqlite3.Cursor) -> int:
+    """Stream cursor's rows into a CSV entry of zf; return the number of rows."""
+    num_rows = 0
+    entry = zf.open(name, "w", force_zip64=True)
+    with io.TextIOWrapper(entry, encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([col[0] for col in cursor.description])
+        for rows in _fetch_chunks(cursor):
+            writer.writerows(rows)
+            num_rows += len(rows)
+    return num_rows
+
+
+class _CountingWriter:
+    """A write-only file wrapper that knows its position (for pyarrow)."""
+
+    def __init__(self, raw) -> None:
+        self.raw = raw
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.position += len(data)
+        return self.raw.write(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        self.raw.flush()
+
+    def close(self) -> None:
+        self.closed = True
+
 
+def _write_parquet_entry(
+    zf: zipfile.ZipFile, name: str, conn: sqlite3.Connection, cursor: sqlite3.Cursor
+) -> int:
+    """Stream cursor's rows into a Parquet entry of zf; return the number of rows.
 
-def write_readme(directory: str) -> None:
-    readme_path = os.path.join(directory, "README.TXT")
-    with open(readme_path, "w", encoding="utf-8") as readme_file:
-        readme_file.write(f"Extraction Date: {datetime.now()}\n")
-        readme_file.write("\n")
-        write_data_owner(readme_file)
+    Each chunk of rows becomes a row group, so memory use stays bounded.
+    """
+    # pylint:disable=import-outside-toplevel
+    import pyarrow as pa
+    import pyarrow.parquet as pq
 
+    arrow_types = {"INTEGER": pa.int64(), "REAL": pa.float64(), "FLOAT": pa.float64()}
+    names = [col[0] for col in cursor.description]
+    types = [arrow_types.get(t, pa.string()) for t in _column_types(conn, cursor)]
+    schema = pa.schema(list(zip(names, types)))
 
-def send_csv_archive() -> None:
-    if DB_PATH is None:
-        cc.error_out("Database path is not configured.")
+    num_rows = 0
+    with zf.open(name, "w", force_zip64=True) as entry:
+        with pq.ParquetWriter(_CountingWriter(entry), schema) as writer:
+            for rows in _fetch_chunks(cursor):
+                columns = list(zip(*rows))
+                arrays = [
+                    pa.array(
+                        [None if v is None else str(v) for v in column]
+                        if arrow_type == pa.string()
+                        else column,
+                        type=arrow_type,
+                    )
+                    for column, arrow_type in zip(columns, types)
+                ]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                num_rows += len(rows)
+    return num_rows
 
+
+def send_table_archive(
+    requested_format: str, start_date: str = "", end_date: str = ""
+) -> None:
+    """Stream a zip of the day & visit tables (as CSV or Parquet) to stdout.
+
+    Rows go from the database cursor straight into the zip entries on
+    stdout, a chunk at a time.  All tables are read in one transaction, so
+    they are consistent with each other even if the database is updated
+    meanwhile.
+    """
     if not DB_PATH.exists():
         cc.error_out(f"Database file '{DB_PATH}' not found.")
+    if requested_format == cc.WHAT_DOWNLOAD_PARQUET:
+        if importlib.util.find_spec("pyarrow") is None:
+            cc.error_out("Parquet downloads need the pyarrow module.")
+        archive_name, suffix = PARQUET_ARCHIVE_NAME, "parquet"
+    else:
+        archive_name, suffix = CSV_ARCHIVE_NAME, "csv"
 
     sys.stdout.write("Content-Type: application/zip\r\n")
-    sys.stdout.write(
-        f"Content-Disposition: attachment; filename={CSV_ARCHIVE_NAME}\r\n"
-    )
+    sys.stdout.write(f"Content-Disposition: attachment; filename={archive_name}\r\n")
     sys.stdout.write("\r\n")
     sys.stdout.flush()
 
-    with tempfile.TemporaryDirectory() as csv_dir:
-        debug(f"creating CSV archive in temp dir '{csv_dir}'")
-        conn = sqlite3.connect(str(DB_PATH))
-        conn.row_factory = sqlite3.Row
-        try:
-            for table in TABLES:
-                out_path = os.path.join(csv_dir, f"{table}.csv")
-                debug(f"writing table '{table}' to '{out_path}'")
-                with open(out_path, "w", newline="", encoding="utf-8") as f:
-                    writer = csv.writer(f)
-                    if table == "visit":
-                        # Include the date from the related day beside the foreign key.
-                        visit_columns = [
-                            row[1] for row in conn.execute("PRAGMA table_info(visit)")
-                        ]
-                        select_columns = []
-                        for column in visit_columns:
-                            select_columns.append(f"visit.{column}")
-                            if column == "day_id":
-                                select_columns.append("day.date AS day_date")
-                        select_sql = (
-                            "SELECT "
-                            + ", ".join(select_columns)
-                            + " FROM visit LEFT JOIN day ON day.id = visit.day_id"
-                        )
-                        cur = conn.execute(select_sql)
-                    else:
-                        cur = conn.execute(f"SELECT * FROM {table}")
-                    headers = [col[0] for col in cur.description]
-                    rows = cur.fetchall()
-                    writer.writerow(headers)
-                    writer.writerows(rows)
-                    debug(f"table '{table}' headers={headers} rows_written={len(rows)}")
-        finally:
-            conn.close()
-            debug("database connection closed after CSV extraction")
-
-        write_readme(csv_dir)
-        debug(f"readme written: {os.path.join(csv_dir, 'README.TXT')}")
-
+    conn = sqlite3.connect(f"{DB_PATH.absolute().as_uri()}?mode=ro", uri=True)
+    try:
         with zipfile.ZipFile(sys.stdout.buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-            for name in os.listdir(csv_dir):
-                debug(f"adding '{name}' to CSV archive")
-                zf.write(os.path.join(csv_dir, name), arcname=name)
-        sys.stdout.buffer.flush()
-        debug("CSV archive streaming complete")
+            conn.execute("BEGIN")
+            for table in TABLES:
+                name = f"{table}.{suffix}"
+                sql, params = _table_query(conn, table, start_date, end_date)
+                cursor = conn.execute(sql, params)
+                if suffix == "parquet":
+                    num_rows = _write_parquet_entry(zf, name, conn, cursor)
+                else:
+                    num_rows = _write_csv_entry(zf, name, cursor)
+                debug(f"table '{table}' rows_written={num_rows} to '{name}'")
+            conn.execute("COMMIT")
+            zf.writestr("README.TXT", readme_text(start_date, end_date))
+    finally:
+        conn.close()
+        debug("database connection closed after table extraction")
+    sys.stdout.buffer.flush()
+    debug(f"{suffix} archive streaming complete")
 
 
 def send_database() -> None:
-    if DB_PATH is None:
-        cc.error_out("Database path is not configured.")
+    """Stream a zip of a consistent snapshot of the whole database to stdout.
 
+    The snapshot is made with SQLite's online backup API, a few pages at a
+    time, so it neither blocks writers for long nor catches them half done.
+    """
     if not DB_PATH.exists():
         cc.error_out(f"Database file '{DB_PATH}' not found.")
 
-    sys.stdout.write("Content-Type: application/zip\r\n")
-    sys.stdout.write(f"Content-Disposition: attachment; filename={DB_ARCHIVE_NAME}\r\n")
-    sys.stdout.write("\r\n")
-    sys.stdout.flush()
-
     with tempfile.TemporaryDirectory() as tmp_dir:
-        debug(f"creating DB archive in temp dir '{tmp_dir}'")
-        db_exists = DB_PATH.exists()
-        db_size = DB_PATH.stat().st_size if db_exists else "missing"
-        debug(f"source database '{str(DB_PATH)}' exists={db_exists} size={db_size}")
-        shutil.copyfile(str(DB_PATH), os.path.join(tmp_dir, DB_ARCHIVE_DB_NAME))
-        debug(f"copied database to '{os.path.join(tmp_dir, DB_ARCHIVE_DB_NAME)}'")
-        write_readme(tmp_dir)
-        debug(f"readme written: {os.path.join(tmp_dir, 'README.TXT')}")
+        snapshot_path = os.path.join(tmp_dir, DB_ARCHIVE_DB_NAME)
+        debug(f"backing up database '{DB_PATH}' to '{snapshot_path}'")
+        source = sqlite3.connect(f"{DB_PATH.absolute().as_uri()}?mode=ro", uri=True)
+        snapshot = sqlite3.connect(snapshot_path)
+        try:
+            source.backup(snapshot, pages=BACKUP_PAGES_PER_STEP)
+        finally:
+            snapshot.close()
+            source.close()
+        debug(f"snapshot size={os.path.getsize(snapshot_path)}")
+
+        sys.stdout.write("Content-Type: application/zip\r\n")
+        sys.stdout.write(
+            f"Content-Disposition: attachment; filename={DB_ARCHIVE_NAME}\r\n"
+        )
+        sys.stdout.write("\r\n")
+        sys.stdout.flush()
 
         with zipfile.ZipFile(sys.stdout.buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-            for name in os.listdir(tmp_dir):
-                debug(f"adding '{name}' to DB archive")
-                zf.write(os.path.join(tmp_dir, name), arcname=name)
+            zf.write(snapshot_path, arcname=DB_ARCHIVE_DB_NAME)
+            zf.writestr("README.TXT", readme_text())
         sys.stdout.buffer.flush()
         debug("DB archive streaming complete")
 
 
 def main() -> None:
-    requested_format = cc.CGIManager().cgi_to_params().what_report
+    params = cc.CGIManager().cgi_to_params()
+    requested_format = params.what_report
     debug(f"main dispatching format='{requested_format}'")
     if requested_format == cc.WHAT_DOWNLOAD_DB:
         send_database()
-    elif requested_format == cc.WHAT_DOWNLOAD_CSV:
-        send_csv_archive()
+    elif requested_format in (cc.WHAT_DOWNLOAD_CSV, cc.WHAT_DOWNLOAD_PARQUET):
+        send_table_archive(
+            requested_format,
+            start_date=ut.date_str(params.start_date) if params.start_date else "",
+            end_date=ut.date_str(params.end_date) if params.end_date else "",
+        )
     else:
         cc.error_out(f"Invalid download request '{requested_format}'.")
 
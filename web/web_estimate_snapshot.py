@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""Precomputed estimates for today, for the estimator to serve at once.
+
+Most estimate requests during a day ask nearly the same question: today's
+schedule, about now, with about as many bikes so far as the database
+has.  Run this module every few minutes (e.g. from cron) to work out
+the estimates for a grid of as-of times (from now, every --step minutes
+for the next --minutes) and bikes-so-far values (around the database's
+count) and save them to EST_SNAPSHOT_FILE:
+
+    python3 -m web.web_estimate_snapshot [--minutes 15] [--step 5] ...
+
+lookup() finds the estimate for a request at the latest as-of time in
+the grid that is not after the request's, if it has that schedule and
+number of bikes.  The estimator CGI (plain text or JSON) and the
+detailed estimate page use it, and estimate live when it has nothing.
+
+Copyright (C) 2023-2025 Julias Hocking & Todd Glover
+
+    Notwithstanding the licensing information below, this code may not
+    be used in a commercial (for-profit, non-profit or government) setting
+    without the copyright-holder's written consent.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Optional
+
+import common.tt_util as ut
+from common.tt_time import VTime
+import web.web_base_config as wcfg
+
+# Estimation types in a snapshot.  'verbose' is made from the same
+# estimate as 'standard', so costs nothing more.
+SNAPSHOT_TYPES = ("standard", "verbose", "quick")
+
+# The snapshot is a small SQLite database, so that a lookup reads only
+# the one estimate it needs.
+SNAPSHOT_SCHEMA = """
+CREATE TABLE snapshot (date TEXT, created FLOAT, step INTEGER);
+CREATE TABLE estimate (key TEXT PRIMARY KEY, data TEXT) WITHOUT ROWID;
+"""
+
+
+def snapshot_key(
+    estimation_type: str, opening_time, closing_time, as_of_when, bikes_so_far
+) -> str:
+    """Return the key of an estimate in a snapshot."""
+    return "|".join(
+        (
+            estimation_type or "standard",
+            str(VTime(opening_time)),
+            str(VTime(closing_time)),
+            str(VTime(as_of_when)),
+            str(int(bikes_so_far)),
+        )
+    )
+
+
+def lookup(
+    estimation_type: str = "",
+    opening_time: str = "",
+    closing_time: str = "",
+    bikes_so_far: str = "",
+    as_of_when: str = "",
+) -> Optional[dict]:
+    """Return the precomputed estimate (Estimator.result_data()) for a request.
+
+    The estimate is for the latest as-of time in the snapshot at or
+    before as_of_when (default now), so it never counts on activity
+    that has not happened yet.  Returns None if the snapshot has none
+    for these values.
+    """
+    filepath = getattr(wcfg, "EST_SNAPSHOT_FILE", "")
+    bikes_so_far = str(bikes_so_far).strip()
+    as_of = VTime(as_of_when or "now")
+    if not filepath or not os.path.exists(filepath):
+        return None
+    if not bikes_so_far.isdigit() or not as_of:
+        return None
+    if not VTime(opening_time) or not VTime(closing_time):
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{filepath}?mode=ro", uri=True)
+        try:
+            date, created, step = conn.execute(
+                "SELECT date, created, step FROM snapshot"
+            ).fetchone()
+            max_age = getattr(wcfg, "EST_SNAPSHOT_MAX_AGE", 15 * 60)
+            if date != ut.date_str("today") or time.time() - created > max_age:
+                return None
+            grid_time = VTime(min(24 * 60, as_of.num // step * step))
+            key = snapshot_key(
+                (estimation_type or "").strip().lower(),
+                opening_time,
+                closing_time,
+                grid_time,
+                bikes_so_far,
+            )
+            row = conn.execute(
+                "SELECT data FROM estimate WHERE key = ?", (key,)
+            ).fetchone()
+        finally:
+            conn.close()
+    except (sqlite3.Error, TypeError, ValueError, ZeroDivisionError):
+        # No snapshot to speak of; estimate live
+        return None
+    return json.loads(row[0]) if row else None
+
+
+def make_snapshot(
+    opening_time: str,
+    closing_time: str,
+    bikes_now: int,
+    minutes: int,
+    step: int,
+    bikes_below: int,
+    bikes_above: int,
+) -> dict:
+    """Return a snapshot of estimates for today's schedule."""
+    # pylint:disable-next=import-outside-toplevel
+    from web.web_estimator import Estimator, ERROR
+
+    first = VTime("now").num // step * step
+    as_of_times = [
+        VTime(num) for num in range(first, min(first + minutes, 24 * 60) + 1, step)
+    ]
+    bikes_values = range(max(0, bikes_now - bikes_below), bikes_now + bikes_above + 1)
+    estimates = {}
+    for as_of in as_of_times:
+        for bikes in bikes_values:
+            for estimation_type in ("standard", "quick"):
+                est = Estimator(
+                    bikes_so_far=str(bikes),
+                    opening_time=opening_time,
+                    closing_time=closing_time,
+                    estimation_type=estimation_type,
+                    as_of_when=as_of,
+                )
+                if est.state != ERROR:
+                    est.guess()
+                if est.state == ERROR:
+                    # Leave it to be estimated live (and perhaps work then)
+                    continue
+                key_parts = (opening_time, closing_time, as_of, bikes)
+                estimates[snapshot_key(estimation_type, *key_parts)] = est.result_data()
+                if estimation_type == "standard":
+                    est.estimation_type = "verbose"
+                    est.verbose = True
+                    data = est.result_data()
+                    # For the detailed estimate page
+                    data["html_lines"] = est.result_msg(as_html=True)
+                    estimates[snapshot_key("verbose", *key_parts)] = data
+    return {
+        "date": ut.date_str("today"),
+        "created": time.time(),
+        "step": step,
+        "estimates": estimates,
+    }
+
+
+def save_snapshot(filepath: str, snapshot: dict) -> None:
+    """Save a snapshot (from make_snapshot()) to filepath.
+
+    It is written to a temporary file that then replaces filepath, so
+    readers only ever see a whole snapshot.
+    """
+    temp_filepath = f"{filepath}.{os.getpid()}.tmp"
+    if os.path.exists(temp_filepath):
+        os.remove(temp_filepath)
+    conn = sqlite3.connect(temp_filepath)
+    try:
+        conn.executescript(SNAPSHOT_SCHEMA)
+        conn.execute(
+            "INSERT INTO snapshot VALUES (?,?,?)",
+            (snapshot["date"], snapshot["created"], snapshot["step"]),
+        )
+        conn.executemany(
+            "INSERT INTO estimate VALUES (?,?)",
+            (
+                (key, json.dumps(data, separators=(",", ":")))
+                for key, data in snapshot["estimates"].items()
+            ),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(temp_filepath, filepath)
+
+
+def main():
+    """Make a snapshot of today's estimates and save it to EST_SNAPSHOT_FILE."""
+    parser = argparse.ArgumentParser(
+        description="Precompute today's estimates into EST_SNAPSHOT_FILE."
+    )
+    parser.add_argument(
+        "--minutes", type=int, default=15, help="How far ahead to estimate for."
+    )
+    parser.add_argument(
+        "--step", type=int, default=5, help="Minutes between as-of times."
+    )
+    parser.add_argument(
+        "--bikes-below",
+        type=int,
+        default=5,
+        help="Estimate for this many fewer bikes than the database has so far.",
+    )
+    parser.add_argument(
+        "--bikes-above",
+        type=int,
+        default=25,
+        help="Estimate for this many more bikes than the database has so far.",
+    )
+    parser.add_argument(
+        "--opening-time", default="", help="Today's opening time (else from database)."
+    )
+    parser.add_argument(
+        "--closing-time", default="", help="Today's closing time (else from database)."
+    )
+    args = parser.parse_args()
+
+    filepath = getattr(wcfg, "EST_SNAPSHOT_FILE", "")
+    if not filepath:
+        print("EST_SNAPSHOT_FILE is not set.", file=sys.stderr)
+        sys.exit(1)
+    # pylint:disable-next=import-outside-toplevel
+    import web.web_estimator as web_estimator
+
+    if not os.path.exists(wcfg.DB_FILENAME):
+        print(f"Database {wcfg.DB_FILENAME} not found.", file=sys.stderr)
+        sys.exit(1)
+    database = web_estimator.db.db_connect(wcfg.DB_FILENAME, web_estimator.db.DB_READ_ONLY)
+    if not database or web_estimator.missing_derived_columns(database.cursor()):
+        print(web_estimator.MIGRATE_MESSAGE, file=sys.stderr)
+        sys.exit(1)
+    orgsite_id = web_estimator.Estimator.orgsite_id
+    db_open, db_close = web_estimator.today_schedule(database, orgsite_id)
+    opening_time = args.opening_time or db_open
+    closing_time = args.closing_time or db_close
+    if not VTime(opening_time) or not VTime(closing_time):
+        print("No opening and closing times for today.", file=sys.stderr)
+        sys.exit(1)
+    if VTime("now") > VTime(closing_time):
+        # Nothing more to estimate today
+        return
+
+    start = time.perf_counter()
+    snapshot = make_snapshot(
+        str(VTime(opening_time)),
+        str(VTime(closing_time)),
+        web_estimator.bikes_right_now(database, orgsite_id),
+        max(0, args.minutes),
+        max(1, args.step),
+        max(0, args.bikes_below),
+        max(0, args.bikes_above),
+    )
+    save_snapshot(filepath, snapshot)
+    print(
+        f"Saved {len(snapshot['estimates'])} estimates to {filepath} "
+        f"in {time.perf_counter() - start:.1f} seconds."
+    )
+
+
+if __name__ == "__main__":
+    main()
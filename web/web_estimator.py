@@ -35,7 +35,8 @@ Copyright (C) 2023-2025 Julias Hocking & Todd Glover
 
 """
 
-import urllib.request
+import hashlib
+import json
 import urllib.parse
 import traceback as _tb
 from web.web_estimator_calibration import (
@@ -48,7 +49,6 @@ from web.web_estimator_selection import dispatch_select as _select_dispatch
 import os
 import sys
 import time
-from typing import Optional
 
 # sys.path.append("../")
 # sys.path.append("./")
@@ -58,7 +58,11 @@ import web.web_base_config as wcfg
 import web.web_common as cc
 import common.tt_util as ut
 from common.tt_time import VTime
+from common.tt_occupancy import OccupancyCurve
 import database.tt_dbutil as db
+from database.db_add_derived_columns import missing_derived_columns, MIGRATE_MESSAGE
+import database.tt_day_curves as day_curves
+import web.web_response_cache as rcache
 
 # import client_base_config as cfg
 import web.web_estimator_rf as rf
@@ -73,6 +77,46 @@ READY = "ready"  # model is ready to use
 OK = "ok"  # model has been used to create a guess OK
 ERROR = "error"  # the model is unusable, in an error state
 
+# Largest number of dates to put in one "IN (...)" list
+_DATES_PER_QUERY = 500
+
+
+def _chunks(dates: list[str]):
+    for start in range(0, len(dates), _DATES_PER_QUERY):
+        yield dates[start : start + _DATES_PER_QUERY]
+
+
+def bikes_right_now(database, orgsite_id: int) -> int:
+    """Return the number of bikes in so far today, as the database has it."""
+    today = ut.date_str("today")
+    cursor = database.cursor()
+    day_id = db.fetch_day_id(cursor=cursor, date=today, maybe_orgsite_id=orgsite_id)
+    if not day_id:
+        return 0
+    rows = db.db_fetch(
+        database,
+        f"select count(time_in_min) as cnt from visit where day_id = {day_id}",
+        ["cnt"],
+    )
+    return int(rows[0].cnt) if rows else 0
+
+
+def today_schedule(database, orgsite_id: int) -> tuple[str | None, str | None]:
+    """Return today's (opening time, closing time) from the database."""
+    today = ut.date_str("today")
+    cursor = database.cursor()
+    day_id = db.fetch_day_id(cursor=cursor, date=today, maybe_orgsite_id=orgsite_id)
+    if not day_id:
+        return None, None
+    rows = db.db_fetch(
+        database,
+        f"SELECT time_open, time_closed FROM day WHERE id = {day_id}",
+        ["time_open", "time_closed"],
+    )
+    if rows:
+        return rows[0].time_open, rows[0].time_closed
+    return None, None
+
 
 # New estimator that provides a concise estimation table
 class Estimator:
@@ -126,19 +170,19 @@ class Estimator:
         base = getattr(self, "MEAS_FURTHER", "Further bikes")
         return f"{base} (to total {total})"
 
-    # Static cache for calibration JSON
-    _CALIB_CACHE = None
-
     def __init__(
         self,
         bikes_so_far: str = "",
         opening_time: str = "",
         closing_time: str = "",
         estimation_type: str = "",
+        as_of_when: str = "",
     ) -> None:
         self.state = INCOMPLETE
         self.error = ""
         self.database = None
+        # date -> OccupancyCurve of that day's visits, loaded once per request
+        self._curves_by_date: dict[str, OccupancyCurve] = {}
         self.estimation_type = (estimation_type or "").strip().lower()
         self.verbose = bool(self.estimation_type == "verbose")
         raw_open_param = (opening_time or "").strip()
@@ -160,7 +204,11 @@ class Estimator:
             self.error = "Database not found"
             self.state = ERROR
             return
-        self.database = db.db_connect(DBFILE)
+        self.database = db.db_connect(DBFILE, db.DB_READ_ONLY)
+        if self.database and missing_derived_columns(self.database.cursor()):
+            self.error = MIGRATE_MESSAGE
+            self.state = ERROR
+            return
 
         bikes_input = str(bikes_so_far or "").strip()
         if self.estimation_type != "schedule":
@@ -180,7 +228,7 @@ class Estimator:
                 bikes_input = "0"
         self.bikes_so_far = int(bikes_input)
 
-        self.as_of_when = VTime("now")
+        self.as_of_when = VTime(as_of_when or "now")
         if not self.as_of_when:
             self.error = "Bad current time."
             self.state = ERROR
@@ -244,36 +292,10 @@ class Estimator:
         self.table_rows: list[tuple[str, str, str]] = []
 
     def _bikes_right_now(self) -> int:
-        today = ut.date_str("today")
-        cursor = self.database.cursor()
-        day_id = db.fetch_day_id(
-            cursor=cursor, date=today, maybe_orgsite_id=self.orgsite_id
-        )
-        if not day_id:
-            return 0
-        rows = db.db_fetch(
-            self.database,
-            f"select count(time_in) as cnt from visit where day_id = {day_id} and time_in > ''",
-            ["cnt"],
-        )
-        return int(rows[0].cnt) if rows else 0
+        return bikes_right_now(self.database, self.orgsite_id)
 
     def _fetch_today_schedule(self) -> tuple[str | None, str | None]:
-        today = ut.date_str("today")
-        cursor = self.database.cursor()
-        day_id = db.fetch_day_id(
-            cursor=cursor, date=today, maybe_orgsite_id=self.orgsite_id
-        )
-        if not day_id:
-            return None, None
-        rows = db.db_fetch(
-            self.database,
-            f"SELECT time_open, time_closed FROM day WHERE id = {day_id}",
-            ["time_open", "time_closed"],
-        )
-        if rows:
-            return rows[0].time_open, rows[0].time_closed
-        return None, None
+        return today_schedule(self.database, self.orgsite_id)
 
     def _time_bounds(self, base: VTime, tol_min: int) -> tuple[str, str]:
         base_num = base.num if base and base.num is not None else 0
@@ -297,8 +319,8 @@ class Estimator:
         return f"""
             SELECT
                 D.date,
-                SUM(CASE WHEN V.time_in <= '{self.as_of_when}' THEN 1 ELSE 0 END) AS befores,
-                SUM(CASE WHEN V.time_in > '{self.as_of_when}' THEN 1 ELSE 0 END) AS afters
+                SUM(V.time_in_min <= {self.as_of_when.num}) AS befores,
+                SUM(V.time_in_min > {self.as_of_when.num}) AS afters
             FROM DAY D
             JOIN VISIT V ON D.id = V.day_id
             WHERE {where_sql}
@@ -306,17 +328,13 @@ class Estimator:
         """
 
     def _maybe_load_calibration(self) -> None:
-        if Estimator._CALIB_CACHE is not None:
-            self._calib = Estimator._CALIB_CACHE
-            self._calib_debug.append("calibration: using cached JSON")
-        else:
-            calib, bins, best, dbg = _calib_load(wcfg, __file__)
-            self._calib_debug.extend(dbg)
-            if calib:
-                Estimator._CALIB_CACHE = calib
-                self._calib = calib
-                self._calib_bins = bins
-                self._calib_best = best
+        # Cached by the calibration module (and reloaded if the file changes)
+        calib, bins, best, dbg = _calib_load(wcfg, __file__)
+        self._calib_debug.extend(dbg)
+        if calib:
+            self._calib = calib
+            self._calib_bins = bins
+            self._calib_best = best
         # Parse bins for quick lookup
         if self._calib and isinstance(self._calib.get("time_bins", None), list):
             bins = []
@@ -374,90 +392,54 @@ class Estimator:
                 out.append(self.similar_dates[i])
         return out
 
-    def _visits_for_date(self, date_str: str) -> list[tuple[VTime, Optional[VTime]]]:
-        day_id = db.fetch_day_id(
-            cursor=self.database.cursor(),
-            date=date_str,
-            maybe_orgsite_id=self.orgsite_id,
-        )
-        if not day_id:
-            return []
-        rows = db.db_fetch(
-            self.database,
-            f"SELECT time_in, time_out FROM VISIT WHERE day_id = {day_id} ORDER BY time_in",
-            ["time_in", "time_out"],
-        )
-        out = []
-        for r in rows:
-            tin = VTime(r.time_in)
-            tout = VTime(r.time_out) if r.time_out else None
-            out.append((tin, tout))
-        return out
+    def _load_curves(self, dates) -> None:
+        """Load the curves for dates into the curves store.
 
-    @staticmethod
-    def _counts_for_time(
-        visits: list[tuple[VTime, Optional[VTime]]], t: VTime
-    ) -> tuple[int, int, int, int, int]:
-        t_end = VTime(min(t.num + 60, 24 * 60))
-        before_ins = sum(1 for tin, _ in visits if tin and tin <= t)
-        after_ins = sum(1 for tin, _ in visits if tin and tin > t)
-        outs_up_to_t = sum(1 for _, tout in visits if tout and tout <= t)
-        ins_next = sum(1 for tin, _ in visits if tin and t < tin <= t_end)
-        outs_next = sum(1 for _, tout in visits if tout and t < tout <= t_end)
-        return before_ins, after_ins, outs_up_to_t, ins_next, outs_next
-
-    @staticmethod
-    def _peak_future_occupancy(
-        visits: list[tuple[VTime, Optional[VTime]]], t: VTime, close: VTime
-    ) -> tuple[int, VTime]:
-        occ_now = sum(1 for tin, _ in visits if tin and tin <= t) - sum(
-            1 for _, tout in visits if tout and tout <= t
-        )
-        events: list[tuple[int, int]] = []
-        for tin, tout in visits:
-            if tin and t < tin <= close:
-                events.append((int(VTime(tin).num), +1))
-            if tout and t < tout <= close:
-                events.append((int(VTime(tout).num), -1))
-        events.sort(key=lambda x: (x[0], -x[1]))
-        peak = occ_now
-        peak_time = t
-        occ = occ_now
-        for tm, delta in events:
-            occ += delta
-            if occ > peak:
-                peak = occ
-                peak_time = VTime(tm)
-        return peak, peak_time
-
-    @staticmethod
-    def _peak_all_day_occupancy(
-        visits: list[tuple[VTime, Optional[VTime]]],
-    ) -> tuple[int, VTime]:
-        """Compute the maximum occupancy and when it occurs over the entire day.
-
-        Uses all visit events (ins as +1, outs as -1) from the day's data
-        without restricting to times after now. Assumes occupancy is zero
-        before the first event of the day.
+        Curves come from the DAY_CURVE table where it has them, else
+        are built from the days' visits (fetched a few hundred days per
+        query, to stay within SQLite's limit on query parameters).
         """
-        events: list[tuple[int, int]] = []
-        for tin, tout in visits:
-            if tin:
-                events.append((int(VTime(tin).num), +1))
-            if tout:
-                events.append((int(VTime(tout).num), -1))
-        if not events:
-            return 0, VTime("00:00")
-        events.sort(key=lambda x: (x[0], -x[1]))
-        occ = 0
-        peak = 0
-        peak_time = VTime(events[0][0])
-        for tm, delta in events:
-            occ += delta
-            if occ > peak:
-                peak = occ
-                peak_time = VTime(tm)
-        return peak, peak_time
+        dates = sorted(dates)
+        day_rows = []
+        for some_dates in _chunks(dates):
+            day_rows += db.db_fetch(
+                self.database,
+                "SELECT id, date FROM DAY "
+                f"WHERE orgsite_id = ? AND date IN ({','.join('?' * len(some_dates))})",
+                ["day_id", "date"],
+                params=[self.orgsite_id, *some_dates],
+            )
+        if day_rows:
+            stored = day_curves.fetch_day_curves(
+                self.database.cursor(), [r.day_id for r in day_rows]
+            )
+            for r in day_rows:
+                if r.day_id in stored:
+                    self._curves_by_date[r.date] = stored[r.day_id]
+        dates = [d for d in dates if d not in self._curves_by_date]
+        visits_by_date = {d: [] for d in dates}
+        for some_dates in _chunks(dates):
+            rows = db.db_fetch(
+                self.database,
+                "SELECT D.date, V.time_in_min, V.time_out_min "
+                "FROM DAY D JOIN VISIT V ON V.day_id = D.id "
+                "WHERE D.orgsite_id = ? "
+                f"AND D.date IN ({','.join('?' * len(some_dates))})",
+                ["date", "time_in", "time_out"],
+                params=[self.orgsite_id, *some_dates],
+            )
+            for r in rows:
+                visits_by_date[r.date].append((r.time_in, r.time_out))
+        for d, visits in visits_by_date.items():
+            self._curves_by_date[d] = OccupancyCurve(visits)
+
+    def _occupancy_for_date(self, date_str: str) -> OccupancyCurve:
+        if date_str not in self._curves_by_date:
+            # The first lookup loads all the similar dates at once
+            self._load_curves(
+                {date_str, *self.similar_dates} - self._curves_by_date.keys()
+            )
+        return self._curves_by_date[date_str]
 
     def _confidence_level(self, n: int, frac_elapsed: float) -> str:
         cfg = getattr(wcfg, "EST_CONF_THRESHOLDS", None)
@@ -841,13 +823,11 @@ class Estimator:
         nxh_acts: list[int] = []
         peaks: list[tuple[int, VTime]] = []
         for d in dates:
-            vlist = self._visits_for_date(d)
-            _b, _a, _outs_to_t, ins_nxh, outs_nxh = self._counts_for_time(
-                vlist, self.as_of_when
-            )
+            curve = self._occupancy_for_date(d)
+            _b, _a, _outs_to_t, ins_nxh, outs_nxh = curve.counts_at(self.as_of_when)
             nxh_acts.append(int(ins_nxh + outs_nxh))
-            p, pt = self._peak_all_day_occupancy(vlist)
-            peaks.append((int(p), pt))
+            p, pt = curve.peak()
+            peaks.append((int(p), VTime(pt)))
         return nxh_acts, peaks
 
     def _collect_all_stats_for_similar(
@@ -857,14 +837,12 @@ class Estimator:
         all_peaks: list[int] = []
         all_ptimes: list[VTime] = []
         for d in self.similar_dates:
-            vlist = self._visits_for_date(d)
-            _b2, _a2, _outs2, ins2, outs2 = self._counts_for_time(
-                vlist, self.as_of_when
-            )
+            curve = self._occupancy_for_date(d)
+            _b2, _a2, _outs2, ins2, outs2 = curve.counts_at(self.as_of_when)
             all_acts.append(int(ins2 + outs2))
-            p2, pt2 = self._peak_all_day_occupancy(vlist)
+            p2, pt2 = curve.peak()
             all_peaks.append(int(p2))
-            all_ptimes.append(pt2)
+            all_ptimes.append(VTime(pt2))
         return all_acts, all_peaks, all_ptimes
 
     def _point_estimates_from(
@@ -1358,17 +1336,16 @@ class Estimator:
 
         rec_acts, rec_afters, rec_peaks, rec_ptimes = [], [], [], []
         for d in rec_dates:
-            vlist = self._visits_for_date(d)
-            _b3, _a3, _o3, ins3, outs3 = self._counts_for_time(vlist, self.as_of_when)
+            curve = self._occupancy_for_date(d)
+            _b3, _a3, _o3, ins3, outs3 = curve.counts_at(self.as_of_when)
             rec_acts.append(int(ins3 + outs3))
             if d in date_to_after:
                 rec_afters.append(int(date_to_after[d]))
             else:
-                _btmp, _atmp, *_ = self._counts_for_time(vlist, self.as_of_when)
-                rec_afters.append(int(_atmp))
-            p3, pt3 = self._peak_all_day_occupancy(vlist)
+                rec_afters.append(int(_a3))
+            p3, pt3 = curve.peak()
             rec_peaks.append(int(p3))
-            rec_ptimes.append(int(pt3.num))
+            rec_ptimes.append(int(pt3))
 
         rec_act_val = (
             int(_st.median(rec_acts)) if rec_acts else int(nxh_activity_baseline)
@@ -1499,6 +1476,25 @@ class Estimator:
         ]
         return rows
 
+    def _rf_model_key(self) -> tuple:
+        """Return what the RF models' training data depends on.
+
+        That is the matching of similar days (orgsite, schedule and the
+        as-of minute), the database, whose stamp changes with each load,
+        and today's date, since today is left out of the similar days.
+        """
+        return (
+            wcfg.DB_FILENAME,
+            rcache.db_stamp(wcfg.DB_FILENAME),
+            ut.date_str("today"),
+            self.orgsite_id,
+            self.time_open.num,
+            self.time_closed.num,
+            self.as_of_when.num,
+            self.MATCH_OPEN_TOL,
+            self.MATCH_CLOSE_TOL,
+        )
+
     def _rf_possible(self) -> bool:
         return "rf" in globals() and getattr(rf, "POSSIBLE", False)
 
@@ -1527,9 +1523,16 @@ class Estimator:
 
         import numpy as _np
 
-        # Train RF models
-        rf_fut = rf.RandomForestRegressorModel()
-        rf_fut.create_model(self.similar_dates, self.befores, self.afters)
+        # Train RF models (or reuse ones fitted to the same data)
+        model_key = self._rf_model_key()
+        max_models = int(getattr(wcfg, "EST_MODEL_CACHE_SIZE", 32))
+        rf_fut = rf.fitted_model(
+            (*model_key, "fut"),
+            self.similar_dates,
+            self.befores,
+            self.afters,
+            max_models,
+        )
         rf_fut.guess(self.bikes_so_far)
         rf_remainder = (
             int(rf_fut.further_bikes)
@@ -1540,8 +1543,13 @@ class Estimator:
         # activity
         # Build all_acts from similar dates for consistency
         all_acts, all_peaks, _ = self._collect_all_stats_for_similar()
-        rf_act = rf.RandomForestRegressorModel()
-        rf_act.create_model(self.similar_dates, self.befores, all_acts)
+        rf_act = rf.fitted_model(
+            (*model_key, "act"),
+            self.similar_dates,
+            self.befores,
+            all_acts,
+            max_models,
+        )
         rf_act.guess(self.bikes_so_far)
         rf_act_val = (
             int(rf_act.further_bikes)
@@ -1550,8 +1558,13 @@ class Estimator:
         )
 
         # peak
-        rf_pk = rf.RandomForestRegressorModel()
-        rf_pk.create_model(self.similar_dates, self.befores, all_peaks)
+        rf_pk = rf.fitted_model(
+            (*model_key, "peak"),
+            self.similar_dates,
+            self.befores,
+            all_peaks,
+            max_models,
+        )
         rf_pk.guess(self.bikes_so_far)
         rf_peak_val = (
             int(rf_pk.further_bikes)
@@ -1903,11 +1916,76 @@ class Estimator:
                 pass
         return lines
 
+    def result_data(self) -> dict:
+        """Return the results (after guess()) as plain data, e.g. for JSON.
+
+        'lines' is result_msg() as text, for clients that just show it.
+        Each table's rows have the measure, value, range and probability,
+        plus the chosen model (best guess table) or whether the row was
+        chosen as the best guess (model tables).
+        """
+        data = {
+            "state": self.state,
+            "error": self.error,
+            "estimation_type": self.estimation_type,
+            "lines": self.result_msg(),
+        }
+        if self.state == ERROR:
+            return data
+        mixed_models = getattr(self, "_mixed_models", None) or []
+        selected_by_model = getattr(self, "_selected_by_model", None) or {}
+        tables = []
+        for t_index, (title, rows, model_code) in enumerate(self.tables):
+            table_rows = []
+            for i, row in enumerate(rows):
+                measure, value, rng, prob = row[:4]
+                table_row = {
+                    "measure": measure,
+                    "value": value,
+                    "range": rng,
+                    "probability": prob,
+                }
+                if t_index == 0:
+                    table_row["model"] = (
+                        mixed_models[i] if i < len(mixed_models) else ""
+                    )
+                else:
+                    table_row["best"] = i in selected_by_model.get(model_code, set())
+                table_rows.append(table_row)
+            tables.append({"title": title, "model": model_code, "rows": table_rows})
+        data.update(
+            as_of=self.as_of_when.short,
+            bikes_so_far=self.bikes_so_far,
+            opening_time=str(self.time_open),
+            closing_time=str(self.time_closed),
+            tables=tables,
+        )
+        return data
+
+
+def print_json_response(data: dict) -> None:
+    """Print an estimate's result_data() as a CGI response of JSON.
+
+    The response has an ETag and may be reused for as long as a report
+    page about today.  A request whose If-None-Match has the same ETag
+    gets an empty 304 response instead.
+    """
+    body = json.dumps(data, sort_keys=True)
+    etag = f'"{hashlib.sha256(body.encode("utf-8")).hexdigest()[:32]}"'
+    print(f"ETag: {etag}")
+    print(f"Cache-Control: max-age={int(wcfg.RESPONSE_CACHE_TODAY_MAX_AGE)}")
+    if_none_match = os.environ.get("HTTP_IF_NONE_MATCH", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        print("Status: 304 Not Modified\n")
+        return
+    print("Content-type: application/json\n")
+    print(body)
+
 
 if __name__ == "__main__":
     try:
         # Parse CGI inputs for the estimator
-        def _init_from_cgi() -> tuple[Estimator, str]:
+        def _init_from_cgi() -> tuple[dict, str]:
             query_str = ut.untaint(os.environ.get("QUERY_STRING", ""))
             query_parms = urllib.parse.parse_qs(query_str)
             bikes_so_far = query_parms.get("bikes_so_far", [""])[0]
@@ -1923,34 +2001,52 @@ if __name__ == "__main__":
             render_format = (
                 (query_parms.get("format", ["plain"])[0] or "plain").strip().lower()
             )
-            est = Estimator(
-                bikes_so_far=bikes_so_far,
-                opening_time=opening_time,
-                closing_time=closing_time,
-                estimation_type=estimation_type,
-            )
-            return est, render_format
+            est_params = {
+                "bikes_so_far": bikes_so_far,
+                "opening_time": opening_time,
+                "closing_time": closing_time,
+                "estimation_type": estimation_type,
+            }
+            return est_params, render_format
 
         start_time = time.perf_counter()
         estimate_any = None
         is_cgi = bool(os.environ.get("REQUEST_METHOD"))
         render_format = "plain"
         render_html = False
+        precomputed = None
         if is_cgi:
-            estimate_any, render_format = _init_from_cgi()
+            est_params, render_format = _init_from_cgi()
+            if render_format in ("json", "plain"):
+                # pylint:disable-next=import-outside-toplevel
+                import web.web_estimate_snapshot as snapshot
+
+                precomputed = snapshot.lookup(**est_params)
+            if render_format == "json":
+                if precomputed is None:
+                    estimate_any = Estimator(**est_params)
+                    if estimate_any.state != ERROR:
+                        estimate_any.guess()
+                    precomputed = estimate_any.result_data()
+                print_json_response(precomputed)
+                sys.exit(0)
             render_html = render_format == "html"
             mime = "text/html" if render_html else "text/plain"
             print(f"Content-type: {mime}\n")
             if render_html:
                 print(cc.style())
+            if precomputed is None:
+                estimate_any = Estimator(**est_params)
         else:
             print("Must use CGI interface")
             exit()
 
-        if estimate_any.state != ERROR:
-            estimate_any.guess()
-
-        output_lines = estimate_any.result_msg(as_html=render_html)
+        if precomputed is not None:
+            output_lines = precomputed["lines"]
+        else:
+            if estimate_any.state != ERROR:
+                estimate_any.guess()
+            output_lines = estimate_any.result_msg(as_html=render_html)
         for line in output_lines:
             print(line)
         end_time = time.perf_counter()
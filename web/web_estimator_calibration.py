@@ -38,6 +38,15 @@ from typing import Any, Dict, List, Optional, Tuple
 _CACHE: Optional[Dict[str, Any]] = None
 _CACHE_BINS: Optional[List[Tuple[float, float, str]]] = None
 _CACHE_BEST: Optional[Dict[str, Dict[str, str]]] = None
+# (path, mtime) of the file in _CACHE, so a recalibrated file is picked up
+_CACHE_STAMP: Optional[Tuple[str, int]] = None
+
+
+def _file_stamp(path: str) -> Optional[Tuple[str, int]]:
+    try:
+        return path, os.stat(path).st_mtime_ns
+    except OSError:
+        return None
 
 
 def load_calibration(wcfg_module, module_file: str) -> Tuple[Optional[dict], Optional[List[Tuple[float, float, str]]], Optional[dict], List[str]]:
@@ -46,8 +55,8 @@ def load_calibration(wcfg_module, module_file: str) -> Tuple[Optional[dict], Opt
     Returns (calib_dict, bins_list, best_model_map, debug_messages)
     """
     debug: List[str] = []
-    global _CACHE, _CACHE_BINS, _CACHE_BEST
-    if _CACHE is not None:
+    global _CACHE, _CACHE_BINS, _CACHE_BEST, _CACHE_STAMP
+    if _CACHE is not None and _file_stamp(_CACHE_STAMP[0]) == _CACHE_STAMP:
         debug.append("calibration: using cached JSON")
         return _CACHE, _CACHE_BINS, _CACHE_BEST, debug
 
@@ -70,6 +79,7 @@ def load_calibration(wcfg_module, module_file: str) -> Tuple[Optional[dict], Opt
         if not exists:
             continue
         try:
+            stamp = _file_stamp(p)
             with open(p, "r", encoding="utf-8") as fh:
                 calib = json.load(fh)
                 debug.append(f"calibration: loaded '{p}'")
@@ -96,6 +106,7 @@ def load_calibration(wcfg_module, module_file: str) -> Tuple[Optional[dict], Opt
 
     best_model = calib.get("best_model", None)
     _CACHE, _CACHE_BINS, _CACHE_BEST = calib, (bins_list or None), best_model
+    _CACHE_STAMP = stamp
     return _CACHE, _CACHE_BINS, _CACHE_BEST, debug
 
 
@@ -22,21 +22,23 @@ Copyright (C) 2023-2025 Julias Hocking & Todd Glover
 
 """
 
+import collections
+import importlib.util
+
 # numpy and sklearn might not be present. POSSIBLE is used to indicate
 # whether the Random Forest Regression model is at all possible.
-try:
-    import numpy as np
-    from sklearn.ensemble import RandomForestRegressor
-
-    # from sklearn.metrics import mean_squared_error
-    # from sklearn.metrics import mean_absolute_error
-
-    POSSIBLE = True
-except (ModuleNotFoundError, ImportError):
-    POSSIBLE = False
+# They are slow to import, so are only imported when a model is made.
+POSSIBLE = all(
+    importlib.util.find_spec(module) is not None for module in ("numpy", "sklearn")
+)
 
 import common.tt_util as ut
 
+# Fitted models, by the key their caller gave for the data they were
+# fitted to; least recently used first.  Under a long-running server
+# (web_wsgi) this saves refitting the same forests for each request.
+_fitted_models: collections.OrderedDict = collections.OrderedDict()
+
 # Constants for model states
 INCOMPLETE = "incomplete"  # initialized but not ready to use
 READY = "ready"  # model is ready to use
@@ -73,6 +75,10 @@ class RandomForestRegressorModel:
             self.error = "missing modules"
         if self.state == ERROR:
             return
+        # pylint:disable=import-outside-toplevel
+        import numpy as np
+        from sklearn.ensemble import RandomForestRegressor
+
         self.befores = befores
         self.afters = afters
         self.X_train = np.array(befores).reshape(-1, 1)
@@ -83,6 +89,17 @@ class RandomForestRegressorModel:
 
         # self.calculate_normalized_errors()
 
+    def fresh_copy(self) -> "RandomForestRegressorModel":
+        """Return a new model, ready to guess, that shares this one's fitted forest."""
+        model = RandomForestRegressorModel()
+        model.befores = self.befores
+        model.afters = self.afters
+        model.X_train = self.X_train
+        model.y_train = self.y_train
+        model.rf_model = self.rf_model
+        model.state = READY
+        return model
+
     def guess(self, bikes_so_far):
         if self.state == ERROR:
             return
@@ -92,6 +109,8 @@ class RandomForestRegressorModel:
             return
 
         try:
+            import numpy as np  # pylint:disable=import-outside-toplevel
+
             predicted_afters = self.rf_model.predict(
                 np.array([bikes_so_far]).reshape(-1, 1)
             )
@@ -118,6 +137,33 @@ class RandomForestRegressorModel:
         return lines
 
 
+def fitted_model(
+    key: tuple, dates, befores, afters, max_models: int = 32
+) -> RandomForestRegressorModel:
+    """Return a model fitted to (befores, afters).
+
+    key must change whenever the data it stands for might, e.g. by
+    including a stamp of the database.  A model already fitted for key
+    is reused; otherwise a new one is fitted and kept, dropping the
+    least recently used once there are more than max_models.
+
+    The kept models are never guessed with; callers get a fresh copy,
+    so that what one guess() does (e.g. failing) doesn't carry over.
+    """
+    model = _fitted_models.get(key)
+    if model is not None:
+        _fitted_models.move_to_end(key)
+        return model.fresh_copy()
+    model = RandomForestRegressorModel()
+    model.create_model(dates, befores, afters)
+    if model.state != READY or max_models <= 0:
+        return model
+    _fitted_models[key] = model
+    while len(_fitted_models) > max_models:
+        _fitted_models.popitem(last=False)
+    return model.fresh_copy()
+
+
 if __name__ == "__main__":
     # Example usage of the RandomForestRegressorModel class
     dates = ["2023-04-07", "2023-10-01", "2023-05-01"]
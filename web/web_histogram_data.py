@@ -1,59 +1,276 @@
 """
 Data preparation utilities for the histogram views.
+
+Each histogram is made from a single query that fetches the minute values
+on the days in scope (with those days' operating hours), which are then
+counted into buckets in one pass.  Counting uses numpy when it is
+installed, and plain Python otherwise.
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import sqlite3
+from typing import Sequence
 
 import database.tt_dbutil as db
 import web.web_common as cc
 from common.tt_time import VTime
 
+# numpy is optional, so is imported by _numpy() when first needed.
+np = None  # type: ignore
+_NUMPY_CHECKED = False
+
+
+def _numpy():
+    """Return the numpy module, or None if it is not installed."""
+    global np, _NUMPY_CHECKED  # pylint:disable=global-statement
+    if not _NUMPY_CHECKED:
+        _NUMPY_CHECKED = True
+        try:
+            import numpy as np  # pylint:disable=import-outside-toplevel,redefined-outer-name
+        except ImportError:
+            np = None  # type: ignore
+    return np
 
-def _minutes_expr(column_name: str) -> str:
-    """Return SQL expression that converts HH:MM text to minutes."""
 
-    return (
-        f"CASE WHEN {column_name} IS NULL OR {column_name} = '' THEN NULL "
-        f"WHEN length({column_name}) < 5 THEN NULL "
-        f"ELSE ((CAST(substr({column_name}, 1, 2) AS INTEGER) * 60) + "
-        f"CAST(substr({column_name}, 4, 2) AS INTEGER)) END"
+def _build_day_filter(
+    orgsite_filter: int = 1,
+    start_date: str | None = None,
+    end_date: str | None = None,
+    days_of_week: str | None = None,
+) -> db.DayFilter:
+    """Return the filter for the days that a histogram is about."""
+
+    weekdays = []
+    if days_of_week:
+        cc.test_dow_parameter(days_of_week, list_ok=True)
+        weekdays = db.DayFilter.parse_weekdays(days_of_week)
+    return db.DayFilter(
+        orgsite_id=orgsite_filter,
+        start_date=start_date or "",
+        end_date=end_date or "",
+        weekdays=weekdays,
     )
 
 
-def _duration_minutes_expr(column_name: str = "V.duration") -> str:
-    """Return SQL expression that coerces duration text to integer minutes."""
+def _hours_buckets(
+    min_open: str | None, max_close: str | None, category_minutes: int
+) -> tuple[int | None, int | None]:
+    """Return the (open, close) buckets for the operating hours."""
+    open_bucket = close_bucket = None
+    open_minutes = VTime(min_open).num if min_open else None
+    close_minutes = VTime(max_close).num if max_close else None
+    if open_minutes is not None and category_minutes:
+        open_bucket = (open_minutes // category_minutes) * category_minutes
+    if close_minutes is not None and category_minutes:
+        close_effective = max(close_minutes - 1, 0)
+        close_bucket = (close_effective // category_minutes) * category_minutes
+    return open_bucket, close_bucket
+
+
+def _clipped_bincount(
+    indexes: list[int], low: int, high: int, weights: list[float] | None = None
+) -> tuple[list, bool, bool]:
+    """Count (or if weights given, sum the weights of) indexes into bins low..high.
+
+    Indexes outside that range go into the first or last bin, so the
+    totals still reflect them.  Returns (totals, have_unders, have_overs).
+    """
+    size = high - low + 1
+    if _numpy() is not None:
+        index_array = np.asarray(indexes, dtype=np.int64)
+        totals = np.bincount(
+            np.clip(index_array, low, high) - low, weights=weights, minlength=size
+        )
+        return (
+            totals.tolist(),
+            bool((index_array < low).any()),
+            bool((index_array > high).any()),
+        )
+
+    totals = [0] * size
+    have_unders = have_overs = False
+    for i, index in enumerate(indexes):
+        if index < low:
+            index = low
+            have_unders = True
+        elif index > high:
+            index = high
+            have_overs = True
+        totals[index - low] += 1 if weights is None else weights[i]
+    return totals, have_unders, have_overs
+
+
+def _bincount_2d(
+    row_indexes, column_indexes, first_row: int, num_rows: int, num_columns: int
+) -> list[int]:
+    """Count (row, column) index pairs into a num_rows x num_columns grid
+    whose first row is first_row.  Returns the counts row by row."""
+    if _numpy() is not None:
+        flat_indexes = (
+            np.asarray(row_indexes) - first_row
+        ) * num_columns + np.asarray(column_indexes)
+        return np.bincount(flat_indexes, minlength=num_rows * num_columns).tolist()
+    counts = [0] * (num_rows * num_columns)
+    for row, column in zip(row_indexes, column_indexes):
+        counts[(row - first_row) * num_columns + column] += 1
+    return counts
+
+
+def _extent(values) -> tuple[int, int]:
+    """Return (min, max) of values."""
+    if _numpy() is not None:
+        return int(values.min()), int(values.max())
+    return min(values), max(values)
+
+
+def _edge_labels(
+    minutes: range, have_unders: bool, have_overs: bool
+) -> list[str]:
+    """Return bucket labels, marking the ends that hold out-of-range values.
 
-    return (
-        f"CASE WHEN {column_name} IS NULL OR {column_name} = '' THEN NULL "
-        f"ELSE CAST({column_name} AS INTEGER) END"
+    The '-' and '+' suffixes tell the renderers that the first/last bucket
+    includes values from outside the visible window.
+    """
+    labels = [VTime(minute).tidy for minute in minutes]
+    if labels and have_unders:
+        labels[0] = f"{labels[0]}-"
+    if labels and have_overs:
+        labels[-1] = f"{labels[-1]}+"
+    return labels
+
+
+def _distinct_count(values) -> int:
+    """Return the number of distinct values."""
+    if _numpy() is not None:
+        return int(np.unique(values).size)
+    return len(set(values))
+
+
+def _floor_div(values, divisor: int):
+    """Return each value // divisor, as integers."""
+    if _numpy() is not None:
+        return (np.asarray(values) // divisor).astype(np.int64)
+    return [int(value) // divisor for value in values]
+
+
+@dataclass
+class DayValues:
+    """Values from one table for the days that histograms are about.
+
+    columns maps each column name to its values, one per row: a numpy array
+    (NaN where missing) if numpy is installed, otherwise a tuple (None
+    where missing).  day_ids are the rows' day ids, in the same form.
+    """
+
+    day_ids: Sequence = ()
+    columns: dict[str, Sequence] = field(default_factory=dict)
+    min_open: str | None = None
+    max_close: str | None = None
+
+    def select(
+        self,
+        *names: str,
+        at_least: dict[str, int] | None = None,
+        at_most: dict[str, int] | None = None,
+    ) -> list:
+        """Return [day ids, values of each named column] for the rows that
+        have all those values.
+
+        at_least and at_most optionally map named columns to limits that
+        the selected rows must be within.
+        """
+        at_least = {k: v for k, v in (at_least or {}).items() if v is not None}
+        at_most = {k: v for k, v in (at_most or {}).items() if v is not None}
+        columns = [self.columns[name] for name in names]
+
+        if _numpy() is not None:
+            keep = np.ones(len(self.day_ids), dtype=bool)
+            for values in columns:
+                keep &= ~np.isnan(values)
+            for name, limit in at_least.items():
+                keep &= self.columns[name] >= limit
+            for name, limit in at_most.items():
+                keep &= self.columns[name] <= limit
+            return [self.day_ids[keep], *(values[keep] for values in columns)]
+
+        rows = [row for row in zip(self.day_ids, *columns) if None not in row]
+        limits = [(names.index(name) + 1, limit, 1) for name, limit in at_least.items()]
+        limits += [(names.index(name) + 1, limit, -1) for name, limit in at_most.items()]
+        for position, limit, sign in limits:
+            rows = [row for row in rows if (row[position] - limit) * sign >= 0]
+        if not rows:
+            return [() for _ in range(len(names) + 1)]
+        return list(zip(*rows))
+
+
+def _fetch_day_values(
+    ttdb: sqlite3.Connection,
+    day_filter: db.DayFilter,
+    table: str,
+    column_names: list[str],
+    condition: str = "1 = 1",
+) -> DayValues:
+    """Fetch column_names of table for the days in day_filter.
+
+    The rows and the days' operating hours are read in one transaction,
+    so they agree even if the database is updated meanwhile.
+    """
+    day_filter_clause, day_filter_params = day_filter.where("D")
+    value_columns = ", ".join(f"T.{name}" for name in column_names)
+    own_transaction = not ttdb.in_transaction
+    if own_transaction:
+        ttdb.execute("BEGIN")
+    try:
+        min_open, max_close = ttdb.execute(
+            f"""
+            SELECT MIN(NULLIF(D.time_open, '')), MAX(NULLIF(D.time_closed, ''))
+            FROM DAY D
+            WHERE {day_filter_clause}
+            """,
+            day_filter_params,
+        ).fetchone()
+        rows = ttdb.execute(
+            f"""
+            SELECT T.day_id, {value_columns}
+            FROM DAY D
+            JOIN {table} T ON T.day_id = D.id
+            WHERE {day_filter_clause} AND {condition}
+            """,
+            day_filter_params,
+        ).fetchall()
+    finally:
+        if own_transaction:
+            ttdb.execute("COMMIT")
+
+    day_ids, *columns = zip(*rows) if rows else [()] * (len(column_names) + 1)
+    if _numpy() is not None:
+        day_ids = np.asarray(day_ids, dtype=np.int64)
+        columns = [np.asarray(values, dtype=np.float64) for values in columns]
+    return DayValues(
+        day_ids=day_ids,
+        columns=dict(zip(column_names, columns)),
+        min_open=min_open,
+        max_close=max_close,
     )
 
 
-def _build_day_filter_items(
-    orgsite_filter: int = 1,
+def fetch_visit_minutes(
+    ttdb: sqlite3.Connection,
     start_date: str | None = None,
     end_date: str | None = None,
     days_of_week: str | None = None,
-) -> list[str]:
-    """Return reusable WHERE-clause pieces that only reference the DAY table."""
-
-    items: list[str] = []
-    if orgsite_filter:
-        items.append(f"D.orgsite_id = {orgsite_filter}")
-    if start_date:
-        items.append(f"D.DATE >= '{start_date}'")
-    if end_date:
-        items.append(f"D.DATE <= '{end_date}'")
-    if days_of_week:
-        cc.test_dow_parameter(days_of_week, list_ok=True)
-        dow_bits = [int(s) for s in days_of_week.split(",")]
-        # SQLite's strftime uses 0=Sunday, TagTracker uses 7=Sunday; convert.
-        zero_based_days_of_week = ["0" if i == 7 else str(i) for i in dow_bits]
-        items.append(
-            f"""strftime('%w',D.DATE) IN ('{"','".join(zero_based_days_of_week)}')"""
-        )
-    return items
+    orgsite_id: int = 1,
+) -> DayValues:
+    """Fetch the visits' minute columns for the days in scope.
+
+    The result can be shared by several histograms of the same days.
+    """
+    return _fetch_day_values(
+        ttdb,
+        _build_day_filter(orgsite_id, start_date, end_date, days_of_week),
+        "VISIT",
+        ["time_in_min", "time_out_min", "duration"],
+    )
 
 
 @dataclass
@@ -92,6 +309,8 @@ class ArrivalDepartureMatrix:
         self.arrival_labels = []
         self.duration_labels = []
         self.normalized_values = {}
+        # Visits/day as one row per arrival bucket, one column per duration bucket
+        self._raw_matrix = []
 
     def fetch_raw_data(
         self,
@@ -103,330 +322,157 @@ class ArrivalDepartureMatrix:
         duration_bucket_minutes: int = 30,
         min_arrival_threshold: str = "06:00",
         max_duration_threshold: str | None = None,
+        visits: DayValues | None = None,
     ):
         """Load data from the database:
         raw_values
         day_count
         arrival_labels  (these will be .tidy - e.g. " 9:30" not "09:30" )
         duration_labels (ditto)
+
+        visits can be given to reuse minutes already fetched for these days.
+
+        Visits with a negative duration (bad data) are left out of the
+        matrix and do not count towards day_count.
         """
 
-        arrival_minutes_expr = _minutes_expr("V.time_in")
-        duration_minutes_expr = _duration_minutes_expr()
+        if visits is None:
+            visits = fetch_visit_minutes(ttdb, start_date, end_date, days_of_week)
 
-        day_filter_clause = self._build_day_filter_clause(
-            start_date=start_date, end_date=end_date, days_of_week=days_of_week
-        )
-        threshold_clause = self._build_threshold_clause(
-            min_arrival_threshold=min_arrival_threshold,
-            max_duration_threshold=max_duration_threshold,
-        )
-        base_cte = self._build_filtered_visits_cte(
-            day_filter_clause=day_filter_clause,
-            threshold_clause=threshold_clause,
-            arrival_minutes_expr=arrival_minutes_expr,
-            duration_minutes_expr=duration_minutes_expr,
+        min_arrival = (
+            VTime(min_arrival_threshold).num if min_arrival_threshold else None
         )
-
-        day_count = self._fetch_distinct_day_count(ttdb, base_cte)
-        bucket_rows = self._fetch_bucket_rows(
-            ttdb,
-            base_cte,
-            arrival_bucket_minutes=arrival_bucket_minutes,
-            duration_bucket_minutes=duration_bucket_minutes,
+        max_duration = (
+            VTime(max_duration_threshold, allow_large=True).num
+            if max_duration_threshold
+            else None
         )
 
-        buckets, arrival_range, duration_range = self._organize_bucket_rows(
-            bucket_rows,
-            arrival_bucket_minutes=arrival_bucket_minutes,
-            duration_bucket_minutes=duration_bucket_minutes,
+        # Negative durations (bad data) are left out
+        day_ids, arrivals, durations, _ = visits.select(
+            "time_in_min",
+            "duration",
+            "time_out_min",
+            at_least={"time_in_min": min_arrival, "duration": 0},
+            at_most={"duration": max_duration},
         )
+        day_count = _distinct_count(day_ids)
 
-        if not buckets:
+        if not day_count:
             self.raw_values = {}
             self.day_count = 0
             return
 
-        self.arrival_labels = self._build_arrival_labels(arrival_range)
-        self.duration_labels = self._build_duration_labels(duration_range)
-
-        raw_values = self._build_raw_matrix(
-            arrival_range=arrival_range,
-            duration_range=duration_range,
-            arrival_labels=self.arrival_labels,
-            duration_labels=self.duration_labels,
-            buckets=buckets,
-        )
-        self.raw_values = self._average_by_day(raw_values, day_count)
-        self.raw_values = self._truncate_low_values(self.raw_values, day_count)
-        self.day_count = day_count
-
-    def _build_day_filter_clause(
-        self,
-        start_date: str | None,
-        end_date: str | None,
-        days_of_week: str | None,
-    ) -> str:
-        day_filter_items = _build_day_filter_items(
-            start_date=start_date, end_date=end_date, days_of_week=days_of_week
+        # Arrivals span the buckets in use; durations always start at 0
+        arrival_indexes = _floor_div(arrivals, arrival_bucket_minutes)
+        duration_indexes = _floor_div(durations, duration_bucket_minutes)
+        first_arrival, last_arrival = _extent(arrival_indexes)
+        num_arrivals = last_arrival - first_arrival + 1
+        num_durations = _extent(duration_indexes)[1] + 1
+        counts = _bincount_2d(
+            arrival_indexes,
+            duration_indexes,
+            first_arrival,
+            num_arrivals,
+            num_durations,
         )
-        return " AND ".join(day_filter_items) if day_filter_items else "1 = 1"
 
-    def _build_threshold_clause(
-        self,
-        min_arrival_threshold: str | None,
-        max_duration_threshold: str | None,
-    ) -> str:
-        arrival_threshold_minutes = (
-            VTime(min_arrival_threshold).num if min_arrival_threshold else None
-        )
-        max_duration_minutes = (
-            VTime(max_duration_threshold, allow_large=True).num
-            if max_duration_threshold
-            else None
+        self.arrival_labels = [
+            bucket_label((first_arrival + i) * arrival_bucket_minutes)
+            for i in range(num_arrivals)
+        ]
+        self.duration_labels = [
+            duration_bucket_label(i * duration_bucket_minutes)
+            for i in range(num_durations)
+        ]
+        self._raw_matrix = self._average_by_day(
+            counts, num_arrivals, num_durations, day_count
         )
+        self.raw_values = self._as_lookup(self._raw_matrix)
+        self.day_count = day_count
 
-        threshold_filters: list[str] = []
-        if arrival_threshold_minutes is not None:
-            threshold_filters.append(
-                f"(arrival_minutes >= {int(arrival_threshold_minutes)})"
+    def _average_by_day(
+        self, counts: list[int], num_rows: int, num_columns: int, day_count: int
+    ):
+        """Return counts as a matrix of visits per day, with tiny values as 0."""
+        divisor = day_count or 1
+        if _numpy() is not None:
+            matrix = np.asarray(counts, dtype=np.float64).reshape(
+                num_rows, num_columns
             )
-        if max_duration_minutes is not None:
-            threshold_filters.append(
-                f"(duration_minutes <= {int(max_duration_minutes)})"
+            matrix /= divisor
+            matrix[matrix < self.VISIT_MIN_THRESHOLD] = 0.0
+            return matrix
+        matrix = []
+        for row_start in range(0, num_rows * num_columns, num_columns):
+            row = [
+                count / divisor
+                for count in counts[row_start : row_start + num_columns]
+            ]
+            matrix.append(
+                [0.0 if value < self.VISIT_MIN_THRESHOLD else value for value in row]
             )
-        return " AND ".join(threshold_filters) if threshold_filters else "1 = 1"
-
-    def _build_filtered_visits_cte(
-        self,
-        day_filter_clause: str,
-        threshold_clause: str,
-        arrival_minutes_expr: str,
-        duration_minutes_expr: str,
-    ) -> str:
-        return f"""
-        WITH filtered_visits AS (
-        SELECT
-            D.date AS visit_date,
-            {arrival_minutes_expr} AS arrival_minutes,
-            {duration_minutes_expr} AS duration_minutes
-        FROM
-            DAY D
-        JOIN
-            VISIT V ON D.id = V.day_id
-        WHERE {day_filter_clause}
-            AND V.time_out IS NOT NULL
-            AND V.time_out != ''
-            AND {arrival_minutes_expr} IS NOT NULL
-            AND {duration_minutes_expr} IS NOT NULL
-            AND {threshold_clause}
-    )
-        """
-
-    def _fetch_distinct_day_count(self, ttdb: sqlite3.Connection, base_cte: str) -> int:
-        day_count_query = (
-            base_cte
-            + "SELECT COUNT(DISTINCT visit_date) AS day_count FROM filtered_visits;"
-        )
-        day_rows = db.db_fetch(ttdb, day_count_query, ["day_count"])
-        day_count = day_rows[0].day_count if day_rows else 0
-        if day_count is None:
-            return 0
-        if not isinstance(day_count, int):
-            return int(day_count)
-        return day_count
-
-    def _fetch_bucket_rows(
-        self,
-        ttdb: sqlite3.Connection,
-        base_cte: str,
-        arrival_bucket_minutes: int,
-        duration_bucket_minutes: int,
-    ):
-        bucket_query = (
-            base_cte + "SELECT\n"
-            f"    arrival_minutes - (arrival_minutes % {arrival_bucket_minutes}) AS arrival_bucket,\n"
-            f"    duration_minutes - (duration_minutes % {duration_bucket_minutes}) AS duration_bucket,\n"
-            "    COUNT(*) AS bucket_count\n"
-            "FROM filtered_visits\n"
-            "WHERE arrival_minutes IS NOT NULL AND duration_minutes IS NOT NULL\n"
-            "GROUP BY arrival_bucket, duration_bucket\n"
-            "ORDER BY arrival_bucket, duration_bucket;\n"
-        )
-        return db.db_fetch(
-            ttdb,
-            bucket_query,
-            ["arrival_bucket", "duration_bucket", "bucket_count"],
-        )
-
-    def _organize_bucket_rows(
-        self,
-        bucket_rows,
-        arrival_bucket_minutes: int,
-        duration_bucket_minutes: int,
-    ) -> tuple[dict[int, dict[int, int]], list[int], list[int]]:
-        buckets: dict[int, dict[int, int]] = {}
-        arrival_buckets: set[int] = set()
-        duration_buckets: set[int] = set()
-
-        for row in bucket_rows:
-            if row.arrival_bucket is None or row.duration_bucket is None:
-                continue
-            arrival_minute = int(row.arrival_bucket)
-            duration_minute = int(row.duration_bucket)
-            count = int(row.bucket_count)
-            arrival_buckets.add(arrival_minute)
-            duration_buckets.add(duration_minute)
-            buckets.setdefault(arrival_minute, {})
-            buckets[arrival_minute][duration_minute] = count
-
-        arrival_range = self._expand_arrival_range(
-            arrival_buckets=arrival_buckets,
-            bucket_minutes=arrival_bucket_minutes,
-        )
-        duration_range = self._expand_duration_range(
-            duration_buckets=duration_buckets,
-            bucket_minutes=duration_bucket_minutes,
-        )
-
-        return buckets, arrival_range, duration_range
-
-    def _expand_arrival_range(
-        self, arrival_buckets: set[int], bucket_minutes: int
-    ) -> list[int]:
-        arrival_range = sorted(arrival_buckets)
-        if not arrival_range:
-            return arrival_range
-        start_arrival = arrival_range[0]
-        end_arrival = arrival_range[-1]
-        return list(
-            range(start_arrival, end_arrival + bucket_minutes, bucket_minutes)
-        )
-
-    def _expand_duration_range(
-        self, duration_buckets: set[int], bucket_minutes: int
-    ) -> list[int]:
-        duration_range = sorted(duration_buckets)
-        if not duration_range:
-            return duration_range
-        end_duration = duration_range[-1]
-        return list(range(0, end_duration + bucket_minutes, bucket_minutes))
-
-    def _build_arrival_labels(self, arrival_range: list[int]) -> list[str]:
-        labels: list[str] = []
-        for minute in arrival_range:
-            label = bucket_label(minute)
-            if label is None:
-                label = (
-                    VTime(minute, allow_large=True).tidy if minute is not None else ""
-                )
-            labels.append(label or VTime(minute).tidy)
-        return labels
-
-    def _build_duration_labels(self, duration_range: list[int]) -> list[str]:
-        labels: list[str] = []
-        for minute in duration_range:
-            label = duration_bucket_label(minute)
-            labels.append(label or VTime(minute).tidy)
-        return labels
-
-    def _build_raw_matrix(
-        self,
-        arrival_range: list[int],
-        duration_range: list[int],
-        arrival_labels: list[str],
-        duration_labels: list[str],
-        buckets: dict[int, dict[int, int]],
-    ) -> dict[str, dict[str, float]]:
-        raw_values: dict[str, dict[str, float]] = {}
-
-        for arrival_minute, arrival_label in zip(arrival_range, arrival_labels):
-            source = buckets.get(arrival_minute, {})
-            raw_row: dict[str, float] = {}
-            for duration_minute, duration_label in zip(duration_range, duration_labels):
-                raw_row[duration_label] = float(source.get(duration_minute, 0))
-            raw_values[arrival_label] = raw_row
-
-        return raw_values
+        return matrix
+
+    def _as_lookup(self, matrix) -> dict[str, dict[str, float]]:
+        """Return a matrix as {arrival label: {duration label: value}}."""
+        if _numpy() is not None:
+            matrix = np.asarray(matrix).tolist()
+        return {
+            arrival_label: dict(zip(self.duration_labels, row))
+            for arrival_label, row in zip(self.arrival_labels, matrix)
+        }
 
-    def _average_by_day(
-        self, raw_values: dict[str, dict[str, float]], day_count: int
-    ) -> dict[str, dict[str, float]]:
-        if not day_count:
-            return raw_values
-        for raw_row in raw_values.values():
-            for duration_label, value in raw_row.items():
-                raw_row[duration_label] = value / day_count
-        return raw_values
-
-    def _truncate_low_values(
-        self, raw_values: dict[str, dict[str, float]], day_count: int
-    ) -> dict[str, dict[str, float]]:
-        """Truncate any row values (visits/day) to 0 that
-        are below a minimum threshold.
-        """
-        if not day_count:
-            return raw_values
-        for raw_row in raw_values.values():
-            for duration_label, value in raw_row.items():
-                if raw_row[duration_label] < self.VISIT_MIN_THRESHOLD:
-                    raw_row[duration_label] = 0
-        return raw_values
-
-    def _normalize_column(self) -> dict[str, dict[str, float]]:
+    def _normalize_column(self):
         """Returns normalized from raw using 'column' method,
-        i.e., normalizes the data from each column independently.
+        i.e., normalizes the data from each column (arrival bucket)
+        independently.  All-zero columns stay zero.
         """
-
-        normalized = {}
-
-        for col, inner in self.raw_values.items():
-            # find max for this column
-            col_max = max(inner.values(), default=0.0)
-
-            if col_max == 0:
-                # if all zero, make entire column zeros
-                normalized[col] = {row: 0.0 for row in inner}
-            else:
-                # divide each value by column max
-                normalized[col] = {row: val / col_max for row, val in inner.items()}
+        if _numpy() is not None:
+            matrix = np.asarray(self._raw_matrix)
+            column_max = matrix.max(axis=1, keepdims=True)
+            return np.divide(
+                matrix,
+                column_max,
+                out=np.zeros_like(matrix),
+                where=column_max > 0,
+            )
+        normalized = []
+        for row in self._raw_matrix:
+            column_max = max(row, default=0.0)
+            normalized.append(
+                [value / column_max if column_max else 0.0 for value in row]
+            )
         return normalized
 
-    def _normalize_global(self) -> dict[str, dict[str, float]] | None:
-        """Returns normalized from raw using 'global' method"""
-
-        # 1. find the global max value across all nested dicts
-        max_val = max(v for inner in self.raw_values.values() for v in inner.values())
+    def _normalize_global(self):
+        """Returns normalized from raw using 'global' method,
+        or None if every value is 0.
+        """
+        if _numpy() is not None:
+            matrix = np.asarray(self._raw_matrix)
+            max_val = matrix.max() if matrix.size else 0.0
+            return matrix / max_val if max_val else None
+        max_val = max((max(row, default=0.0) for row in self._raw_matrix), default=0.0)
         if not max_val:
             return None
+        return [[value / max_val for value in row] for row in self._raw_matrix]
 
-        # 2. divide each value by the global max
-        normalized = {
-            outer_k: {inner_k: v / max_val for inner_k, v in inner.items()}
-            for outer_k, inner in self.raw_values.items()
-        }
-        return normalized
-
-    def _normalize_blend(self) -> dict[str, dict[str, float]]:
+    def _normalize_blend(self):
         """Return normalized data using the 'blend' method,
         i.e. the average of global and column normalizations.
         """
-
-        global_matrix = self._normalize_global()
         column_matrix = self._normalize_column()
-
-        blended_matrix = {}
-        for arrival_label in self.arrival_labels:
-            column_row = column_matrix.get(arrival_label, {})
-            global_row = global_matrix.get(arrival_label, {})
-            blended_row: dict[str, float] = {}
-            for duration_label in self.duration_labels:
-                column_val = column_row.get(duration_label, 0.0)
-                global_val = global_row.get(duration_label, 0.0)
-                blended_row[duration_label] = (column_val + global_val) / 2.0
-            blended_matrix[arrival_label] = blended_row
-
-        return blended_matrix
+        global_matrix = self._normalize_global()
+        if global_matrix is None:
+            # Nothing to blend in; column normalization of zeros is zeros
+            return column_matrix
+        if _numpy() is not None:
+            return (column_matrix + global_matrix) / 2.0
+        return [
+            [(column_val + global_val) / 2.0 for column_val, global_val in zip(*rows)]
+            for rows in zip(column_matrix, global_matrix)
+        ]
 
     def normalize(self, normalization_mode: str):
         """Sets .normalized_values in matrix according to normalization_mode.
@@ -434,18 +480,18 @@ class ArrivalDepartureMatrix:
         normalization_mode is 'column', 'global', or 'blend'.
         """
 
-        # duration_labels = list(self.duration_labels)[::-1]
-        # per_column_lookup = self.normalized_values
-
         # Choose the normalization table based on the requested mode.
         if normalization_mode == self.NORMALIZATION_COLUMN:
-            self.normalized_values = self._normalize_column()
+            normalized = self._normalize_column()
         elif normalization_mode == self.NORMALIZATION_GLOBAL:
-            self.normalized_values = self._normalize_global()
+            normalized = self._normalize_global()
         elif normalization_mode == self.NORMALIZATION_BLEND:
-            self.normalized_values = self._normalize_blend()
+            normalized = self._normalize_blend()
         else:
             cc.error_out(f"Unrecognized normalization mode '{normalization_mode}'")
+        self.normalized_values = (
+            None if normalized is None else self._as_lookup(normalized)
+        )
 
 
 def bucket_label(bucket_minutes: int | None) -> str | None:
@@ -475,144 +521,60 @@ def time_histogram_data(
     end_date: str = None,
     days_of_week: str = None,
     category_minutes: int = 30,
+    visits: DayValues | None = None,
 ) -> HistogramResult:
-    """Return averaged histogram data for the requested time column."""
+    """Return averaged histogram data for the requested time column.
 
-    # Accept only known columns so SQL fragments remain safe.
+    visits can be given to reuse minutes already fetched for these days,
+    e.g. for the arrivals and departures of one activity chart.
+    """
+
+    # Accept only known columns.
     time_column_lower = query_column.lower()
     if time_column_lower not in {"time_in", "time_out", "duration"}:
         raise ValueError(f"Bad value for query column, '{query_column}' ")
 
-    minutes_column_map = {
-        "time_in": _minutes_expr("V.time_in"),
-        "time_out": _minutes_expr("V.time_out"),
-        "duration": "V.duration",
-    }
-    minutes_column = minutes_column_map[time_column_lower]
-
-    orgsite_filter =  1  # FIXME: default fallback
-
-    day_filter_items = _build_day_filter_items(
-        orgsite_filter, start_date, end_date, days_of_week
-    )
-
-    # Filter rows where minutes are present; durations also require a time_out.
-    filter_items: list[str] = [f"({minutes_column}) IS NOT NULL"] + day_filter_items
-    if time_column_lower == "duration":
-        filter_items.append("V.time_out IS NOT NULL")
-        filter_items.append("V.time_out <> ''")
-    filter_clause = " AND ".join(filter_items) if filter_items else "1 = 1"
-    day_filter_clause = " AND ".join(day_filter_items) if day_filter_items else "1 = 1"
+    if visits is None:
+        orgsite_filter = 1  # FIXME: default fallback
+        visits = fetch_visit_minutes(
+            ttdb, start_date, end_date, days_of_week, orgsite_filter
+        )
 
+    # Durations also require a time_out.
     if time_column_lower == "duration":
         start_time, end_time = ("00:00", "12:00")
+        day_ids, minutes, _ = visits.select("duration", "time_out_min")
     else:
         start_time, end_time = ("07:00", "22:00")
+        day_ids, minutes = visits.select(f"{time_column_lower}_min")
 
-    # Common table expression keeps the expensive filtering reusable.
-    base_cte = f"""
-WITH filtered_visits AS (
-    SELECT
-        D.date AS visit_date,
-        {minutes_column} AS minutes_value
-    FROM
-        DAY D
-    JOIN
-        VISIT V ON D.id = V.day_id
-    WHERE {filter_clause}
-)
-    """
-
-    day_count_query = (
-        base_cte
-        + "SELECT COUNT(DISTINCT visit_date) AS day_count FROM filtered_visits;"
-    )
     # Average counts per day, so capture the number of distinct days in scope.
-    day_rows = db.db_fetch(ttdb, day_count_query, ["day_count"])
-    day_count = day_rows[0].day_count if day_rows else 0
-    if day_count is None:
-        day_count = 0
-    elif not isinstance(day_count, int):
-        day_count = int(day_count)
-
-    bucket_query = (
-        base_cte + "SELECT\n"
-        f"    minutes_value - (minutes_value % {category_minutes}) AS bucket_start,\n"
-        "    COUNT(*) AS bucket_count\n"
-        "FROM filtered_visits\n"
-        "WHERE minutes_value IS NOT NULL\n"
-        "GROUP BY bucket_start\n"
-        "ORDER BY bucket_start;\n"
+    day_count = _distinct_count(day_ids)
+    open_bucket, close_bucket = _hours_buckets(
+        visits.min_open, visits.max_close, category_minutes
     )
-    bucket_rows = db.db_fetch(ttdb, bucket_query, ["bucket_start", "bucket_count"])
-    bucket_counts: dict[int, int] = {}
-    for row in bucket_rows:
-        if row.bucket_start is None:
-            continue
-        bucket_counts[int(row.bucket_start)] = int(row.bucket_count)
 
-    open_bucket = close_bucket = None
-    hours_query = f"""
-        SELECT
-            MIN(NULLIF(D.time_open, '')) AS min_open,
-            MAX(NULLIF(D.time_closed, '')) AS max_close
-        FROM DAY D
-        WHERE {day_filter_clause}
-    """
-    hours_rows = db.db_fetch(ttdb, hours_query, ["min_open", "max_close"])
-    if hours_rows:
-        open_val = getattr(hours_rows[0], "min_open", None)
-        close_val = getattr(hours_rows[0], "max_close", None)
-        open_minutes = VTime(open_val).num if open_val else None
-        close_minutes = VTime(close_val).num if close_val else None
-        if open_minutes is not None and category_minutes:
-            open_bucket = (open_minutes // category_minutes) * category_minutes
-        if close_minutes is not None and category_minutes:
-            close_effective = max(close_minutes - 1, 0)
-            close_bucket = (close_effective // category_minutes) * category_minutes
-
-    if not bucket_counts:
-        averaged_freq: dict[str, float] = {}
-    else:
-        # Base label range defaults to operating hours when possible.
-        start_minutes = (
-            VTime(start_time).num if start_time else min(bucket_counts.keys())
+    averaged_freq: dict[str, float] = {}
+    if day_count:
+        # Buckets outside the target window are rolled into the first/last bin
+        # so the chart still reflects their impact.
+        first_index = VTime(start_time).num // category_minutes
+        last_index = VTime(end_time).num // category_minutes
+        counts, have_unders, have_overs = _clipped_bincount(
+            _floor_div(minutes, category_minutes), first_index, last_index
         )
-        end_minutes = VTime(end_time).num if end_time else max(bucket_counts.keys())
-        start_bucket = (start_minutes // category_minutes) * category_minutes
-        end_bucket = (end_minutes // category_minutes) * category_minutes
-        categories_by_minute: dict[int, int] = {
-            minute: 0
-            for minute in range(
-                start_bucket, end_bucket + category_minutes, category_minutes
-            )
-        }
-        have_unders = have_overs = False
-        for bucket_start, count in bucket_counts.items():
-            # Buckets outside the target window are rolled into the first/last bin
-            # so the chart still reflects their impact.
-            if bucket_start in categories_by_minute:
-                categories_by_minute[bucket_start] = count
-            elif bucket_start < start_bucket:
-                categories_by_minute[start_bucket] += count
-                have_unders = True
-            elif bucket_start > end_bucket:
-                categories_by_minute[end_bucket] += count
-                have_overs = True
-
-        categories_str = {
-            VTime(minute).tidy: value for minute, value in categories_by_minute.items()
-        }
-        if have_unders:
-            start_label = VTime(start_bucket).tidy
-            categories_str[f"{start_label}-"] = categories_str.pop(start_label, 0)
-        if have_overs:
-            end_label = VTime(end_bucket).tidy
-            categories_str[f"{end_label}+"] = categories_str.pop(end_label, 0)
+        labels = _edge_labels(
+            range(
+                first_index * category_minutes,
+                (last_index + 1) * category_minutes,
+                category_minutes,
+            ),
+            have_unders,
+            have_overs,
+        )
+        # Divide by day_count (defaulting to 1) to get per-day averages.
         averaged_freq = {
-            # Divide by day_count (defaulting to 1) to get per-day averages.
-            key: (value / (day_count or 1))
-            for key, value in sorted(categories_str.items())
+            label: count / (day_count or 1) for label, count in zip(labels, counts)
         }
 
     return HistogramResult(
@@ -636,80 +598,23 @@ def fullness_histogram_data(
 
     orgsite_filter = orgsite_id if orgsite_id else 1  # FIXME: default fallback
 
-    day_filter_items = _build_day_filter_items(
-        orgsite_filter, start_date, end_date, days_of_week
+    blocks = _fetch_day_values(
+        ttdb,
+        _build_day_filter(orgsite_filter, start_date, end_date, days_of_week),
+        "BLOCK",
+        ["time_start_min", "num_on_hand_combined"],
+        "T.num_on_hand_combined IS NOT NULL",
     )
-
-    filter_items: list[str] = ["B.num_on_hand_combined IS NOT NULL"] + day_filter_items
-    filter_clause = " AND ".join(filter_items) if filter_items else "1 = 1"
-    day_filter_clause = " AND ".join(day_filter_items) if day_filter_items else "1 = 1"
-
-    day_count_query = f"""
-        SELECT COUNT(DISTINCT D.DATE) AS day_count
-        FROM DAY D
-        JOIN BLOCK B ON B.day_id = D.id
-        WHERE {filter_clause}
-    """
     # Day count is needed later to normalize averages when data is sparse.
-    day_rows = db.db_fetch(ttdb, day_count_query, ["day_count"])
-    day_count = day_rows[0].day_count if day_rows else 0
-    if day_count is None:
-        day_count = 0
-    elif not isinstance(day_count, int):
-        day_count = int(day_count)
-
-    bucket_query = f"""
-        SELECT
-            B.time_start AS bucket_start,
-            AVG(B.num_on_hand_combined) AS avg_fullness,
-            COUNT(*) AS sample_count
-        FROM DAY D
-        JOIN BLOCK B ON B.day_id = D.id
-        WHERE {filter_clause}
-        GROUP BY B.time_start
-        ORDER BY B.time_start
-    """
-    bucket_rows = db.db_fetch(
-        ttdb, bucket_query, ["bucket_start", "avg_fullness", "sample_count"]
+    day_count = _distinct_count(blocks.day_ids)
+    open_bucket, close_bucket = _hours_buckets(
+        blocks.min_open, blocks.max_close, category_minutes
     )
 
-    bucket_totals: dict[int, float] = {}
-    bucket_counts: dict[int, int] = {}
-    for row in bucket_rows:
-        bucket_time = VTime(row.bucket_start)
-        if not bucket_time or getattr(bucket_time, "num", None) is None:
-            continue
-        minute_value = int(bucket_time.num)
-        sample_count = int(row.sample_count or 0)
-        if sample_count <= 0:
-            continue
-        avg_fullness = float(row.avg_fullness or 0.0)
-        bucket_totals[minute_value] = bucket_totals.get(minute_value, 0.0) + (
-            avg_fullness * sample_count
-        )
-        bucket_counts[minute_value] = bucket_counts.get(minute_value, 0) + sample_count
-
-    open_bucket = close_bucket = None
-    hours_query = f"""
-        SELECT
-            MIN(NULLIF(D.time_open, '')) AS min_open,
-            MAX(NULLIF(D.time_closed, '')) AS max_close
-        FROM DAY D
-        WHERE {day_filter_clause}
-    """
-    hours_rows = db.db_fetch(ttdb, hours_query, ["min_open", "max_close"])
-    if hours_rows:
-        open_val = getattr(hours_rows[0], "min_open", None)
-        close_val = getattr(hours_rows[0], "max_close", None)
-        open_minutes = VTime(open_val).num if open_val else None
-        close_minutes = VTime(close_val).num if close_val else None
-        if open_minutes is not None and category_minutes:
-            open_bucket = (open_minutes // category_minutes) * category_minutes
-        if close_minutes is not None and category_minutes:
-            close_effective = max(close_minutes - 1, 0)
-            close_bucket = (close_effective // category_minutes) * category_minutes
-
-    if not bucket_totals:
+    _, block_starts, fullness = blocks.select(
+        "time_start_min", "num_on_hand_combined"
+    )
+    if not len(block_starts):  # pylint:disable=use-implicit-booleaness-not-len
         return HistogramResult(
             values={},
             day_count=day_count,
@@ -719,68 +624,28 @@ def fullness_histogram_data(
         )
 
     # Fullness reports always focus on business hours (07:00-22:00 local time).
-    start_minutes = VTime("07:00").num
-    end_minutes = VTime("22:00").num
-    if start_minutes is None or end_minutes is None:
-        return HistogramResult(
-            values={},
-            day_count=day_count,
-            open_bucket=open_bucket,
-            close_bucket=close_bucket,
-            category_minutes=category_minutes,
-        )
-
-    start_bucket = (start_minutes // category_minutes) * category_minutes
-    end_bucket = (end_minutes // category_minutes) * category_minutes
-    bucket_range = range(start_bucket, end_bucket + category_minutes, category_minutes)
-
-    buckets_to_totals: dict[int, float] = {minute: 0.0 for minute in bucket_range}
-    buckets_to_counts: dict[int, int] = {minute: 0 for minute in bucket_range}
-    have_unders = have_overs = False
-
-    for minute_value, total_fullness in bucket_totals.items():
-        bucket_minute = (minute_value // category_minutes) * category_minutes
-        count = bucket_counts.get(minute_value, 0)
-        if count <= 0:
-            continue
-        # Add out-of-range samples to the nearest visible bucket so totals stay balanced.
-        if bucket_minute < start_bucket:
-            buckets_to_totals[start_bucket] += total_fullness
-            buckets_to_counts[start_bucket] += count
-            have_unders = True
-        elif bucket_minute > end_bucket:
-            buckets_to_totals[end_bucket] += total_fullness
-            buckets_to_counts[end_bucket] += count
-            have_overs = True
-        else:
-            buckets_to_totals.setdefault(bucket_minute, 0.0)
-            buckets_to_counts.setdefault(bucket_minute, 0)
-            buckets_to_totals[bucket_minute] += total_fullness
-            buckets_to_counts[bucket_minute] += count
-
-    ordered_pairs: list[tuple[str, float]] = []
-    for minute in bucket_range:
-        vt = VTime(minute)
-        if not vt:
-            continue
-        label = vt.tidy if hasattr(vt, "tidy") else str(vt)
-        total = buckets_to_totals.get(minute, 0.0)
-        count = buckets_to_counts.get(minute, 0)
-        avg_value = total / count if count else 0.0
-        ordered_pairs.append((label, avg_value))
-
-    if ordered_pairs and have_unders:
-        # Prefix '-' or '+' markers so downstream renderers know values were
-        # aggregated from buckets outside the visible window.
-        start_label, start_value = ordered_pairs[0]
-        ordered_pairs[0] = (f"{start_label}-", start_value)
-
-    if ordered_pairs and have_overs:
-        end_idx = len(ordered_pairs) - 1
-        end_label, end_value = ordered_pairs[end_idx]
-        ordered_pairs[end_idx] = (f"{end_label}+", end_value)
-
-    averaged_fullness = dict(ordered_pairs)
+    # Out-of-range samples go to the nearest visible bucket so totals stay balanced.
+    first_index = VTime("07:00").num // category_minutes
+    last_index = VTime("22:00").num // category_minutes
+    indexes = _floor_div(block_starts, category_minutes)
+    totals, have_unders, have_overs = _clipped_bincount(
+        indexes, first_index, last_index, weights=fullness
+    )
+    counts, _, _ = _clipped_bincount(indexes, first_index, last_index)
+
+    labels = _edge_labels(
+        range(
+            first_index * category_minutes,
+            (last_index + 1) * category_minutes,
+            category_minutes,
+        ),
+        have_unders,
+        have_overs,
+    )
+    averaged_fullness = {
+        label: total / count if count else 0.0
+        for label, total, count in zip(labels, totals, counts)
+    }
 
     return HistogramResult(
         values=averaged_fullness,
@@ -794,8 +659,10 @@ def fullness_histogram_data(
 __all__ = [
     "HistogramResult",
     "ArrivalDepartureMatrix",
+    "DayValues",
     "bucket_label",
     "duration_bucket_label",
+    "fetch_visit_minutes",
     "fullness_histogram_data",
     "time_histogram_data",
 ]
@@ -10,7 +10,9 @@ from typing import TYPE_CHECKING
 from common.tt_time import VTime
 
 from web.web_histogram_data import (
+    DayValues,
     bucket_label,
+    fetch_visit_minutes,
     fullness_histogram_data,
     time_histogram_data,
     ArrivalDepartureMatrix,
@@ -39,12 +41,14 @@ def arrival_duration_hist_table(
     border_color: str = "black",
     show_counts: bool = True,
     normalization_mode: str = ArrivalDepartureMatrix.NORMALIZATION_BLEND,
+    visits: DayValues | None = None,
 ) -> str:
     """Convenience helper to fetch data and render the arrival-duration matrix.
 
     Args:
         normalization_mode: Pass ``"column"``, ``"global"``, or ``"blend"`` to choose
             how the heatmap values are scaled.
+        visits: Visit minutes already fetched for these days, if any.
     """
 
     arrival_duration_colors = Dimension(interpolation_exponent=0.8)
@@ -69,6 +73,7 @@ def arrival_duration_hist_table(
         duration_bucket_minutes=duration_bucket_minutes,
         min_arrival_threshold=min_arrival_threshold,
         max_duration_threshold=max_duration_threshold,
+        visits=visits,
     )
 
     if not matrix.arrival_labels or not matrix.duration_labels:
@@ -101,8 +106,12 @@ def times_hist_table(
     color: str = None,
     mini: bool = False,
     max_value: float | None = None,
+    visits: DayValues | None = None,
 ) -> str:
-    """Create one html histogram table on lengths of visit."""
+    """Create one html histogram table on lengths of visit.
+
+    visits can be given to reuse visit minutes already fetched for these days.
+    """
 
     result = time_histogram_data(
         ttdb,
@@ -110,6 +119,7 @@ def times_hist_table(
         start_date=start_date,
         end_date=end_date,
         days_of_week=days_of_week,
+        visits=visits,
     )
     averaged_freq = result.values
     day_count = result.day_count
@@ -246,22 +256,21 @@ def activity_hist_table(
     outbound_color: str = "lightskyblue",
     mini: bool = False,
     link_target: str = "",
+    visits: DayValues | None = None,
 ) -> str:
-    """Render a stacked histogram for arrivals (bottom) and departures (top)."""
+    """Render a stacked histogram for arrivals (bottom) and departures (top).
+
+    visits can be given to reuse visit minutes already fetched for these days.
+    """
 
+    # Both histograms come from the same fetch of the visits
+    if visits is None:
+        visits = fetch_visit_minutes(ttdb, start_date, end_date, days_of_week)
     arrivals_result = time_histogram_data(
-        ttdb,
-        query_column="time_in",
-        start_date=start_date,
-        end_date=end_date,
-        days_of_week=days_of_week,
+        ttdb, query_column="time_in", visits=visits
     )
     departures_result = time_histogram_data(
-        ttdb,
-        query_column="time_out",
-        start_date=start_date,
-        end_date=end_date,
-        days_of_week=days_of_week,
+        ttdb, query_column="time_out", visits=visits
     )
 
     arrivals = arrivals_result.values
@@ -10,14 +10,10 @@ from statistics import mean, median
 from typing import Any, Sequence, Tuple
 
 import web.web_common as cc
+import database.tt_dbutil as db
 from common.tt_daysummary import DayTotals
 from common.tt_time import VTime
 
-try:
-    from common.commuter_hump import CommuterHumpAnalyzer
-except ImportError:  # pragma: no cover - optional dependency
-    CommuterHumpAnalyzer = None
-
 
 __all__ = [
     "PeriodMetrics",
@@ -70,17 +66,7 @@ class PeriodMetrics:
 
 def _parse_dow_tokens(dow_value: str) -> set[int]:
     """Return the permitted ISO days_of_week for the normalized selector value."""
-    allowed: set[int] = set()
-    if not dow_value:
-        return allowed
-    for token in dow_value.split(","):
-        token = token.strip()
-        if not token.isdigit():
-            continue
-        candidate = int(token)
-        if 1 <= candidate <= 7:
-            allowed.add(candidate)
-    return allowed
+    return set(db.DayFilter.parse_weekdays(dow_value))
 
 
 def _open_minutes_for_day(day: DayTotals) -> int:
@@ -102,14 +88,15 @@ def _fetch_commuter_metrics(
     days_of_week: Sequence[int],
 ) -> tuple[int | None, float | None]:
     """Run the commuter hump analysis and return commuter count and mean per day."""
-    if CommuterHumpAnalyzer is None:
+    hump_analyzer = cc.commuter_hump_analyzer()
+    if hump_analyzer is None:
         return None, None
     if not start_iso or not end_iso:
         return None, None
     ordered_start, ordered_end = sorted((start_iso, end_iso))
     normalized_weekdays = tuple(sorted(set(days_of_week))) or tuple(range(1, 8))
     try:
-        analyzer = CommuterHumpAnalyzer(
+        analyzer = hump_analyzer(
             db_path=ttdb,
             start_date=ordered_start,
             end_date=ordered_end,
@@ -144,10 +131,10 @@ def aggregate_period(
     dow_value: str,
 ) -> PeriodMetrics:
     """Collect daily summaries and roll them into PeriodMetrics."""
-    days = cc.get_days_data(ttdb, min_date=start_date, max_date=end_date)
     allowed = _parse_dow_tokens(dow_value)
-    if allowed:
-        days = [day for day in days if getattr(day, "weekday", None) in allowed]
+    days = cc.get_days_data(
+        ttdb, min_date=start_date, max_date=end_date, weekdays=allowed
+    )
 
     metrics = PeriodMetrics()
     metrics.days_open = len(days)
@@ -245,19 +232,12 @@ def aggregate_period(
         metrics.mean_most_bikes_per_day = None
         metrics.median_most_bikes_per_day = None
 
-    day_where_clauses = ["orgsite_id = ?"]
-    params: list[Any] = [1]
-    if start_date:
-        day_where_clauses.append("date >= ?")
-        params.append(start_date)
-    if end_date:
-        day_where_clauses.append("date <= ?")
-        params.append(end_date)
-    if allowed:
-        placeholders = ",".join("?" for _ in allowed)
-        day_where_clauses.append(f"weekday IN ({placeholders})")
-        params.extend(sorted(allowed))
-    day_clause = " AND ".join(day_where_clauses)
+    day_clause, params = db.DayFilter(
+        orgsite_id=1,  # FIXME: hardcoded orgsite_id
+        start_date=start_date or "",
+        end_date=end_date or "",
+        weekdays=allowed,
+    ).where()
     visit_query = (
         "SELECT duration FROM VISIT WHERE day_id IN ("
         f"SELECT id FROM DAY WHERE {day_clause}"
@@ -278,7 +258,7 @@ def aggregate_period(
         metrics.median_visit_minutes = None
 
     daily_commuter_counts: list[float] = []
-    if days and CommuterHumpAnalyzer is not None:
+    if days and cc.commuter_hump_analyzer() is not None:
         commuter_weekdays = tuple(sorted(allowed)) if allowed else tuple(range(1, 8))
         for day in days:
             commuter_count, _ = _fetch_commuter_metrics(
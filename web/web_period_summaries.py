@@ -206,6 +206,9 @@ def _fetch_daterange_summary_rows(
     range_start = range_start if range_start else "0000-00-00"
     range_end = range_end if range_end else "9999-99-99"
 
+    where, params = db.DayFilter(
+        orgsite_id=orgsite_id, start_date=range_start, end_date=range_end
+    ).where()
     sql = f"""
         SELECT
             date,
@@ -218,11 +221,10 @@ def _fetch_daterange_summary_rows(
             num_fullest_combined max_total,
             bikes_registered registrations
         FROM day
-        WHERE date >= '{range_start}' and date <= '{range_end}'
-            AND orgsite_id = {orgsite_id}
+        WHERE {where}
         ORDER BY date DESC
     """
-    dbrows = db.db_fetch(ttdb, sql)
+    dbrows = db.db_fetch(ttdb, sql, params=params)
     if not dbrows:
         return []
 
@@ -28,12 +28,24 @@ import web.web_base_config as wcfg
 import sqlite3
 from datetime import datetime
 
-try:  # optional heavy deps
-    import pandas as pd  # type: ignore
-    import numpy as np  # type: ignore
-except Exception:  # pragma: no cover
-    pd = None  # type: ignore
-    np = None  # type: ignore
+# Optional heavy deps, slow to import so imported by _import_scientific()
+# only when the analog-day model is used.
+pd = None  # type: ignore
+np = None  # type: ignore
+
+
+def _import_scientific() -> None:
+    """Import pandas and numpy (if present) into pd and np."""
+    global pd, np  # pylint:disable=global-statement
+    if pd is not None and np is not None:
+        return
+    try:
+        # pylint:disable=import-outside-toplevel,redefined-outer-name
+        import pandas as pd  # type: ignore
+        import numpy as np  # type: ignore
+    except Exception:  # pragma: no cover
+        pd = None  # type: ignore
+        np = None  # type: ignore
 
 
 DEFAULT_MODEL_FILENAME = "model.pkl"  # legacy single-file (unused by schedule-driven)
@@ -598,6 +610,7 @@ class AnalogDayModel:
         max_temperature: float,
         precipitation: float,
     ) -> tuple[Optional[float], Optional[tuple[float, float]], Optional[float], Optional[tuple[float, float]]]:
+        _import_scientific()
         if pd is None or np is None:
             raise RuntimeError("pandas/numpy required for analog-day predictor")
         # FIXME: optionally return a neighbors explainer payload (top dates/values/distances)
@@ -655,7 +668,41 @@ class AnalogDayModel:
         return pred_total, (lo_t, hi_t), pred_peak, (lo_p, hi_p)
 
 
+# Loaded models kept between requests (by a long-running server), keyed by
+# folder; each with the file stamps it was loaded from.
+_LOADED_MODELS: Dict[str, tuple[tuple, PredictorModel]] = {}
+
+
+def _model_files_stamp(model: PredictorModel) -> tuple:
+    """Return the (name, mtime) of each file a PredictorModel loads from."""
+    paths = [model.model_path, model.meta_path]
+    if model.models_dir.is_dir():
+        paths.extend(sorted(model.models_dir.iterdir()))
+    stamp = []
+    for p in paths:
+        try:
+            stamp.append((str(p), p.stat().st_mtime_ns))
+        except OSError:
+            continue
+    return tuple(stamp)
+
+
+def loaded_model(model_dir: Optional[str | os.PathLike] = None) -> PredictorModel:
+    """Return a loaded PredictorModel, reusing one loaded by an earlier call
+    unless its files have changed since."""
+    model = PredictorModel(model_dir)
+    key = str(model.model_dir)
+    stamp = _model_files_stamp(model)
+    cached = _LOADED_MODELS.get(key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    model.load()
+    _LOADED_MODELS[key] = (stamp, model)
+    return model
+
+
 __all__ = [
     "PredictorModel",
     "PredictorOutput",
+    "loaded_model",
 ]
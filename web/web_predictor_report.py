@@ -14,8 +14,9 @@ from typing import Optional, Iterable, Tuple
 from datetime import datetime, date as _date
 
 import web.web_common as cc
+import database.tt_dbutil as db
 import common.tt_util as ut
-from web.web_predictor_model import PredictorModel, PredictorOutput
+from web.web_predictor_model import PredictorOutput, loaded_model
 from common.tt_time import VTime
 import web.web_base_config as wcfg
 
@@ -42,7 +43,7 @@ def _open_close_pairs(database) -> list[tuple[str, str]]:
              WHERE orgsite_id = 1
                AND time_open IS NOT NULL AND time_open != ''
                AND time_closed IS NOT NULL AND time_closed != ''
-               AND date >= DATE((SELECT MAX(DATE(date)) FROM DAY WHERE orgsite_id = 1), '-14 months')
+               AND date >= DATE((SELECT MAX(date) FROM DAY WHERE orgsite_id = 1), '-14 months')
              GROUP BY time_open, time_closed
             HAVING cnt >= 3
              ORDER BY time_open, time_closed
@@ -151,24 +152,20 @@ def _default_schedule_for_date(database, target_date: str) -> str | None:
     except Exception:
         return None
 
-    # SQLite strftime('%w', date) is 0..6 with Sunday=0
-    iso = dt.isoweekday()  # 1..7 (Mon..Sun)
-    sqlite_w = 0 if iso == 7 else iso
-
+    where, params = db.DayFilter(orgsite_id=1, weekdays=[dt.isoweekday()]).where()
     try:
         row = database.execute(
-            """
+            f"""
             SELECT time_open, time_closed
               FROM DAY
-             WHERE orgsite_id = 1
+             WHERE {where}
                AND time_open IS NOT NULL AND time_open != ''
                AND time_closed IS NOT NULL AND time_closed != ''
-               AND strftime('%w', date) = ?
              ORDER BY date DESC
              LIMIT 1
             ;
             """,
-            (str(sqlite_w),),
+            params,
         ).fetchone()
     except Exception:
         row = None
@@ -281,8 +278,7 @@ def prediction_report(database, params) -> None:
         return
 
     # Load predictor
-    model = PredictorModel()
-    model.load()
+    model = loaded_model()
     if not model.ready:
         print(
             "<div style='color:#a00'><b>Predictor model is not available.</b> "
@@ -22,6 +22,8 @@ Copyright (C) 2023-2024 Julias Hocking & Todd Glover
 
 """
 
+import contextlib
+import io
 import sqlite3
 import sys
 import os
@@ -34,27 +36,23 @@ from pathlib import Path
 
 # pylint:disable=wrong-import-position
 import web.web_common as cc
-import web.web_block_report as web_block_report
-import web.web_day_detail as web_day_detail
-import web.web_season_report as web_season_report
-import web.web_tags_report as web_tags_report
-import web.web_period_summaries as web_period_summaries
-import web.web_compare_ranges as web_compare_ranges
-import web.web_period_detail as web_period_detail
-import web.web_predictor_report as web_predictor_report
 import web.web_base_config as wcfg
+import web.web_response_cache as rcache
 from common.tt_tag import TagID
 from common.tt_time import VTime
 import common.tt_util as ut
 import common.tt_constants as k
 import database.tt_dbutil as db
+from database.db_add_derived_columns import missing_derived_columns, MIGRATE_MESSAGE
 
 # import tt_reports as rep
 # import tt_audit_report as aud
 # import tt_tag_inv
 # import tt_printer as pr
-from web.web_estimator import Estimator
-from web.web_daterange_selector import DateDowSelection
+
+# The report modules (and the estimator) are imported only by the
+# report that uses them, so a request doesn't pay to import them all.
+# pylint:disable=import-outside-toplevel
 
 
 def web_audit_report(
@@ -184,7 +182,7 @@ def web_audit_report(
 
 
 # -----------------
-def web_est_wrapper() -> None:
+def web_est_wrapper(database: sqlite3.Connection) -> None:
     """The estimation (verbose) page guts.
 
     Maybe move this to web_estimator.py
@@ -192,9 +190,25 @@ def web_est_wrapper() -> None:
     print(f"<h1>Detailed prediction for {ut.date_str('today')}</h1>")
     print(f"{cc.main_and_back_buttons(1)}<br><br>")
 
-    est = Estimator(estimation_type="verbose")
-    est.guess()
-    for line in est.result_msg(as_html=True):
+    import web.web_estimator as web_estimator
+    import web.web_estimate_snapshot as snapshot
+
+    # Use the precomputed estimate for now, if there is one
+    orgsite_id = web_estimator.Estimator.orgsite_id
+    opening_time, closing_time = web_estimator.today_schedule(database, orgsite_id)
+    precomputed = snapshot.lookup(
+        estimation_type="verbose",
+        opening_time=opening_time or "",
+        closing_time=closing_time or "",
+        bikes_so_far=web_estimator.bikes_right_now(database, orgsite_id),
+    )
+    if precomputed and precomputed.get("html_lines"):
+        lines = precomputed["html_lines"]
+    else:
+        est = web_estimator.Estimator(estimation_type="verbose")
+        est.guess()
+        lines = est.result_msg(as_html=True)
+    for line in lines:
         print(line)
 
     models_path = (
@@ -207,6 +221,93 @@ def web_est_wrapper() -> None:
         print("</pre><hr>")
 
 
+def report_page(database: sqlite3.Connection, params: cc.ReportParameters) -> None:
+    """Print the body of the report that params asks for."""
+    if params.what_report == cc.WHAT_TAG_HISTORY:
+        import web.web_tags_report as web_tags_report
+
+        web_tags_report.one_tag_history_report(database, params.tag)
+    elif params.what_report == cc.WHAT_BLOCKS:
+        import web.web_block_report as web_block_report
+
+        web_block_report.blocks_report(database, params)
+    elif params.what_report == cc.WHAT_DETAIL:
+        import web.web_season_report as web_season_report
+
+        web_season_report.season_detail(database, params)
+    elif params.what_report == cc.WHAT_SUMMARY:
+        import web.web_season_report as web_season_report
+
+        web_season_report.main_web_page(database)
+    elif params.what_report == cc.WHAT_SUMMARY_FREQUENCIES:
+        import web.web_season_report as web_season_report
+
+        web_season_report.season_frequencies_report(database, params)
+    elif params.what_report == cc.WHAT_COMPARE_RANGES:
+        import web.web_compare_ranges as web_compare_ranges
+
+        web_compare_ranges.compare_ranges(database, params=params)
+    elif params.what_report == cc.WHAT_TAGS_LOST:
+        import web.web_tags_report as web_tags_report
+
+        web_tags_report.tags_report(database)
+    elif params.what_report == cc.WHAT_ONE_DAY:
+        import web.web_day_detail as web_day_detail
+
+        web_day_detail.one_day_tags_report(database, params)
+    elif params.what_report == cc.WHAT_ONE_DAY_FREQUENCIES:
+        import web.web_season_report as web_season_report
+
+        web_season_report.season_frequencies_report(
+            database, params, restrict_to_single_day=True
+        )
+    elif params.what_report == cc.WHAT_AUDIT:
+        web_audit_report(database)
+    elif params.what_report == cc.WHAT_DATERANGE_DETAIL:
+        import web.web_period_detail as web_period_detail
+
+        web_period_detail.period_detail(database, params=params)
+    elif params.what_report == cc.WHAT_PREDICT_FUTURE:
+        import web.web_predictor_report as web_predictor_report
+
+        web_predictor_report.prediction_report(database, params=params)
+    elif params.what_report == cc.WHAT_DATERANGE:
+        import web.web_period_summaries as web_period_summaries
+
+        web_period_summaries.daterange_summary(database, params=params)
+    elif params.what_report == cc.WHAT_ESTIMATE_VERBOSE:
+        web_est_wrapper(database)
+
+    else:
+        cc.error_out(f"Unknown request: {ut.untaint(params.what_report)}")
+        sys.exit(1)
+
+
+
+# Reports that show the state at this moment, so are never reused
+UNCACHED_REPORTS = {cc.WHAT_AUDIT, cc.WHAT_ESTIMATE_VERBOSE}
+# Reports that can change through the day without the database changing
+TODAY_REPORTS = {cc.WHAT_SUMMARY, cc.WHAT_TAGS_LOST, cc.WHAT_PREDICT_FUTURE}
+
+
+def cache_max_age(params: cc.ReportParameters) -> float:
+    """Return how long (seconds) a cached copy of this report may be reused."""
+    if params.what_report in UNCACHED_REPORTS:
+        return 0
+    today = ut.date_str("today")
+    report_dates = [
+        params.start_date,
+        params.end_date,
+        params.start_date2,
+        params.end_date2,
+    ]
+    if params.what_report in TODAY_REPORTS or any(
+        d and d >= today for d in report_dates
+    ):
+        return wcfg.RESPONSE_CACHE_TODAY_MAX_AGE
+    return wcfg.RESPONSE_CACHE_MAX_AGE
+
+
 # Query parameter sanitizing ---------------------------------------------------------------
 SAFE_QUERY_CHARS = frozenset(
     " ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789._:,-"
@@ -229,115 +330,123 @@ def validate_query_params(query_parms: dict[str, list[str]]) -> None:
 
 # =================================================================
 
-start_time = time.perf_counter()
-
 org_handle = "no_org"  # FIXME
 caller_org = "no_org"  # FIXME - read from web auth via env
 ORGSITE_ID = 1  # FIXME hardwired. (This one uc so sub-functions can't read orgsite_id)
 
-print("Content-type: text/html\n\n\n")
-
-if os.getenv("TAGTRACKER_DEBUG"):
-    print("<pre style='color:red'>\nDEBUG -- TAGTRACKER_DEBUG flag is set\n\n" "</pre>")
-
-
-params = cc.CGIManager.cgi_to_params()
-params.what_report = params.what_report or cc.WHAT_SUMMARY
-params.pages_back = params.pages_back or 1
-
-TagID.uc(wcfg.TAGS_UPPERCASE)
-
-DBFILE = wcfg.DB_FILENAME
-database = db.db_connect(DBFILE)
-if not database:
-    print("<br>No database")
-    sys.exit()
-
-# Set text colours off (for the text-based reports)
-# pr.COLOUR_ACTIVE = True
-k.set_html_style()
-
-
-cc.html_head()
 
-if not params.what_report:
-    sys.exit()
+def main() -> None:
+    """Print the (CGI) response for the report that the query string asks for.
 
+    Called once per process when run as a CGI script, or once per request
+    by web_wsgi.
+    """
 
-if params.what_report == cc.WHAT_COMPARE_RANGES:
-    prior_start, prior_end = DateDowSelection.date_range_for(
-        DateDowSelection.RANGE_PREVIOUS_MONTH_PRIOR_YEAR
-    )
-    recent_start, recent_end = DateDowSelection.date_range_for(
-        DateDowSelection.RANGE_PREVIOUS_MONTH
-    )
-    params.start_date = params.start_date or prior_start
-    params.end_date = params.end_date or prior_end
-    params.start_date2 = params.start_date2 or recent_start
-    params.end_date2 = params.end_date2 or recent_end
-
-# Resolve date range for most reports, but do not clamp for predictions
-if params.what_report != cc.WHAT_PREDICT_FUTURE:
-    (
-        params.start_date,
-        params.end_date,
-        _default_start_date,
-        _default_end_date,
-    ) = cc.resolve_date_range(
-        database,
-        start_date=params.start_date or "",
-        end_date=params.end_date or "",
-    )
-
-if params.what_report == cc.WHAT_COMPARE_RANGES:
-    (
-        params.start_date2,
-        params.end_date2,
-        _default_start_date2,
-        _default_end_date2,
-    ) = cc.resolve_date_range(
-        database,
-        start_date=params.start_date2 or "",
-        end_date=params.end_date2 or "",
-    )
-else:
-    params.start_date2 = params.start_date2 or ""
-    params.end_date2 = params.end_date2 or ""
-
-if params.what_report == cc.WHAT_TAG_HISTORY:
-    web_tags_report.one_tag_history_report(database, params.tag)
-elif params.what_report == cc.WHAT_BLOCKS:
-    web_block_report.blocks_report(database, params)
-elif params.what_report == cc.WHAT_DETAIL:
-    web_season_report.season_detail(database, params)
-elif params.what_report == cc.WHAT_SUMMARY:
-    web_season_report.main_web_page(database)
-elif params.what_report == cc.WHAT_SUMMARY_FREQUENCIES:
-    web_season_report.season_frequencies_report(database, params)
-elif params.what_report == cc.WHAT_COMPARE_RANGES:
-    web_compare_ranges.compare_ranges(database, params=params)
-elif params.what_report == cc.WHAT_TAGS_LOST:
-    web_tags_report.tags_report(database)
-elif params.what_report == cc.WHAT_ONE_DAY:
-    web_day_detail.one_day_tags_report(database, params)
-elif params.what_report == cc.WHAT_ONE_DAY_FREQUENCIES:
-    web_season_report.season_frequencies_report(
-        database, params, restrict_to_single_day=True
-    )
-elif params.what_report == cc.WHAT_AUDIT:
-    web_audit_report(database)
-elif params.what_report == cc.WHAT_DATERANGE_DETAIL:
-    web_period_detail.period_detail(database, params=params)
-elif params.what_report == cc.WHAT_PREDICT_FUTURE:
-    web_predictor_report.prediction_report(database, params=params)
-elif params.what_report == cc.WHAT_DATERANGE:
-    web_period_summaries.daterange_summary(database, params=params)
-elif params.what_report == cc.WHAT_ESTIMATE_VERBOSE:
-    web_est_wrapper()
-
-else:
-    cc.error_out(f"Unknown request: {ut.untaint(params.what_report)}")
-    sys.exit(1)
-
-
-cc.webpage_footer(database, time.perf_counter() - start_time)
+    start_time = time.perf_counter()
+
+    print("Content-type: text/html\n\n\n")
+
+    if os.getenv("TAGTRACKER_DEBUG"):
+        print("<pre style='color:red'>\nDEBUG -- TAGTRACKER_DEBUG flag is set\n\n" "</pre>")
+
+
+    params = cc.CGIManager.cgi_to_params()
+    params.what_report = params.what_report or cc.WHAT_SUMMARY
+    params.pages_back = params.pages_back or 1
+
+    TagID.uc(wcfg.TAGS_UPPERCASE)
+
+    database = db.db_connect(wcfg.DB_FILENAME, db.DB_READ_ONLY)
+    if not database:
+        print("<br>No database")
+        sys.exit()
+    if missing_derived_columns(database.cursor()):
+        print(f"<br>{MIGRATE_MESSAGE}")
+        sys.exit()
+
+    # Set text colours off (for the text-based reports)
+    # pr.COLOUR_ACTIVE = True
+    k.set_html_style()
+
+
+    cc.html_head()
+
+    if not params.what_report:
+        sys.exit()
+
+
+    if params.what_report == cc.WHAT_COMPARE_RANGES:
+        from web.web_daterange_selector import DateDowSelection
+
+        prior_start, prior_end = DateDowSelection.date_range_for(
+            DateDowSelection.RANGE_PREVIOUS_MONTH_PRIOR_YEAR
+        )
+        recent_start, recent_end = DateDowSelection.date_range_for(
+            DateDowSelection.RANGE_PREVIOUS_MONTH
+        )
+        params.start_date = params.start_date or prior_start
+        params.end_date = params.end_date or prior_end
+        params.start_date2 = params.start_date2 or recent_start
+        params.end_date2 = params.end_date2 or recent_end
+
+    # Resolve date range for most reports, but do not clamp for predictions
+    if params.what_report != cc.WHAT_PREDICT_FUTURE:
+        (
+            params.start_date,
+            params.end_date,
+            _default_start_date,
+            _default_end_date,
+        ) = cc.resolve_date_range(
+            database,
+            start_date=params.start_date or "",
+            end_date=params.end_date or "",
+        )
+
+    if params.what_report == cc.WHAT_COMPARE_RANGES:
+        (
+            params.start_date2,
+            params.end_date2,
+            _default_start_date2,
+            _default_end_date2,
+        ) = cc.resolve_date_range(
+            database,
+            start_date=params.start_date2 or "",
+            end_date=params.end_date2 or "",
+        )
+    else:
+        params.start_date2 = params.start_date2 or ""
+        params.end_date2 = params.end_date2 or ""
+
+    max_age = cache_max_age(params) if rcache.cache_enabled() else 0
+    if not max_age:
+        report_page(database, params)
+    else:
+        cache_key = rcache.page_key(
+            cc.CGIManager.params_to_query_str(params),
+            ut.date_str("today"),
+            str(cc.CGIManager.called_by_self()),
+            # Pages link back to themselves through these
+            os.environ.get("SCRIPT_NAME", ""),
+            os.environ.get("HTTP_HOST", ""),
+            os.environ.get("REQUEST_SCHEME", ""),
+            rcache.db_stamp(wcfg.DB_FILENAME),
+        )
+        page = rcache.fetch_page(cache_key, max_age)
+        if page is None:
+            page_buffer = io.StringIO()
+            try:
+                with contextlib.redirect_stdout(page_buffer):
+                    report_page(database, params)
+            except SystemExit:
+                # Error pages are shown but not kept
+                print(page_buffer.getvalue(), end="")
+                raise
+            page = page_buffer.getvalue()
+            rcache.store_page(cache_key, page)
+        print(page, end="")
+
+    cc.webpage_footer(database, time.perf_counter() - start_time)
+
+
+if __name__ == "__main__":
+    main()
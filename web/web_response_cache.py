@@ -0,0 +1,123 @@
+"""On-disk cache of report pages for the TagTracker web reports.
+
+A page is stored under a key made from the (normalized) report parameters
+and a stamp of the database file, so any change to the database makes
+the earlier pages unreachable.  Those then age out or are evicted
+(oldest first) once the cache folder is over its size limit.
+
+Copyright (C) 2023-2024 Julias Hocking & Todd Glover
+
+    Notwithstanding the licensing information below, this code may not
+    be used in a commercial (for-profit, non-profit or government) setting
+    without the copyright-holder's written consent.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import hashlib
+import os
+import time
+
+import common.tt_util as ut
+import web.web_base_config as wcfg
+
+CACHE_SUFFIX = ".html"
+
+
+def cache_enabled() -> bool:
+    """Return True if a usable cache folder is configured."""
+    return bool(wcfg.RESPONSE_CACHE_FOLDER) and ut.writable_dir(
+        wcfg.RESPONSE_CACHE_FOLDER
+    )
+
+
+def db_stamp(db_file: str) -> str:
+    """Return a str that changes whenever the database file is written.
+
+    Includes the write-ahead log, since in WAL mode a write can leave
+    the main file untouched until the next checkpoint.
+    """
+    parts = []
+    for filepath in (db_file, f"{db_file}-wal"):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            continue
+        parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+    return "/".join(parts)
+
+
+def page_key(*key_parts: str) -> str:
+    """Return the cache key (a hex digest) for a page described by key_parts."""
+    return hashlib.sha256("\x00".join(key_parts).encode("utf-8")).hexdigest()
+
+
+def _page_path(key: str) -> str:
+    return os.path.join(wcfg.RESPONSE_CACHE_FOLDER, f"{key}{CACHE_SUFFIX}")
+
+
+def fetch_page(key: str, max_age: float) -> str | None:
+    """Return the cached page for key, or None if absent or over max_age seconds old."""
+    filepath = _page_path(key)
+    try:
+        if time.time() - os.path.getmtime(filepath) > max_age:
+            return None
+        with open(filepath, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def store_page(key: str, page: str) -> None:
+    """Save page under key, then evict anything that is stale or over budget."""
+    try:
+        with ut.AtomicFile(_page_path(key)) as f:
+            f.write(page)
+    except OSError:
+        # A cache that can't be written is no worse than no cache.
+        return
+    evict()
+
+
+def evict() -> None:
+    """Remove pages older than the maximum age, then the oldest pages
+    until the cache is under its size limit."""
+    folder = wcfg.RESPONSE_CACHE_FOLDER
+    oldest_allowed = time.time() - wcfg.RESPONSE_CACHE_MAX_AGE
+    max_bytes = wcfg.RESPONSE_CACHE_MAX_MB * 1024 * 1024
+
+    entries = []
+    try:
+        with os.scandir(folder) as scan:
+            for entry in scan:
+                if not entry.name.endswith(CACHE_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for mtime, size, filepath in sorted(entries):
+        if mtime >= oldest_allowed and total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(filepath)
+        except OSError:
+            continue
+        total_bytes -= size
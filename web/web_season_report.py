@@ -33,16 +33,11 @@ import web.datacolors as dc
 from web.web_base_config import HIST_FIXED_Y_AXIS_DURATION
 from web.web_daterange_selector import build_date_dow_filter_widget, DateDowSelection
 from web import web_histogram
-from web.web_histogram_data import ArrivalDepartureMatrix
+from web.web_histogram_data import ArrivalDepartureMatrix, fetch_visit_minutes
 import database.tt_dbutil as db
 from common.tt_time import VTime
 from common.tt_daysummary import DayTotals
 
-try:
-    from common.commuter_hump import CommuterHumpAnalyzer
-except ImportError:  # pragma: no cover - optional dependency
-    CommuterHumpAnalyzer = None
-
 BLOCK_XY_BOTTOM_COLOR = dc.Color((252, 252, 248)).html_color
 BLOCK_X_TOP_COLOR = "red"
 BLOCK_Y_TOP_COLOR = "royalblue"
@@ -153,6 +148,9 @@ def season_frequencies_report(
     if not title_bit and not restrict_to_single_day:
         title_bit = "all days of the week"
 
+    # All the visit histograms below are made from this one fetch
+    visits = fetch_visit_minutes(ttdb, start_date, end_date, dow_parameter)
+
     activity_title = "Activity"
     if title_bit:
         activity_title = f"{activity_title} ({title_bit})"
@@ -169,6 +167,7 @@ def season_frequencies_report(
             subtitle=activity_subtitle,
             start_date=start_date,
             end_date=end_date,
+            visits=visits,
         )
     )
     print("<br><br>")
@@ -207,6 +206,7 @@ def season_frequencies_report(
                 start_date=start_date,
                 end_date=end_date,
                 max_value=fixed_max,
+                visits=visits,
             )
         )
         print("<br><br>")
@@ -229,6 +229,7 @@ def season_frequencies_report(
             normalization_mode=ArrivalDepartureMatrix.NORMALIZATION_BLEND,
             min_arrival_threshold="07:00",
             max_duration_threshold="12:30",
+            visits=visits,
         )
     )
     print("<br><br>")
@@ -303,12 +304,13 @@ def totals_table(conn: sqlite3.Connection):
     def commuter_mean_per_day(start_iso: str, end_iso: str):
         if not conn or not start_iso or not end_iso:
             return None
-        if CommuterHumpAnalyzer is None:
+        hump_analyzer = cc.commuter_hump_analyzer()
+        if hump_analyzer is None:
             return None
         if start_iso > end_iso:
             start_iso, end_iso = end_iso, start_iso
         try:
-            analyzer = CommuterHumpAnalyzer(
+            analyzer = hump_analyzer(
                 db_path=conn,
                 start_date=start_iso,
                 end_date=end_iso,
@@ -826,16 +828,13 @@ def season_detail(
     params.dow = filter_widget.selection.dow_value
     filter_description = filter_widget.description()
 
+    allowed_dows = db.DayFilter.parse_weekdays(params.dow)
     all_days = cc.get_days_data(
-        ttdb=ttdb, min_date=params.start_date, max_date=params.end_date
+        ttdb=ttdb,
+        min_date=params.start_date,
+        max_date=params.end_date,
+        weekdays=allowed_dows,
     )  # FIXME: needs to use orgsite_id
-    if params.dow:
-        allowed_dows = {
-            int(token) for token in params.dow.split(",") if token and token.isdigit()
-        }
-        all_days = [
-            day for day in all_days if getattr(day, "weekday", None) in allowed_dows
-        ]
 
     # Sort the all_days ldataccording to the sort parameter
     if sort_direction == cc.ORDER_FORWARD:
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""WSGI application for the TagTracker web reports.
+
+Serves the same pages as the web_reports.py and web_download_data.py CGI
+scripts, but from a long-running process, so that imports, database
+connections, estimator calibration and trained predictor models are
+loaded once rather than once per request.
+
+Mount the application on the folder that would hold the CGI scripts, so
+that both the reports script and its 'tt_download' sibling reach it;
+download requests are recognized by their 'what' parameter.  E.g.:
+
+    gunicorn --workers 4 --bind 127.0.0.1:8010 web.web_wsgi:application
+
+For a quick local server:
+
+    python -m web.web_wsgi [--port PORT]
+
+The CGI scripts keep working as before for existing installs.
+
+Copyright (C) 2023-2025 Julias Hocking & Todd Glover
+
+    Notwithstanding the licensing information below, this code may not
+    be used in a commercial (for-profit, non-profit or government) setting
+    without the copyright-holder's written consent.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import traceback
+import urllib.parse
+
+import web.web_common as cc
+import web.web_download_data as web_download_data
+import web.web_reports as web_reports
+
+# The pages read their request from os.environ and write their response
+# to stdout, as CGI scripts do.  Both belong to the whole process, so
+# requests are handled one at a time; run several worker processes
+# for concurrency.
+_REQUEST_LOCK = threading.Lock()
+
+# Request variables the pages read from the (CGI) environment
+CGI_VARIABLES = [
+    "QUERY_STRING",
+    "SCRIPT_NAME",
+    "REQUEST_METHOD",
+    "REQUEST_SCHEME",
+    "SERVER_NAME",
+    "SERVER_PORT",
+    "HTTP_HOST",
+    "HTTP_REFERER",
+    "REMOTE_ADDR",
+]
+
+DOWNLOAD_REPORTS = {
+    cc.WHAT_DOWNLOAD_CSV,
+    cc.WHAT_DOWNLOAD_DB,
+    cc.WHAT_DOWNLOAD_PARQUET,
+}
+
+
+def _cgi_environ(environ: dict) -> dict[str, str]:
+    """Return the CGI variables for a WSGI request."""
+    cgi_env = {name: environ.get(name, "") for name in CGI_VARIABLES}
+    # The pages build their links from the path of the script itself
+    cgi_env["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + environ.get(
+        "PATH_INFO", ""
+    )
+    cgi_env["REQUEST_SCHEME"] = environ.get("wsgi.url_scheme", "http")
+    return cgi_env
+
+
+def _page_function(query_string: str):
+    """Return the main() function of the CGI script that serves this query."""
+    what_param = cc.CGIManager.param_name("what_report")
+    what = urllib.parse.parse_qs(query_string).get(what_param, [""])[0]
+    if what in DOWNLOAD_REPORTS:
+        return web_download_data.main
+    return web_reports.main
+
+
+def _call_page(page_function, cgi_env: dict[str, str], binary_stdout) -> None:
+    """Run page_function as a CGI script writing to binary_stdout."""
+    # write_through keeps text and binary (sys.stdout.buffer) writes in order
+    page_stdout = io.TextIOWrapper(binary_stdout, encoding="utf-8", write_through=True)
+    saved_env = {name: os.environ.get(name) for name in cgi_env}
+    with _REQUEST_LOCK:
+        os.environ.update(cgi_env)
+        try:
+            with contextlib.redirect_stdout(page_stdout):
+                try:
+                    page_function()
+                except SystemExit:
+                    # error_out() and friends end the page this way
+                    pass
+        finally:
+            # Leave binary_stdout open for the caller
+            page_stdout.flush()
+            page_stdout.detach()
+            for name, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+
+def run_cgi_page(page_function, cgi_env: dict[str, str]) -> bytes:
+    """Return the raw CGI output (headers and body) of page_function."""
+    output = io.BytesIO()
+    _call_page(page_function, cgi_env, output)
+    return output.getvalue()
+
+
+# Downloads are spooled in memory up to this size, then in a temp file
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def stream_cgi_page(page_function, cgi_env: dict[str, str]):
+    """Yield the raw CGI output of page_function in chunks.
+
+    The page writes its output to a spooled temp file (so a large download
+    isn't all held in memory) with the request lock held.  It is sent on
+    from there after the lock is released, so that a slow client doesn't
+    hold up every other request.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as spool:
+        _call_page(page_function, cgi_env, spool)
+        spool.seek(0)
+        while chunk := spool.read(STREAM_CHUNK_BYTES):
+            yield chunk
+
+
+def split_cgi_output(raw: bytes) -> tuple[str, list[tuple[str, str]], bytes]:
+    """Split CGI output into (status, headers, body)."""
+    ends = [
+        (pos, len(sep))
+        for sep in (b"\r\n\r\n", b"\n\n")
+        if (pos := raw.find(sep)) >= 0
+    ]
+    if not ends:
+        return "200 OK", [("Content-Type", "text/html")], raw
+    header_end, sep_len = min(ends)
+    status = "200 OK"
+    headers = []
+    for line in raw[:header_end].decode("latin-1").splitlines():
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "status":
+            status = value.strip()
+        elif name.strip():
+            headers.append((name.strip(), value.strip()))
+    return status, headers, raw[header_end + sep_len :]
+
+
+def _error_response(environ, start_response) -> list[bytes]:
+    environ["wsgi.errors"].write(traceback.format_exc())
+    start_response("500 Internal Server Error", [("Content-Type", "text/plain")])
+    return [b"TagTracker report error.\n"]
+
+
+def _streamed_response(environ, start_response, output):
+    """Respond with the CGI output chunks from output, as they come."""
+    try:
+        head = b""
+        try:
+            for chunk in output:
+                head += chunk
+                if b"\n\n" in head or b"\r\n\r\n" in head:
+                    break
+        except Exception:  # pylint:disable=broad-exception-caught
+            yield from _error_response(environ, start_response)
+            return
+        status, headers, body = split_cgi_output(head)
+        start_response(status, headers)
+        yield body
+        try:
+            yield from output
+        except Exception:  # pylint:disable=broad-exception-caught
+            # Too late to change the status; log it and end the response
+            environ["wsgi.errors"].write(traceback.format_exc())
+    finally:
+        output.close()
+
+
+def application(environ, start_response):
+    """WSGI entry point."""
+    cgi_env = _cgi_environ(environ)
+    page_function = _page_function(cgi_env["QUERY_STRING"])
+    if page_function is web_download_data.main:
+        output = stream_cgi_page(page_function, cgi_env)
+        return _streamed_response(environ, start_response, output)
+
+    try:
+        raw = run_cgi_page(page_function, cgi_env)
+    except Exception:  # pylint:disable=broad-exception-caught
+        return _error_response(environ, start_response)
+
+    status, headers, body = split_cgi_output(raw)
+    headers.append(("Content-Length", str(len(body))))
+    start_response(status, headers)
+    return [body]
+
+
+def main():
+    """Serve the application with the standard library's simple server."""
+    parser = argparse.ArgumentParser(
+        description="Serve TagTracker web reports from a local WSGI server.",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind.")
+    parser.add_argument("--port", type=int, default=8010, help="Port to listen on.")
+    args = parser.parse_args()
+
+    # pylint:disable-next=import-outside-toplevel
+    from wsgiref.simple_server import make_server
+
+    with make_server(args.host, args.port, application) as server:
+        print(f"Serving TagTracker reports on http://{args.host}:{args.port}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()